@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+""" Scaling of spouse clustering on synthetic trees with long remarriage
+    chains, compared to the previous implementation which rewrote the cluster
+    of every person on each merge.
+
+    Usage: python benchmarks/benchmark_clustering.py [n_people ...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gedcom_plotter
+from gedcom.element.family import FamilyElement
+
+def write_remarriage_chain(filename, n_people):
+    """ Write gedcom file in which every person married the previous and the
+        next person of a chain. Marriages of pairs come first, followed by
+        the remarriages which join the pairs, so every remarriage merges two
+        existing clusters.
+    """
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('0 HEAD\n')
+
+        for i in range(n_people):
+            f.write(f'0 @I{i}@ INDI\n')
+            f.write(f'1 NAME Person{i} /Chain/\n')
+            f.write(f'1 SEX {"M" if i % 2 == 0 else "F"}\n')
+
+        families = [(i, i + 1) for i in range(0, n_people - 1, 2)] + \
+                   [(i, i + 1) for i in range(1, n_people - 1, 2)]
+
+        for n, (husband, wife) in enumerate(families):
+            f.write(f'0 @F{n}@ FAM\n')
+            f.write(f'1 HUSB @I{husband}@\n')
+            f.write(f'1 WIFE @I{wife}@\n')
+
+        f.write('0 TRLR\n')
+
+def cluster_spouses_reference(g2g):
+    """ previous implementation of the spouse clustering in create_graph
+    """
+
+    sub_graphs = {}
+    counter = 1
+    for family in g2g.root_child_elements:
+
+        if isinstance(family, FamilyElement):
+
+            parents = g2g.element_index.get_family_members(family,
+                                                           members_type='PARENTS')
+
+            if len(parents) < 2:
+                continue
+
+            person_id = parents[0].get_pointer()
+            spouse_id = parents[1].get_pointer()
+
+            sg_name = None
+            if person_id in sub_graphs:
+                sg_name = sub_graphs[person_id]
+
+                if spouse_id in sub_graphs:
+                    spouse_sg_name = sub_graphs[spouse_id]
+                    for key, value in sub_graphs.items():
+                        if value == spouse_sg_name:
+                            sub_graphs[key] = sg_name
+
+            if spouse_id in sub_graphs:
+                sg_name = sub_graphs[spouse_id]
+
+            if sg_name is None:
+                sg_name = f'cluster_{counter}'
+                counter += 1
+            sub_graphs[spouse_id] = sg_name
+            sub_graphs[person_id] = sg_name
+
+    return sub_graphs
+
+def partition(sub_graphs):
+    """ clusters as set of frozensets, independent of cluster names
+    """
+
+    clusters = {}
+    for person_id, name in sub_graphs.items():
+        clusters.setdefault(name, set()).add(person_id)
+
+    return {frozenset(c) for c in clusters.values()}
+
+def main():
+
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 2000, 4000, 8000]
+
+    print(f'{"people":>8s} {"reference [s]":>14s} {"union-find [s]":>15s} identical')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_people in sizes:
+            gedcom_filename = os.path.join(tmpdir, f'chain_{n_people}.ged')
+            write_remarriage_chain(gedcom_filename, n_people)
+            g2g = gedcom_plotter.GedcomPlotter(gedcom_filename)
+
+            start = time.perf_counter()
+            reference = cluster_spouses_reference(g2g)
+            t_reference = time.perf_counter() - start
+
+            start = time.perf_counter()
+            sub_graphs = g2g.cluster_spouses()
+            t_union_find = time.perf_counter() - start
+
+            identical = partition(reference) == partition(sub_graphs)
+
+            print(f'{n_people:8d} {t_reference:14.3f} {t_union_find:15.3f} {identical}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+""" Report the error of glyph metrics read from font files against the
+    metrics measured with dot probes, and the start-up time of both.
+
+    Usage: python benchmarks/benchmark_font_metrics.py [gedcom files]
+           [-n key=value ...]
+
+    Without gedcom files, the inputs of benchmark_node_size.py are used.
+    Node attributes given with -n are checked in addition to the defaults.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gedcom_plotter
+from benchmark_node_size import get_inputs
+
+NODE_ATTRIBUTES = ({},
+                   {'fontsize': 20},
+                   {'shape': 'oval'},
+                   {'fontname': 'Helvetica'},
+                   {'fontname': 'Times-Bold'})
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('gedcom_filenames', nargs='*')
+    parser.add_argument('-n', '--node_attributes', nargs='*', default=[])
+    args = parser.parse_args()
+
+    node_attributes_list = list(NODE_ATTRIBUTES)
+    if len(args.node_attributes) > 0:
+        node_attributes_list.append(dict(arg.rsplit('=', 1)
+                                         for arg in args.node_attributes))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, gedcom_filename in get_inputs(args.gedcom_filenames, tmpdir):
+
+            g2g = gedcom_plotter.GedcomPlotter(gedcom_filename)
+
+            for node_attributes in node_attributes_list:
+                attributes = dict(g2g.default_node_attributes)
+                attributes.update(node_attributes)
+
+                start = time.perf_counter()
+                ns_dot = gedcom_plotter.NodeSize(g2g.family_tree, attributes,
+                                                 g2g.time_format)
+                t_dot = time.perf_counter() - start
+
+                start = time.perf_counter()
+                ns_font = gedcom_plotter.NodeSize(g2g.family_tree, attributes,
+                                                  g2g.time_format,
+                                                  backend='font')
+                t_font = time.perf_counter() - start
+
+                if ns_font.backend == 'dot':
+                    errors = None
+                else:
+                    errors = gedcom_plotter.compare_metrics(ns_dot, ns_font)
+
+                results.append((name, node_attributes, t_dot, t_font, errors))
+
+    print()
+    for name, node_attributes, t_dot, t_font, errors in results:
+        print(f'{name}, {node_attributes}:')
+        if errors is None:
+            print('    font metrics not available, fell back to dot')
+            continue
+
+        print(f'    dot: {t_dot * 1000:.1f} ms, font: {t_font * 1000:.1f} ms, '
+              f'{errors["n_chars"]} characters')
+        print(f'    width error [in]: max {errors["max_width_error"]:.4f}, '
+              f'mean {errors["mean_width_error"]:.4f}')
+        print(f'    height error [in]: max {errors["max_height_error"]:.4f}, '
+              f'time {errors["time_height_error"]:.4f}')
+        print('    worst characters: ' +
+              ', '.join(f'{char!r} {error:+.4f}'
+                        for char, error in errors['worst_chars'][:5]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+""" Compare start-up time of NodeSize when measuring every character with
+    separate layouts and when measuring all characters in batched layouts.
+
+    Usage: python benchmarks/benchmark_node_size.py [gedcom files]
+
+    Without arguments, the bundled examples are used. If the gedcom source of
+    an example is not available next to its svg, a gedcom file is generated
+    whose names contain as many distinct characters as the example plot.
+"""
+
+import os
+import re
+import sys
+import time
+import tempfile
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gedcom_plotter
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+EXAMPLES = ('Bible+Family+Tree', 'George+Washington+Family+Big')
+
+def count_name_glyphs(svg_filename):
+    """ Number of distinct glyphs of the most used font in a plot created
+        with svg:cairo (the font of the names)
+    """
+
+    with open(svg_filename, 'r', encoding='utf-8') as f:
+        glyph_ids = re.findall(r'id="glyph(\d+)-\d+"', f.read())
+
+    if len(glyph_ids) < 1:
+        return 0
+
+    return max(collections.Counter(glyph_ids).values())
+
+def write_gedcom_with_chars(filename, n_chars):
+    """ Write gedcom file with names containing n_chars distinct characters
+    """
+
+    chars = [chr(c) for c in range(ord('A'), ord('z') + 1) if chr(c).isalpha()]
+    chars += [chr(c) for c in range(0xc0, 0x250) if chr(c).isalpha()]
+    chars = chars[:n_chars]
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('0 HEAD\n')
+        for i in range(0, len(chars), 8):
+            f.write(f'0 @I{i}@ INDI\n')
+            f.write(f"1 NAME {''.join(chars[i:i + 4])} /{''.join(chars[i + 4:i + 8])}/\n")
+        f.write('0 TRLR\n')
+
+def get_inputs(filenames, tmpdir):
+    """ list of (name, gedcom filename) to benchmark
+    """
+
+    if len(filenames) > 0:
+        return [(os.path.basename(f), f) for f in filenames]
+
+    inputs = []
+    for example in EXAMPLES:
+        gedcom_filename = os.path.join(EXAMPLES_DIR, example + '.ged')
+
+        if not os.path.exists(gedcom_filename):
+            n_chars = count_name_glyphs(os.path.join(EXAMPLES_DIR, example + '.svg'))
+            gedcom_filename = os.path.join(tmpdir, example + '.ged')
+            write_gedcom_with_chars(gedcom_filename, n_chars)
+            example = f'{example} ({n_chars} characters, generated)'
+
+        inputs.append((example, gedcom_filename))
+
+    return inputs
+
+def benchmark(gedcom_filename, batch_size, repeat=3):
+    """ best wall time of NodeSize initialization
+    """
+
+    g2g = gedcom_plotter.GedcomPlotter(gedcom_filename)
+
+    best = None
+    ns = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ns = gedcom_plotter.NodeSize(g2g.family_tree,
+                                     g2g.default_node_attributes,
+                                     g2g.time_format,
+                                     batch_size=batch_size)
+        duration = time.perf_counter() - start
+
+        if best is None or duration < best:
+            best = duration
+
+    return best, ns
+
+def main():
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        results = []
+        for name, gedcom_filename in get_inputs(sys.argv[1:], tmpdir):
+
+            t_single, ns_single = benchmark(gedcom_filename, None)
+            t_batched, ns_batched = benchmark(gedcom_filename, 1000)
+
+            identical = ns_single.widths == ns_batched.widths and \
+                        ns_single.heights == ns_batched.heights
+
+            results.append((name, len(ns_single.widths), t_single, t_batched,
+                            identical))
+
+    print()
+    print(f'{"input":60s} {"chars":>6s} {"single [s]":>11s} {"batched [s]":>12s} {"speedup":>8s} identical')
+    for name, n_chars, t_single, t_batched, identical in results:
+        print(f'{name:60s} {n_chars:6d} {t_single:11.3f} {t_batched:12.3f} '
+              f'{t_single / t_batched:8.1f} {identical}')
+
+if __name__ == '__main__':
+    main()
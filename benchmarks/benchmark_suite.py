@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+""" Time the stages of a plot on synthetic trees of increasing size, and keep
+    a history of the results to compare them between commits.
+
+    Usage: python benchmarks/benchmark_suite.py [-p n_people ...] [--repeat n]
+           [--max_layout_people n] [--history filename] [--compare commit]
+           [--no_history] [--graph_backend backend] [generator arguments]
+
+    Stages: parse, node_size, format_name, clustering, build_graph, layout
+    and draw. Trees are created with generate_gedcom.py, which also takes the
+    generator arguments (see --help). Layout and draw are skipped for trees
+    larger than --max_layout_people, since dot takes hours for 100k people.
+    The graph is built with the given graph backend of gedcom_plotter.
+
+    Results are appended to benchmarks/history.jsonl together with the
+    commit, and compared to the latest earlier result measured with the same
+    generator arguments and graph backend on the same machine, or to the
+    result of the commit given with --compare.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gedcom_plotter
+from generate_gedcom import generate_gedcom
+
+HISTORY_FILENAME = os.path.join(os.path.dirname(__file__), 'history.jsonl')
+STAGES = ('parse', 'node_size', 'format_name', 'clustering', 'build_graph',
+          'layout', 'draw')
+FILLCOLOR = {'M': '#bce0f0', 'F': '#f8e3eb', 'O': '#fbfbcc'}
+
+def get_commit():
+    """ current commit of the repository, with suffix '-dirty' if tracked
+        files were modified, or None if not available
+    """
+
+    repository = os.path.join(os.path.dirname(__file__), '..')
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repository,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=repository, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return commit + ('-dirty' if status else '')
+
+def timed(function, repeat=1):
+    """ best wall time of function and its last result. Progress messages
+        of gedcom_plotter are suppressed.
+    """
+
+    best = None
+    result = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            duration = time.perf_counter() - start
+
+            if best is None or duration < best:
+                best = duration
+
+    return best, result
+
+def benchmark_tree(gedcom_filename, tmpdir, repeat, with_layout,
+                   graph_backend='pygraphviz'):
+    """ times of the stages of plotting a tree
+    :return: dictionary {stage: seconds}
+    """
+
+    times = {}
+
+    times['parse'], g2g = timed(lambda: gedcom_plotter.GedcomPlotter(
+        gedcom_filename, graph_backend=graph_backend), repeat)
+
+    times['node_size'], g2g.ns = timed(lambda: gedcom_plotter.NodeSize(
+        g2g.family_tree, g2g.default_node_attributes, g2g.time_format), repeat)
+
+    def format_names():
+        gedcom_plotter.fit_cache.clear()
+        g2g.labels = {}
+        for person in g2g.family_tree.persons.values():
+            g2g.get_label(person)
+
+    times['format_name'], _ = timed(format_names, repeat)
+
+    times['clustering'], _ = timed(g2g.cluster_spouses, repeat)
+
+    # labels are memoized by format_names, so only nodes and edges are created
+    times['build_graph'], graph = timed(lambda: g2g.build_graph(
+        g2g.family_tree, FILLCOLOR, {'bgcolor': '#ffffffff'}, verbose=False), repeat)
+
+    if with_layout:
+        times['layout'], _ = timed(lambda: gedcom_plotter.run_layout(graph), repeat)
+
+        output_filename = os.path.join(tmpdir, 'plot.svg')
+        times['draw'], _ = timed(lambda: gedcom_plotter.draw_output(graph, output_filename),
+                                 repeat)
+
+    return times
+
+def load_history(filename):
+    """ list of earlier results, oldest first
+    """
+
+    if not os.path.exists(filename):
+        return []
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def find_reference(history, entry, commit=None):
+    """ latest earlier result to compare with: of the given commit, or
+        measured on the same machine with the same generator arguments
+    """
+
+    for previous in reversed(history):
+        if commit is not None:
+            if (previous['commit'] or '').startswith(commit):
+                return previous
+        elif previous['machine'] == entry['machine'] and \
+             previous['generator'] == entry['generator'] and \
+             previous.get('graph_backend', 'pygraphviz') == entry['graph_backend']:
+            return previous
+
+    return None
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--people', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--max_layout_people', type=int, default=10000)
+    parser.add_argument('--history', default=HISTORY_FILENAME)
+    parser.add_argument('--compare', default=None, metavar='COMMIT')
+    parser.add_argument('--no_history', action='store_true')
+    parser.add_argument('--graph_backend', choices=gedcom_plotter.GRAPH_BACKENDS,
+                        default='pygraphviz')
+    parser.add_argument('--generations', type=int, default=None)
+    parser.add_argument('--remarriage_rate', type=float, default=0.1)
+    parser.add_argument('--name_length', type=int, nargs=2, default=[3, 10])
+    parser.add_argument('--max_given_names', type=int, default=2)
+    parser.add_argument('--alphabet_size', type=int, default=52)
+    parser.add_argument('--components', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = {'generations': args.generations,
+                 'remarriage_rate': args.remarriage_rate,
+                 'name_length': args.name_length,
+                 'max_given_names': args.max_given_names,
+                 'alphabet_size': args.alphabet_size,
+                 'components': args.components,
+                 'seed': args.seed}
+
+    entry = {'commit': get_commit(),
+             'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+             'machine': f'{platform.node()} {platform.machine()} {os.cpu_count()} CPUs',
+             'python': platform.python_version(),
+             'graphviz': gedcom_plotter.get_graphviz_version(),
+             'generator': generator,
+             'graph_backend': args.graph_backend,
+             'repeat': args.repeat,
+             'results': {}}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_people in args.people:
+            gedcom_filename = os.path.join(tmpdir, f'synthetic_{n_people}.ged')
+            generate_gedcom(gedcom_filename, n_people,
+                            **dict(generator, name_length=tuple(args.name_length)))
+
+            print(f'Benchmarking {n_people} people...', flush=True)
+            entry['results'][str(n_people)] = benchmark_tree(
+                gedcom_filename, tmpdir, args.repeat, n_people <= args.max_layout_people,
+                args.graph_backend)
+
+    history = load_history(args.history)
+    reference = find_reference(history, entry, args.compare)
+
+    print()
+    if reference is not None:
+        print(f"Compared to {(reference['commit'] or 'unknown commit')[:12]} "
+              f"of {reference['date']}")
+    print(f'{"people":>8s} {"stage":12s} {"time [s]":>10s} {"previous [s]":>13s} {"change":>8s}')
+    for n_people, times in entry['results'].items():
+        previous_times = {} if reference is None else reference['results'].get(n_people, {})
+        for stage in STAGES:
+            if stage not in times:
+                continue
+
+            line = f'{n_people:>8s} {stage:12s} {times[stage]:10.3f}'
+            if stage in previous_times:
+                previous = previous_times[stage]
+                line += f' {previous:13.3f} {(times[stage] / previous - 1) * 100:+7.1f}%'
+            print(line)
+
+    if not args.no_history:
+        with open(args.history, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        print(f'Results added to {args.history}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+""" Generate synthetic gedcom files for benchmarks.
+
+    Usage: python benchmarks/generate_gedcom.py output.ged [-p n_people]
+           [--generations n] [--remarriage_rate r] [--name_length min max]
+           [--max_given_names n] [--alphabet_size n] [--components n]
+           [--seed n]
+
+    Each component descends from a couple. The persons of a generation are
+    children of random families of the previous generation or marry into
+    the tree. Children inherit the surname of their father. Names are random
+    strings from an alphabet of the given number of distinct letters: latin
+    letters first, followed by other latin, greek and cyrillic letters.
+"""
+
+import os
+import sys
+import math
+import random
+import argparse
+
+# distinct letters of the generated names, in order of use
+LETTER_RANGES = ((ord('A'), ord('z')), (0xc0, 0x24f), (0x391, 0x3c9),
+                 (0x410, 0x44f))
+
+# fraction of persons who marry, and of persons with known death year
+MARRIAGE_RATE = 0.8
+DEATH_RATE = 0.7
+
+def get_alphabet(alphabet_size):
+    """ first alphabet_size letters of LETTER_RANGES
+    """
+
+    letters = [chr(c) for first, last in LETTER_RANGES
+               for c in range(first, last + 1) if chr(c).isalpha()]
+
+    if alphabet_size > len(letters):
+        raise ValueError(f'Alphabet size is limited to {len(letters)} letters.')
+
+    return letters[:alphabet_size]
+
+class TreeGenerator():
+    """ random family tree with given properties, written as gedcom file
+    """
+
+    def __init__(self, n_people, generations=None, remarriage_rate=0.1,
+                 name_length=(3, 10), max_given_names=2, alphabet_size=52,
+                 components=1, seed=0):
+        """
+        :param n_people: number of persons
+        :param generations: number of generations of each component, default
+                            grows logarithmically with the component size
+        :param remarriage_rate: probability that a married person marries
+                                again
+        :param name_length: minimum and maximum length of each name part
+        :param max_given_names: maximum number of given names of a person
+        :param alphabet_size: number of distinct letters in the names
+        :param components: number of disconnected components
+        :param seed: seed of the random generator
+        :raise ValueError: if there are less than two persons per component
+        """
+
+        # each component descends from a couple
+        if components < 1 or components * 2 > n_people:
+            raise ValueError(f'{n_people} people are not enough for {components} '
+                             'components, each component needs at least 2.')
+
+        self.n_people = n_people
+        self.generations = generations
+        self.remarriage_rate = remarriage_rate
+        self.name_length = name_length
+        self.max_given_names = max_given_names
+        self.alphabet = get_alphabet(alphabet_size)
+        self.components = components
+        self.random = random.Random(seed)
+
+        # dictionaries with name, sex, years and families, by pointer number
+        self.persons = []
+        # list of (husband, wife, children, year)
+        self.families = []
+
+    def random_name(self):
+        """ random name part, starting with an upper case letter if possible
+        """
+
+        length = self.random.randint(*self.name_length)
+        name = ''.join(self.random.choice(self.alphabet) for _ in range(length))
+
+        return name[:1].upper() + name[1:]
+
+    def add_person(self, sex, surname, birth_year):
+        """ add person with random given names
+        :return: number of person
+        """
+
+        n_given_names = self.random.randint(1, self.max_given_names)
+        self.persons.append({'given_name': ' '.join(self.random_name()
+                                                    for _ in range(n_given_names)),
+                             'surname': surname,
+                             'sex': sex,
+                             'birth_year': birth_year,
+                             'death_year': birth_year + self.random.randint(20, 90)
+                                           if self.random.random() < DEATH_RATE else None,
+                             'parent_family': None,
+                             'families': []})
+
+        return len(self.persons) - 1
+
+    def add_family(self, husband, wife, year):
+        """ add family of two persons
+        :return: number of family
+        """
+
+        self.families.append((husband, wife, [], year))
+        self.persons[husband]['families'].append(len(self.families) - 1)
+        self.persons[wife]['families'].append(len(self.families) - 1)
+
+        return len(self.families) - 1
+
+    def marry(self, person, year):
+        """ add family of person and a spouse of the opposite sex marrying
+            into the tree
+        :return: number of family
+        """
+
+        sex = 'F' if self.persons[person]['sex'] == 'M' else 'M'
+        spouse = self.add_person(sex, self.random_name(),
+                                 year - self.random.randint(18, 35))
+
+        if sex == 'F':
+            return self.add_family(person, spouse, year)
+
+        return self.add_family(spouse, person, year)
+
+    def generate_component(self, n_people):
+        """ add persons of one component: descendants of a couple, generation
+            by generation
+        """
+
+        first = len(self.persons)
+
+        def n_added():
+            return len(self.persons) - first
+
+        generations = self.generations
+        if generations is None:
+            generations = max(2, round(math.log2(n_people)))
+
+        per_generation = max(1, math.ceil((n_people - 2) / max(generations - 1, 1)))
+
+        husband = self.add_person('M', self.random_name(), 1500)
+        families = [self.marry(husband, 1520)]
+
+        generation = 1
+        while n_added() < n_people:
+            year = 1500 + 25 * generation
+            end = min(n_people, n_added() + per_generation)
+            new_families = []
+
+            while n_added() < end:
+                family = self.random.choice(families)
+                father = self.families[family][0]
+                person = self.add_person(self.random.choice('MF'),
+                                         self.persons[father]['surname'],
+                                         year + self.random.randint(-5, 5))
+                self.persons[person]['parent_family'] = family
+                self.families[family][2].append(person)
+
+                if n_added() < end and self.random.random() < MARRIAGE_RATE:
+                    new_families.append(self.marry(person, year + 20))
+
+                    while n_added() < end and self.random.random() < self.remarriage_rate:
+                        new_families.append(self.marry(person, year + 30))
+
+            # without marriages, the next generation descends from the same families
+            if len(new_families) > 0:
+                families = new_families
+
+            generation += 1
+
+    def generate(self):
+        """ add persons of all components
+        """
+
+        for i in range(self.components):
+            n_people = self.n_people // self.components
+            if i < self.n_people % self.components:
+                n_people += 1
+
+            self.generate_component(n_people)
+
+    def write(self, filename):
+        """ write tree as gedcom file
+        """
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('0 HEAD\n1 CHAR UTF-8\n')
+
+            for i, person in enumerate(self.persons):
+                f.write(f'0 @I{i}@ INDI\n')
+                f.write(f"1 NAME {person['given_name']} /{person['surname']}/\n")
+                f.write(f"1 SEX {person['sex']}\n")
+                f.write(f"1 BIRT\n2 DATE {person['birth_year']}\n")
+                if person['death_year'] is not None:
+                    f.write(f"1 DEAT\n2 DATE {person['death_year']}\n")
+                if person['parent_family'] is not None:
+                    f.write(f"1 FAMC @F{person['parent_family']}@\n")
+                for family in person['families']:
+                    f.write(f'1 FAMS @F{family}@\n')
+
+            for i, (husband, wife, children, year) in enumerate(self.families):
+                f.write(f'0 @F{i}@ FAM\n')
+                f.write(f'1 HUSB @I{husband}@\n')
+                f.write(f'1 WIFE @I{wife}@\n')
+                for child in children:
+                    f.write(f'1 CHIL @I{child}@\n')
+                f.write(f'1 MARR\n2 DATE {year}\n')
+
+            f.write('0 TRLR\n')
+
+def generate_gedcom(filename, n_people, **kwargs):
+    """ Write synthetic gedcom file, see TreeGenerator for the arguments
+    :return: TreeGenerator
+    """
+
+    generator = TreeGenerator(n_people, **kwargs)
+    generator.generate()
+    generator.write(filename)
+
+    return generator
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_filename')
+    parser.add_argument('-p', '--people', type=int, default=1000)
+    parser.add_argument('--generations', type=int, default=None)
+    parser.add_argument('--remarriage_rate', type=float, default=0.1)
+    parser.add_argument('--name_length', type=int, nargs=2, default=(3, 10))
+    parser.add_argument('--max_given_names', type=int, default=2)
+    parser.add_argument('--alphabet_size', type=int, default=52)
+    parser.add_argument('--components', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        generator = generate_gedcom(args.output_filename, args.people,
+                                    generations=args.generations,
+                                    remarriage_rate=args.remarriage_rate,
+                                    name_length=tuple(args.name_length),
+                                    max_given_names=args.max_given_names,
+                                    alphabet_size=args.alphabet_size,
+                                    components=args.components,
+                                    seed=args.seed)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    print(f'Created {args.output_filename} with {len(generator.persons)} people '
+          f'and {len(generator.families)} families '
+          f'({os.path.getsize(args.output_filename)} bytes).')
+
+if __name__ == '__main__':
+    main()
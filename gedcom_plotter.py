@@ -6,16 +6,719 @@
 import sys
 import math
 import os.path
+import mmap
+import json
+import re
+import hashlib
+import struct
+import bisect
+import itertools
+import collections
+import copy
+import time
+import contextlib
+import tempfile
 import pygraphviz as pgv
 from gedcom.element.individual import IndividualElement
 from gedcom.element.family import FamilyElement
 from gedcom.parser import Parser
+from gedcom.parser import FAMILY_MEMBERS_TYPE_ALL, FAMILY_MEMBERS_TYPE_PARENTS
+from gedcom.tags import GEDCOM_TAG_INDIVIDUAL, GEDCOM_TAG_FAMILY, \
+                        GEDCOM_TAG_NAME, \
+                        GEDCOM_TAG_GIVEN_NAME, GEDCOM_TAG_SURNAME, \
+                        GEDCOM_TAG_SEX, GEDCOM_TAG_BIRTH, GEDCOM_TAG_DEATH, \
+                        GEDCOM_TAG_DATE, GEDCOM_TAG_MARRIAGE, \
+                        GEDCOM_TAG_FAMILY_SPOUSE, \
+                        GEDCOM_TAG_FAMILY_CHILD, GEDCOM_TAG_HUSBAND, \
+                        GEDCOM_TAG_WIFE, GEDCOM_TAG_CHILD
+
+# version of the on-disk format of MetricsCache entries. Increase whenever
+# the way glyph metrics are measured changes, to invalidate old entries.
+METRICS_CACHE_VERSION = 1
+
+# node attributes which do not influence the size of a node. They are ignored
+# when checking if cached glyph metrics can be reused.
+NON_GEOMETRIC_NODE_ATTRIBUTES = ('fillcolor', 'color', 'fontcolor', 'bgcolor',
+                                 'colorscheme', 'gradientangle', 'tooltip',
+                                 'URL', 'href', 'target', 'id', 'class',
+                                 'comment')
+
+_graphviz_version = None
+
+def get_graphviz_version():
+    """ Determine version of the graphviz library used by pygraphviz
+    :return: version string, e.g. '2.43.0 (0)'
+    """
+
+    global _graphviz_version
+
+    if _graphviz_version is None:
+        # the svg renderer writes the graphviz version into a comment
+        svg = pgv.AGraph().draw(format='svg', prog='dot').decode('utf-8')
+        _graphviz_version = 'unknown'
+        for line in svg.splitlines():
+            if 'Generated by graphviz version' in line:
+                _graphviz_version = line.split('version', 1)[1].strip()
+                break
+
+    return _graphviz_version
+
+def get_default_cache_dir():
+    """ Directory in which persistent caches are stored by default
+    :return: path of cache directory
+    """
+
+    cache_home = os.environ.get('XDG_CACHE_HOME',
+                                os.path.join(os.path.expanduser('~'), '.cache'))
+
+    return os.path.join(cache_home, 'gedcom_plotter')
+
+class FileCache():
+    """ persistent on-disk cache of json entries. Base class of the caches
+        like MetricsCache and LayoutCache, which define name, version and the
+        cache keys.
+    """
+
+    # name of the cache, used as prefix of the cache files
+    name = None
+
+    # version of the on-disk format of entries
+    version = None
+
+    # maximum number of entries. When more entries are saved, the least
+    # recently used ones are removed (see prune). None for no limit.
+    max_entries = None
+
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: directory of cache files, default is
+                          get_default_cache_dir()
+        """
+
+        if cache_dir is None:
+            cache_dir = get_default_cache_dir()
+
+        self.cache_dir = cache_dir
+
+    def get_filename(self, key):
+        """ path of cache file for given key
+        """
+        return os.path.join(self.cache_dir, f'{self.name}_{key}.json')
+
+    def is_valid(self, entry):
+        """ Check if entry was written by the current version
+        :param entry: dictionary loaded from cache file
+        :return: True if entry can be used
+        """
+
+        return entry.get('version') == self.version and \
+               entry.get('graphviz_version') == get_graphviz_version()
+
+    def load(self, key):
+        """ Load cache entry
+        :param key: cache key, see get_key
+        :return: dictionary with cached data or None if there is no valid
+                 cache entry
+        """
+
+        filename = self.get_filename(key)
+
+        if not os.path.exists(filename):
+            return None
+
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            print(f'WARNING: Ignoring unreadable {self.name} cache file {filename}.')
+            return None
+
+        # entries of other versions are invalid, they are overwritten on save
+        if not self.is_valid(entry):
+            return None
+
+        # the modification time marks the last use, see prune
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+
+        return entry
+
+    def save(self, key, entry):
+        """ Store entry in cache
+        :param key: cache key, see get_key
+        :param entry: dictionary with data to store
+        """
+
+        entry = dict(entry)
+        entry['version'] = self.version
+        entry['graphviz_version'] = get_graphviz_version()
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # write to temporary file first, so concurrent runs never read
+            # partially written files
+            fd, tmp_filename = tempfile.mkstemp(dir=self.cache_dir,
+                                                suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_filename, self.get_filename(key))
+        except OSError as e:
+            print(f'WARNING: Could not write {self.name} cache: {e}')
+            return
+
+        self.prune(keep=key)
+
+    def prune(self, keep=None):
+        """ Remove the least recently used entries, so at most max_entries
+            remain. Entries are used when they are saved or loaded.
+        :param keep: key of an entry which is never removed, e.g. the entry
+                     which was just saved
+        :return: number of removed entries
+        """
+
+        if self.max_entries is None or not os.path.isdir(self.cache_dir):
+            return 0
+
+        prefix = f'{self.name}_'
+        kept = self.get_filename(keep) if keep is not None else None
+
+        last_use = {}
+        for filename in os.listdir(self.cache_dir):
+            if filename.startswith(prefix) and filename.endswith('.json'):
+                path = os.path.join(self.cache_dir, filename)
+                try:
+                    last_use[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    # removed by a concurrent run
+                    continue
+
+        paths = sorted(last_use, key=lambda path: (path == kept, last_use[path]),
+                       reverse=True)
+
+        n_removed = 0
+        for path in paths[self.max_entries:]:
+            try:
+                os.unlink(path)
+                n_removed += 1
+            except OSError:
+                pass
+
+        return n_removed
+
+    def invalidate(self, key):
+        """ Remove cache entry for given key
+        :param key: cache key, see get_key
+        """
+
+        filename = self.get_filename(key)
+
+        if os.path.exists(filename):
+            os.unlink(filename)
+
+    def describe(self, entry):
+        """ Summary of the cached data of an entry, see entries
+        :param entry: dictionary loaded from cache file
+        :return: dictionary
+        """
+        return {}
+
+    def entries(self):
+        """ List all entries in cache
+        :return: list of dictionaries describing the cache entries
+        """
+
+        ret = []
+
+        if not os.path.isdir(self.cache_dir):
+            return ret
+
+        prefix = f'{self.name}_'
+
+        for filename in sorted(os.listdir(self.cache_dir)):
+            if not (filename.startswith(prefix) and filename.endswith('.json')):
+                continue
+
+            path = os.path.join(self.cache_dir, filename)
+            key = filename[len(prefix):-len('.json')]
+
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = {}
+
+            description = {'key': key,
+                           'filename': path,
+                           'size': os.path.getsize(path),
+                           'valid': self.is_valid(entry),
+                           'graphviz_version': entry.get('graphviz_version')}
+            description.update(self.describe(entry))
+            ret.append(description)
+
+        return ret
+
+    def clear(self):
+        """ Remove all entries from cache
+        :return: number of removed entries
+        """
+
+        n_removed = 0
+        for entry in self.entries():
+            os.unlink(entry['filename'])
+            n_removed += 1
+
+        return n_removed
+
+class MemoryCache():
+    """ Keeps the entries of a FileCache in memory, so long running processes
+        like the watch mode do not re-read them from disk for every plot.
+        All other attributes are those of the wrapped cache.
+    """
+
+    def __init__(self, file_cache, persistent=True):
+        """
+        :param file_cache: wrapped FileCache
+        :param persistent: load missing entries from disk and store saved
+                           entries on disk. If False, entries are only kept
+                           in memory.
+        """
+
+        self.file_cache = file_cache
+        self.persistent = persistent
+        self.memory = {}
+
+    def __getattr__(self, name):
+        return getattr(self.file_cache, name)
+
+    def load(self, key):
+        """ Load entry from memory, or from disk on first access
+        :param key: cache key, see get_key
+        :return: dictionary with cached data or None
+        """
+
+        if key not in self.memory:
+            if not self.persistent:
+                return None
+
+            entry = self.file_cache.load(key)
+            if entry is None:
+                return None
+            self.save_in_memory(key, entry)
+
+        # most recently used entries are last, see save_in_memory
+        self.memory[key] = self.memory.pop(key)
+
+        return self.memory[key]
+
+    def save(self, key, entry):
+        """ Store entry in memory, and on disk if persistent is set
+        :param key: cache key, see get_key
+        :param entry: dictionary with data to store
+        """
+
+        self.save_in_memory(key, entry)
+
+        if self.persistent:
+            self.file_cache.save(key, entry)
+
+    def save_in_memory(self, key, entry):
+        """ Store entry in memory, removing the least recently used entries
+            beyond max_entries of the wrapped cache
+        :param key: cache key, see get_key
+        :param entry: dictionary with data to store
+        """
+
+        self.memory.pop(key, None)
+        self.memory[key] = entry
+
+        if self.file_cache.max_entries is not None:
+            while len(self.memory) > self.file_cache.max_entries:
+                del self.memory[next(iter(self.memory))]
+
+class MetricsCache(FileCache):
+    """ persistent on-disk cache of the glyph metrics measured by NodeSize
+    """
+
+    name = 'metrics'
+    version = METRICS_CACHE_VERSION
+
+    @staticmethod
+    def get_key(node_attributes, time_format, margin=None):
+        """ Determine cache key of glyph metrics for given node attributes
+        :param node_attributes: node attributes used for measuring
+        :param time_format: font format of the time string
+        :param margin: margin passed to NodeSize
+        :return: cache key as hex string
+        """
+
+        attributes = {key: str(value) for key, value in node_attributes.items()
+                      if key not in NON_GEOMETRIC_NODE_ATTRIBUTES}
+
+        key_data = json.dumps({'version': METRICS_CACHE_VERSION,
+                               'graphviz_version': get_graphviz_version(),
+                               'node_attributes': attributes,
+                               'time_format': time_format,
+                               'margin': margin}, sort_keys=True)
+
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def describe(self, entry):
+        """ Summary of cached glyph metrics, see FileCache.entries
+        """
+
+        return {'node_attributes': entry.get('node_attributes', {}),
+                'time_format': entry.get('time_format'),
+                'n_chars': len(entry.get('widths', {}))}
+
+def find_font_file(fontname):
+    """ Find the font file fontconfig selects for a graphviz font name, i.e.
+        the file graphviz would use when rendering with pango/cairo.
+    :param fontname: graphviz font name, e.g. 'Times-Roman' or 'Comic Sans MS'
+    :return: path of font file or None if it can not be determined
+    """
+
+    # graphviz translates PostScript font names like Times-BoldItalic to a
+    # family name and style
+    pattern = fontname
+    if '-' in fontname:
+        family, style = fontname.rsplit('-', 1)
+        if style in ('Roman', 'Regular', 'Bold', 'Italic', 'Oblique',
+                     'BoldItalic', 'BoldOblique'):
+            pattern = family
+            if 'Bold' in style:
+                pattern += ':bold'
+            if 'Italic' in style or 'Oblique' in style:
+                pattern += ':italic'
+
+    import ctypes
+    import ctypes.util
+
+    library = ctypes.util.find_library('fontconfig')
+
+    if library is None:
+        import shutil
+        import subprocess
+
+        if shutil.which('fc-match') is None:
+            return None
+
+        ret = subprocess.run(['fc-match', '-f', '%{file}', pattern],
+                             capture_output=True)
+        if ret.returncode != 0 or len(ret.stdout) < 1:
+            return None
+
+        return ret.stdout.decode('utf-8')
+
+    fc = ctypes.CDLL(library)
+    fc.FcNameParse.restype = ctypes.c_void_p
+    fc.FcNameParse.argtypes = [ctypes.c_char_p]
+    fc.FcConfigSubstitute.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]
+    fc.FcDefaultSubstitute.argtypes = [ctypes.c_void_p]
+    fc.FcFontMatch.restype = ctypes.c_void_p
+    fc.FcFontMatch.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                               ctypes.POINTER(ctypes.c_int)]
+    fc.FcPatternGetString.argtypes = [ctypes.c_void_p, ctypes.c_char_p,
+                                      ctypes.c_int, ctypes.POINTER(ctypes.c_char_p)]
+    fc.FcPatternDestroy.argtypes = [ctypes.c_void_p]
+
+    if not fc.FcInit():
+        return None
+
+    fc_pattern = fc.FcNameParse(pattern.encode('utf-8'))
+    if not fc_pattern:
+        return None
+
+    fc.FcConfigSubstitute(None, fc_pattern, 0) # FcMatchPattern
+    fc.FcDefaultSubstitute(fc_pattern)
+
+    result = ctypes.c_int()
+    match = fc.FcFontMatch(None, fc_pattern, ctypes.byref(result))
+    fc.FcPatternDestroy(fc_pattern)
+
+    if not match:
+        return None
+
+    filename = ctypes.c_char_p()
+    found = fc.FcPatternGetString(match, b'file', 0, ctypes.byref(filename)) == 0
+    if found:
+        filename = filename.value.decode('utf-8')
+    fc.FcPatternDestroy(match)
+
+    if not found:
+        return None
+
+    return filename
+
+class TrueTypeFont():
+    """ Minimal reader of the horizontal metrics of a TrueType/OpenType font
+        (tables head, hhea, hmtx and cmap)
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: path of font file (.ttf, .otf or first font of .ttc)
+        """
+
+        with open(filename, 'rb') as f:
+            self.data = f.read()
+
+        offset = 0
+        if self.data[:4] == b'ttcf':
+            offset = struct.unpack_from('>I', self.data, 12)[0]
+
+        n_tables = struct.unpack_from('>H', self.data, offset + 4)[0]
+        self.tables = {}
+        for i in range(n_tables):
+            tag, _, table_offset, length = struct.unpack_from('>4sIII', self.data,
+                                                              offset + 12 + 16 * i)
+            self.tables[tag.decode('latin-1')] = (table_offset, length)
+
+        for tag in ('head', 'hhea', 'hmtx', 'cmap'):
+            if tag not in self.tables:
+                raise ValueError(f'Font {filename} has no {tag} table.')
+
+        self.units_per_em = struct.unpack_from('>H', self.data,
+                                               self.tables['head'][0] + 18)[0]
+
+        hhea = self.tables['hhea'][0]
+        (self.ascender, self.descender,
+         self.line_gap) = struct.unpack_from('>hhh', self.data, hhea + 4)
+        self.n_h_metrics = struct.unpack_from('>H', self.data, hhea + 34)[0]
+
+        self._read_cmap()
+
+    def _read_cmap(self):
+        """ select the unicode subtable of the cmap table
+        """
+
+        cmap = self.tables['cmap'][0]
+        n_subtables = struct.unpack_from('>H', self.data, cmap + 2)[0]
+
+        subtables = {}
+        for i in range(n_subtables):
+            platform, encoding, offset = struct.unpack_from('>HHI', self.data,
+                                                            cmap + 4 + 8 * i)
+            fmt = struct.unpack_from('>H', self.data, cmap + offset)[0]
+            subtables[(platform, encoding, fmt)] = cmap + offset
+
+        self.cmap_format = None
+
+        # prefer full unicode range (format 12) over basic plane (format 4)
+        for key in ((3, 10, 12), (0, 4, 12), (0, 6, 12), (0, 3, 12),
+                    (3, 1, 4), (0, 3, 4), (0, 1, 4), (0, 0, 4)):
+            if key in subtables:
+                self.cmap_format = key[2]
+                offset = subtables[key]
+                break
+
+        if self.cmap_format == 12:
+            n_groups = struct.unpack_from('>I', self.data, offset + 12)[0]
+            groups = [struct.unpack_from('>III', self.data, offset + 16 + 12 * i)
+                      for i in range(n_groups)]
+            self.cmap_ends = [g[1] for g in groups]
+            self.cmap_starts = [g[0] for g in groups]
+            self.cmap_glyphs = [g[2] for g in groups]
+
+        elif self.cmap_format == 4:
+            seg_count_x2 = struct.unpack_from('>H', self.data, offset + 6)[0]
+            n_segments = seg_count_x2 // 2
+            self.cmap_ends = struct.unpack_from(f'>{n_segments}H', self.data,
+                                                offset + 14)
+            self.cmap_starts = struct.unpack_from(f'>{n_segments}H', self.data,
+                                                  offset + 16 + seg_count_x2)
+            self.cmap_deltas = struct.unpack_from(f'>{n_segments}h', self.data,
+                                                  offset + 16 + 2 * seg_count_x2)
+            self.cmap_range_offset = offset + 16 + 3 * seg_count_x2
+            self.cmap_range_offsets = struct.unpack_from(f'>{n_segments}H',
+                                                         self.data,
+                                                         self.cmap_range_offset)
+        else:
+            raise ValueError('Font has no supported unicode cmap subtable.')
+
+    def get_glyph(self, char):
+        """ glyph index of given character (0 if the font has no such glyph)
+        """
+
+        code = ord(char)
+        i = bisect.bisect_left(self.cmap_ends, code)
+
+        if i >= len(self.cmap_ends) or self.cmap_starts[i] > code:
+            return 0
+
+        if self.cmap_format == 12:
+            return self.cmap_glyphs[i] + code - self.cmap_starts[i]
+
+        if self.cmap_range_offsets[i] == 0:
+            return (code + self.cmap_deltas[i]) & 0xffff
+
+        address = self.cmap_range_offset + 2 * i + self.cmap_range_offsets[i] + \
+                  2 * (code - self.cmap_starts[i])
+        glyph = struct.unpack_from('>H', self.data, address)[0]
+
+        if glyph == 0:
+            return 0
+
+        return (glyph + self.cmap_deltas[i]) & 0xffff
+
+    def get_advance(self, char):
+        """ advance width of given character in font units
+        """
+
+        glyph = min(self.get_glyph(char), self.n_h_metrics - 1)
+
+        return struct.unpack_from('>H', self.data,
+                                  self.tables['hmtx'][0] + 4 * glyph)[0]
+
+class FontFileMetrics():
+    """ Glyph metrics read directly from the font file that graphviz would use,
+        without running any layout. Mimics the text size calculation of the
+        graphviz pango plugin, which works with glyph advances rounded to
+        pixels at 96 dpi.
+    """
+
+    # scale of node size relative to label size for the supported shapes
+    SHAPE_SCALES = {'box': 1, 'rect': 1, 'rectangle': 1, 'square': 1,
+                    'plaintext': 1, 'plain': 1, 'none': 1, 'note': 1,
+                    'tab': 1, 'folder': 1, 'box3d': 1, 'component': 1,
+                    'ellipse': math.sqrt(2), 'oval': math.sqrt(2)}
+
+    DPI = 96.
+
+    def __init__(self, node_attributes, time_format):
+        """
+        :param node_attributes: node attributes like shape, fontname, etc.
+        :param time_format: font format of the time string
+        :raise ValueError: if the node shape is not supported
+        :raise OSError: if the font file can not be found or read
+        """
+
+        # graphviz defaults, see https://graphviz.org/docs/nodes/
+        shape = node_attributes.get('shape', 'ellipse')
+
+        if shape not in self.SHAPE_SCALES:
+            raise ValueError(f'Shape {shape} not supported by font metrics.')
+
+        self.scale = self.SHAPE_SCALES[shape]
+
+        self.font = self.load_font(node_attributes.get('fontname', 'Times-Roman'))
+        self.fontsize = float(node_attributes.get('fontsize', 14))
+
+        # the time string is formatted as html <FONT> tag
+        time_font = self.font
+        self.time_fontsize = 14.
+        for attribute in time_format.split():
+            key, value = attribute.split('=', 1)
+            value = value.strip('"')
+            if key.upper() == 'POINT-SIZE':
+                self.time_fontsize = float(value)
+            elif key.upper() == 'FACE':
+                time_font = self.load_font(value)
+        self.time_font = time_font
+
+    @staticmethod
+    def load_font(fontname):
+        """ load font file used by graphviz for given font name
+        """
+
+        filename = find_font_file(fontname)
+
+        if filename is None:
+            raise OSError(f'No font file found for font {fontname}.')
+
+        return TrueTypeFont(filename)
+
+    def pixels(self, font_units, font, fontsize):
+        """ convert font units to pixels
+        """
+        return font_units / font.units_per_em * fontsize * self.DPI / 72.
+
+    def line_height(self, font, fontsize):
+        """ height of a line of text in inches
+        """
+
+        height = math.ceil(self.pixels(font.ascender, font, fontsize)) + \
+                 math.ceil(self.pixels(-font.descender, font, fontsize)) + \
+                 round(self.pixels(font.line_gap, font, fontsize))
+
+        return height / self.DPI
+
+    def measure_time_height(self, margins_y):
+        """ height of a node containing only the time string
+        :param margins_y: sum of top and bottom margin
+        """
+
+        return (margins_y + self.line_height(self.time_font, self.time_fontsize)) * \
+               self.scale
+
+    def measure_chars(self, chars):
+        """ width and height of each of the given characters
+        :param chars: string with characters to measure
+        :return: dictionaries with widths and heights in inches
+        """
+
+        widths = {}
+        heights = {}
+
+        line_height = self.line_height(self.font, self.fontsize) * self.scale
+
+        for char in chars:
+            advance = self.pixels(self.font.get_advance(char), self.font,
+                                  self.fontsize)
+            widths[char] = round(advance) / self.DPI * self.scale
+            heights[char] = line_height
+
+        return widths, heights
+
+def compare_metrics(reference, candidate):
+    """ Compare glyph metrics of two NodeSize objects, e.g. to check the
+        font metrics backend against the dot probes
+    :param reference: NodeSize used as reference
+    :param candidate: NodeSize to check
+    :return: dictionary with errors in inches
+    """
+
+    width_errors = {char: candidate.widths[char] - reference.widths[char]
+                    for char in reference.widths if char in candidate.widths}
+    height_errors = {char: candidate.heights[char] - reference.heights[char]
+                     for char in reference.heights if char in candidate.heights}
+
+    worst = sorted(width_errors, key=lambda char: abs(width_errors[char]),
+                   reverse=True)
+
+    n_chars = max(len(width_errors), 1)
+
+    return {'n_chars': len(width_errors),
+            'max_width_error': max([abs(e) for e in width_errors.values()], default=0),
+            'mean_width_error': sum(abs(e) for e in width_errors.values()) / n_chars,
+            'max_height_error': max([abs(e) for e in height_errors.values()], default=0),
+            'mean_height_error': sum(abs(e) for e in height_errors.values()) / n_chars,
+            'time_height_error': candidate.margins_y_with_time -
+                                 reference.margins_y_with_time,
+            'worst_chars': [(char, width_errors[char]) for char in worst[:10]]}
 
 class NodeSize():
     """ calculation of node size for given text
     """
-    def __init__(self, gedcom_parser, node_attributes,
-                 time_format, margin=None):
+    def __init__(self, family_tree, node_attributes,
+                 time_format, margin=None, cache=None, batch_size=1000,
+                 backend='dot'):
+        """
+        :param family_tree: FamilyTree with the names to display
+        :param node_attributes: node attributes like shape, style, etc.
+        :param time_format: font format of the time string
+        :param margin: node margins in inches (x, y), graphviz default if None
+        :param cache: MetricsCache to load/store glyph metrics, or None
+        :param batch_size: number of characters measured by a single layout.
+                           If None, every character is measured separately.
+        :param backend: 'dot' to measure characters with graphviz, 'font' to
+                        read them from the font file (falls back to 'dot' if
+                        not possible), or an object with the methods
+                        measure_chars and measure_time_height like
+                        FontFileMetrics
+        """
 
         self.time_format = time_format
         self.node_attributes = node_attributes.copy()
@@ -30,13 +733,7 @@ class NodeSize():
         all_names = []
         all_names.append(' .')
 
-        root_child_elements = gedcom_parser.get_root_child_elements()
-
-        for person in root_child_elements:
-            if isinstance(person, IndividualElement):
-                (first_name, last_name) = person.get_name()
-                all_names.append(first_name)
-                all_names.append(last_name)
+        all_names.extend(family_tree.get_names())
 
         all_names = ''.join(all_names)
         # all the characters present in the names of this tree:
@@ -54,28 +751,106 @@ class NodeSize():
             self.margins_x = margin[0] * 2
             self.margins_y = margin[1] * 2
 
-        time_string = f'<<FONT {time_format}>1234567890-</FONT>>'
+        self.widths = {}
+        self.heights = {}
+        self.margins_y_with_time = None
+
+        if backend == 'font':
+            try:
+                backend = FontFileMetrics(self.node_attributes, time_format)
+            except (ValueError, OSError) as e:
+                print(f'WARNING: {e} Falling back to measuring text with dot.')
+                backend = 'dot'
+
+        self.backend = backend
+
+        if backend == 'dot':
+            self.measure_with_dot(all_chars, node_attributes, margin, cache,
+                                  batch_size)
+        else:
+            self.widths, self.heights = backend.measure_chars(all_chars)
+            self.margins_y_with_time = backend.measure_time_height(self.margins_y)
+
+        # identifies the metrics in memos of fitted texts
+        self.metrics_id = hashlib.sha256(json.dumps(
+            [self.margins_x, self.margins_y, self.margins_y_with_time,
+             sorted(self.widths.items()), sorted(self.heights.items())]
+            ).encode('utf-8')).hexdigest()
+
+    def measure_with_dot(self, all_chars, node_attributes, margin, cache,
+                         batch_size):
+        """ Measure glyph metrics by laying out probe nodes with dot. Only
+            characters not present in the cache are measured.
+        """
+
+        cache_key = None
+        entry = None
+        if cache is not None:
+            cache_key = cache.get_key(self.node_attributes, self.time_format,
+                                      margin)
+            entry = cache.load(cache_key)
+
+            if entry is not None:
+                self.widths = entry['widths']
+                self.heights = entry['heights']
+                self.margins_y_with_time = entry['margins_y_with_time']
+
+        new_chars = ''.join(c for c in all_chars if c not in self.widths)
+
+        if cache is not None:
+            print(f'Characters loaded from cache: {len(all_chars) - len(new_chars)}')
+
+        if self.margins_y_with_time is None:
+            self.margins_y_with_time = self.measure_time_height(node_attributes)
+
+        if batch_size is None:
+            self.measure_chars(new_chars)
+        else:
+            for i in range(0, len(new_chars), batch_size):
+                self.measure_chars_batched(new_chars[i:i + batch_size])
+
+        if cache is not None and \
+           (len(new_chars) > 0 or entry is None):
+            attributes = {key: str(value) for key, value in self.node_attributes.items()
+                          if key not in NON_GEOMETRIC_NODE_ATTRIBUTES}
+            cache.save(cache_key, {'node_attributes': attributes,
+                                   'time_format': self.time_format,
+                                   'margins_y_with_time': self.margins_y_with_time,
+                                   'widths': self.widths,
+                                   'heights': self.heights})
+
+    def measure_time_height(self, node_attributes):
+        """ Measure height of a node containing only the time string
+        :param node_attributes: node attributes like shape, style, etc.
+        :return: height of node
+        """
+
+        time_string = f'<<FONT {self.time_format}>1234567890-</FONT>>'
 
         graph = pgv.AGraph(rankdir='BT')
         graph.add_node(1, label=time_string,
                        shape=node_attributes['shape'],
                        style=node_attributes['style'],
                        width=0, height=0)
-        graph.layout('dot')
+        run_layout(graph)
         node = graph.get_node(1)
-        self.margins_y_with_time = float(node.attr['height'])
 
-        self.widths = {}
-        self.heights = {}
+        return float(node.attr['height'])
+
+    def measure_chars(self, chars):
+        """ Measure width and height of given characters by running graphviz.
+        The results are added to self.widths and self.heights.
+        :param chars: string with characters to measure
+        """
 
         # counter = 0
-        # n_chars = len(all_chars)
+        # n_chars = len(chars)
 
-        for char in all_chars:
+        for char in chars:
             graph = pgv.AGraph(rankdir='BT')#, splines = 'true')
             graph.add_node(1, label=char,
                            width=0, height=0, **self.node_attributes)
-            graph.layout('dot')
+            run_layout(graph)
             node = graph.get_node(1)
             one_char_width = float(node.attr['width'])
             one_char_height = float(node.attr['height'])
@@ -83,7 +858,7 @@ class NodeSize():
             graph = pgv.AGraph(rankdir='BT')
             graph.add_node(1, label=char + char + '\n' + char + char,
                            width=0, height=0, **self.node_attributes)
-            graph.layout('dot')
+            run_layout(graph)
             node = graph.get_node(1)
             two_chars_width = float(node.attr['width'])
             two_chars_height= float(node.attr['height'])
@@ -97,6 +872,45 @@ class NodeSize():
             # counter += 1
         # print('\r', end='')
 
+    def measure_chars_batched(self, chars):
+        """ Measure width and height of given characters using a single
+        graphviz layout containing the probe nodes of all characters.
+        The results are identical to measure_chars and are added to
+        self.widths and self.heights.
+        :param chars: string with characters to measure
+        """
+
+        if len(chars) < 1:
+            return
+
+        graph = pgv.AGraph(rankdir='BT')
+
+        for i, char in enumerate(chars):
+            graph.add_node(f'{i}_1', label=char,
+                           width=0, height=0, **self.node_attributes)
+            graph.add_node(f'{i}_2', label=char + char + '\n' + char + char,
+                           width=0, height=0, **self.node_attributes)
+
+        run_layout(graph)
+
+        for i, char in enumerate(chars):
+            one_char = graph.get_node(f'{i}_1')
+            two_chars = graph.get_node(f'{i}_2')
+
+            self.widths[char] = float(two_chars.attr['width']) - \
+                                float(one_char.attr['width'])
+            self.heights[char] = float(two_chars.attr['height']) - \
+                                 float(one_char.attr['height'])
+
+    def get_prefix_widths(self, line):
+        """ cumulative widths of the characters of a line of text
+        :param line: single line of text
+        :return: list, where element i is the width of the first i characters
+        """
+
+        return list(itertools.accumulate((self.widths[char] for char in line),
+                                         initial=0))
+
     def get_size(self, text, with_time):
         """ estimate node size for given text
         :param text: text to be displayed inside the node
@@ -125,73 +939,470 @@ class NodeSize():
         return ret_width, ret_height
 
 
-def limit_text_to_width(text, max_width, ns):
-    """ Reduce text until it fits into node with given maximum
-    :param text: input text to reduce
-    :param max_width: maximum width of node
-    :return: reduced text
+# maximum number of entries in the memo of fitted texts
+FIT_CACHE_SIZE = 100000
+
+class LRUCache():
+    """ dictionary with limited size, which discards the least recently used
+        entries first
     """
 
-    width = max_width + 1
+    def __init__(self, maxsize):
+        """
+        :param maxsize: maximum number of entries
+        """
 
-    while width > max_width:
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-        # determine size of node by creating graph
-#        # Slower but very accurate way of calculating the size
-#        graph = pgv.AGraph(rankdir='BT')#, splines = 'true')
-#        graph.add_node(1, label=text, shape='box', style='rounded')
-#        graph.layout('dot')
-#        node = graph.get_node(1)
-#        width = float(node.attr['width'])
-        width, height = ns.get_size(text, False)
+    def get(self, key, default=None):
+        """ get entry for key and mark it as recently used
+        """
 
-        if width <= max_width:
-            return text
+        if key not in self.data:
+            self.misses += 1
+            return default
 
-        lines = text.splitlines()
-        longest_line = max(lines, key=len)
-        longest_line_index = lines.index(longest_line)
+        self.hits += 1
+        self.data.move_to_end(key)
 
-        if ' ' in longest_line:
-            # split longest line at whitespace
+        return self.data[key]
 
-            max_length = math.inf
-            max_n = -1
-            for i in range(len(text.split(' '))):
-                first_part  = ' '.join(longest_line.split(' ', i)[:i])
-                second_part = ' '.join(longest_line.split(' ', i)[i:])
+    def put(self, key, value):
+        """ add or replace entry for key
+        """
 
-                # actually it would be more precise to calculate length using
-                # pgv here, but also much slower...
-                max_for_i = max(len(first_part), len(second_part))
+        self.data[key] = value
+        self.data.move_to_end(key)
 
-                if max_for_i < max_length:
-                    max_n = i
-                    max_length = max_for_i
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
 
-            first_part  = ' '.join(longest_line.split(' ', max_n)[:max_n])
-            second_part = ' '.join(longest_line.split(' ', max_n)[max_n:])
+    def clear(self):
+        """ remove all entries
+        """
 
-            lines[longest_line_index] = first_part + '\n' + second_part
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
 
-        else:
-            if longest_line[-3:] == '...':
-                longest_line = longest_line[:-3]
+# memo of fitted names and texts, keys contain the NodeSize.metrics_id
+fit_cache = LRUCache(FIT_CACHE_SIZE)
 
-            if len(longest_line) < 1:
-                return ''
+# version of the profile report format, see Profiler
+PROFILE_VERSION = 1
 
-            lines[longest_line_index] = longest_line[:-1] + '...'
+def get_peak_rss(children=False):
+    """ Peak resident set size of this process or its children
+    :param children: if True, the largest peak of the terminated child
+                     processes is returned
+    :return: peak RSS in MiB or None if not available on this platform
+    """
 
-        text = '\n'.join(lines)
+    try:
+        import resource
+    except ImportError:
+        return None
 
-    return text
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
 
-def format_name(person, max_width, max_height, ns):
-    """ Format text with name/birth/death of person, so it fits inside of node
-        with given size
-    :param person: gedcom individual
-    :param max_width: maximum width of node
+    # ru_maxrss is in bytes on macOS and in KiB on other systems
+    scale = 1 if sys.platform == 'darwin' else 1024
+
+    return resource.getrusage(who).ru_maxrss * scale / 2**20
+
+class Profiler():
+    """ wall and CPU time, peak memory and counters of the phases of a run,
+        e.g. the number of graphviz layouts
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ discard all phases and counters
+        """
+
+        self.phases = []
+        self.counters = collections.Counter()
+        self.running = []
+        self.start_wall_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        self.start_children_cpu_time = sum(os.times()[2:4])
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Measure a phase of the run, to be used as
+            `with profiler.phase('layout'):`. Phases can be nested, their
+            names are prefixed with the names of the enclosing phases.
+        :param name: name of the phase
+        :return: dictionary of the phase, see annotate
+        """
+
+        info = {}
+        self.running.append((name, info))
+        path = '/'.join(n for n, _ in self.running)
+
+        counters = self.counters.copy()
+        start_wall_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        start_children_cpu_time = sum(os.times()[2:4])
+
+        try:
+            yield info
+        finally:
+            self.running.pop()
+            self.phases.append({
+                'name': path,
+                'start': start_wall_time - self.start_wall_time,
+                'wall_time': time.perf_counter() - start_wall_time,
+                'cpu_time': time.process_time() - start_cpu_time,
+                'children_cpu_time': sum(os.times()[2:4]) - start_children_cpu_time,
+                'peak_rss': get_peak_rss(),
+                'counters': dict(self.counters - counters),
+                **info})
+
+    def annotate(self, **info):
+        """ add information like graph sizes to the innermost running phase
+        """
+
+        if len(self.running) > 0:
+            self.running[-1][1].update(info)
+
+    def count(self, name, n=1):
+        """ increase counter, e.g. 'dot_layouts'
+        """
+
+        self.counters[name] += n
+
+    def get_report(self):
+        """
+        :return: dictionary with total times, peak memory, counters and
+                 phases in order of their start. Times are in seconds,
+                 memory in MiB. CPU times of child processes, e.g. drawing
+                 in parallel, are given separately.
+        """
+
+        return {'version': PROFILE_VERSION,
+                'wall_time': time.perf_counter() - self.start_wall_time,
+                'cpu_time': time.process_time() - self.start_cpu_time,
+                'children_cpu_time': sum(os.times()[2:4]) - self.start_children_cpu_time,
+                'peak_rss': get_peak_rss(),
+                'children_peak_rss': get_peak_rss(children=True),
+                'counters': dict(self.counters),
+                'phases': sorted(self.phases, key=lambda phase: phase['start'])}
+
+# timings and counters of the current run, see --profile
+profiler = Profiler()
+
+def run_layout(graph, prog='dot'):
+    """ Lay out graph with graphviz, counting the layouts by program for the
+        profiler
+    :param graph: pygraphviz graph
+    :param prog: graphviz layout program
+    """
+
+    profiler.count(f'{prog}_layouts')
+    graph.layout(prog)
+
+# number of last messages of a failed layout subprocess which are printed
+LAYOUT_MESSAGES = 10
+
+# engines used if the layout subprocess fails, see GedcomPlotter.create_graph
+LAYOUT_FALLBACKS = ('banded', 'partitioned')
+
+# runs layout_worker in the child process if graphviz is not installed
+LAYOUT_WORKER_CODE = ('import sys; sys.path.insert(0, sys.argv[1]); import gedcom_plotter; '
+                      'gedcom_plotter.layout_worker(*sys.argv[2:])')
+
+def layout_worker(prog, input_filename, output_filename):
+    """ Lay out a graph file with pygraphviz and write the laid out graph.
+        Runs in the child process of run_layout_subprocess if the graphviz
+        programs are not installed. Progress is written to stderr, like the
+        messages of dot -v.
+    :param prog: graphviz layout program
+    :param input_filename: graph in dot format
+    :param output_filename: file to write the laid out graph to
+    """
+
+    def progress(message):
+        print(f'{prog}: {message}', file=sys.stderr, flush=True)
+
+    progress(f'reading {input_filename}')
+    graph = pgv.AGraph(input_filename)
+
+    progress(f'laying out {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges')
+    start = time.perf_counter()
+    graph.layout(prog)
+    progress(f'layout finished in {time.perf_counter() - start:.2f} s')
+
+    graph.write(output_filename)
+
+def get_ordered_string(graph):
+    """ dot source of a graph which keeps the order of its nodes and edges.
+        graphviz writes the nodes of clusters first and other nodes where
+        they are first used, so a graph read from graph.string() can get a
+        different layout. Declaring all nodes and edges in their order after
+        the defaults keeps it.
+    :param graph: pygraphviz graph
+    :return: graph in dot format
+    """
+
+    header, body = graph.string().split('\n', 1)
+
+    lines = [header]
+    for defaults, attributes in (('node', graph.node_attr), ('edge', graph.edge_attr)):
+        attributes = {key: value for key, value in attributes.items() if value}
+        lines.append(f'{defaults} {DotGraph.format_attributes(attributes)};')
+    lines.extend(f'{quote_dot(node)};' for node in graph.nodes_iter())
+    lines.extend(f'{quote_dot(tail)} -- {quote_dot(head)};'
+                 for tail, head in graph.edges_iter())
+    lines.append(body)
+
+    return '\n'.join(lines)
+
+def run_layout_subprocess(graph, prog='dot', timeout=None, memory_limit=None,
+                          progress=False):
+    """ Lay out graph with graphviz in a child process, which is killed if it
+        runs longer than timeout, and whose address space is limited to
+        memory_limit. Uses the graphviz program if it is installed, otherwise
+        pygraphviz in a python process (see layout_worker). The child is also
+        killed if the layout is interrupted, e.g. with Ctrl+C.
+    :param graph: pygraphviz graph, positions are stored in its attributes
+    :param prog: graphviz layout program
+    :param timeout: maximum wall time in seconds, or None
+    :param memory_limit: maximum memory of the child process in MiB, or None
+    :param progress: print the progress messages of the child process
+    :return: graph, or None if the layout failed
+    """
+
+    import shutil
+    import threading
+    import subprocess
+
+    profiler.count(f'{prog}_layouts')
+
+    preexec_fn = None
+    if memory_limit is not None:
+        try:
+            import resource
+        except ImportError:
+            print('Memory limit of the layout is not supported on this platform.')
+            return None
+
+        limit = int(memory_limit * 1024 * 1024)
+
+        def set_memory_limit():
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        preexec_fn = set_memory_limit
+
+    # last messages of the child process, printed if the layout fails
+    messages = collections.deque(maxlen=LAYOUT_MESSAGES)
+
+    def read_messages(stream):
+        for line in stream:
+            messages.append(line.rstrip())
+            if progress:
+                print(messages[-1])
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_filename = os.path.join(tmpdir, 'graph.gv')
+        output_filename = os.path.join(tmpdir, 'layout.gv')
+        with open(input_filename, 'w', encoding='utf-8') as f:
+            f.write(get_ordered_string(graph))
+
+        executable = shutil.which(prog)
+        if executable is not None:
+            command = [executable, '-v', '-Tdot', '-o', output_filename, input_filename]
+        else:
+            command = [sys.executable, '-c', LAYOUT_WORKER_CODE,
+                       os.path.dirname(os.path.abspath(__file__)),
+                       prog, input_filename, output_filename]
+
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                   text=True, errors='replace', preexec_fn=preexec_fn)
+        reader = threading.Thread(target=read_messages, args=(process.stderr,), daemon=True)
+        reader.start()
+
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f'Layout did not finish within {timeout} s.')
+            return None
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            reader.join()
+            process.stderr.close()
+
+        if process.returncode != 0:
+            if process.returncode < 0:
+                reason = f'killed by signal {-process.returncode}'
+            else:
+                reason = f'exit code {process.returncode}'
+            if memory_limit is not None:
+                reason += f', memory limit {memory_limit} MiB'
+            print(f'Layout failed ({reason}).')
+            if not progress:
+                for message in messages:
+                    print(message)
+            return None
+
+        layout = pgv.AGraph(output_filename)
+
+    LayoutCache.set_layout(graph, LayoutCache.get_layout(layout, prog))
+
+    return graph
+
+def get_split_index(line, n_max):
+    """ Find the whitespace at which a line is split into two parts of about
+        equal length.
+    :param line: line to split
+    :param n_max: number of split positions to consider
+    :return: number of words in the first part
+    """
+
+    words = line.split(' ')
+    n_max = min(n_max, len(words))
+
+    # lengths of the first and second part when splitting after i words
+    first_lengths = [0]
+    for word in words[:n_max - 1]:
+        first_lengths.append(first_lengths[-1] + len(word) + (len(first_lengths) > 1))
+    second_lengths = [len(line)] + [len(line) - l - 1 for l in first_lengths[1:]]
+
+    # the first part grows and the second part shrinks with i, so the
+    # optimum is where the first part becomes at least as long as the second
+    i = bisect.bisect_left([f - s for f, s in zip(first_lengths, second_lengths)], 0)
+
+    if i >= n_max:
+        return n_max - 1
+
+    if i > 0 and second_lengths[i - 1] <= first_lengths[i]:
+        return i - 1
+
+    return i
+
+def limit_text_to_width(text, max_width, ns):
+    """ Reduce text until it fits into node with given maximum
+    :param text: input text to reduce
+    :param max_width: maximum width of node
+    :return: reduced text
+    """
+
+    key = ('text', text, max_width, ns.metrics_id)
+    ret = fit_cache.get(key)
+
+    if ret is None:
+        ret = _limit_text_to_width(text, max_width, ns)
+        fit_cache.put(key, ret)
+
+    return ret
+
+def _limit_text_to_width(text, max_width, ns):
+    """ Implementation of limit_text_to_width.
+    Lines are split at the whitespace which results in parts of about equal
+    length. Lines without whitespace are truncated one character at a time
+    and end with '...'. Widths are calculated from cumulative character
+    widths, so the number of characters to remove is found by binary search.
+    """
+
+    dot_width = ns.widths['.']
+
+    lines = text.splitlines()
+    prefix_widths = [ns.get_prefix_widths(line) for line in lines]
+
+    while True:
+
+        if max((p[-1] + ns.margins_x for p in prefix_widths), default=0) <= max_width:
+            return text
+
+        longest_line = max(lines, key=len)
+        longest_line_index = lines.index(longest_line)
+
+        if ' ' in longest_line:
+            # split longest line at whitespace
+            max_n = get_split_index(longest_line, text.count(' ') + 1)
+
+            first_part  = ' '.join(longest_line.split(' ', max_n)[:max_n])
+            second_part = ' '.join(longest_line.split(' ', max_n)[max_n:])
+
+            lines[longest_line_index] = first_part + '\n' + second_part
+
+            text = '\n'.join(lines)
+            lines = text.splitlines()
+            prefix_widths = [ns.get_prefix_widths(line) for line in lines]
+            continue
+
+        # truncate longest line. It remains the longest line (and therefore
+        # gets truncated further) as long as it is longer than all lines
+        # before it and not shorter than the lines after it.
+        if longest_line[-3:] == '...':
+            longest_line = longest_line[:-3]
+
+        core_length = len(longest_line)
+
+        if core_length < 1:
+            return ''
+
+        other_lengths_before = [len(l) for l in lines[:longest_line_index]]
+        other_lengths_after = [len(l) for l in lines[longest_line_index + 1:]]
+        n_steps = min(core_length + 3 - max(other_lengths_before, default=-1),
+                      core_length + 4 - max(other_lengths_after, default=-1))
+        n_steps = min(max(n_steps, 1), core_length)
+
+        # joining and splitting the text again drops a trailing empty line, so
+        # in that case only one character is removed before the next split
+        if lines[-1] == '':
+            n_steps = 1
+
+        other_width = max((p[-1] for i, p in enumerate(prefix_widths)
+                           if i != longest_line_index), default=None)
+        prefix = prefix_widths[longest_line_index]
+
+        def fits(n_removed):
+            # the dots are added one by one like the characters of the
+            # prefix, so the float sum is the same as the width of the
+            # truncated line measured character by character
+            width = prefix[core_length - n_removed]
+            for _ in range(3):
+                width += dot_width
+            if other_width is not None:
+                width = max(width, other_width)
+            return width + ns.margins_x <= max_width
+
+        if all(ns.widths[char] >= 0 for char in longest_line):
+            n_removed = bisect.bisect_left(range(1, n_steps + 1), True,
+                                           key=fits) + 1
+        else:
+            n_removed = next((n for n in range(1, n_steps + 1) if fits(n)),
+                             n_steps + 1)
+
+        if n_removed <= n_steps:
+            lines[longest_line_index] = longest_line[:core_length - n_removed] + '...'
+            return '\n'.join(lines)
+
+        # the line would still be the longest one, but nothing is left of it
+        if n_steps == core_length and \
+           max(other_lengths_before, default=-1) < 3 and \
+           max(other_lengths_after, default=-1) <= 3:
+            return ''
+
+        lines[longest_line_index] = longest_line[:core_length - n_steps] + '...'
+        text = '\n'.join(lines)
+        lines = text.splitlines()
+        prefix_widths = [ns.get_prefix_widths(line) for line in lines]
+
+def format_name(person, max_width, max_height, ns):
+    """ Format text with name/birth/death of person, so it fits inside of node
+        with given size
+    :param person: gedcom individual
+    :param max_width: maximum width of node
     :param max_height: maximum height of node
     :param ns: NodeSize object, needed to truncate node text
     :return: formatted text
@@ -199,18 +1410,35 @@ def format_name(person, max_width, max_height, ns):
 
     (first_name, last_name) = person.get_name()
 
-    if first_name == '' and last_name=='':
-        print(f'WARNING: Name is empty for record {person.get_pointer()} {person.get_tag()}.')
+    return format_label(person.get_pointer(), first_name, last_name,
+                        person.get_birth_year(), person.get_death_year(),
+                        person.is_deceased(), max_width, max_height, ns)
+
+def format_label(pointer, first_name, last_name, birth_year, death_year,
+                 deceased, max_width, max_height, ns):
+    """ Format text with name/birth/death of a person given by its fields,
+        see format_name and PersonTable
+    :param pointer: pointer of the person, used in warnings
+    :param first_name: first name of person
+    :param last_name: last name of person
+    :param birth_year: year of birth or -1
+    :param death_year: year of death or -1
+    :param deceased: True if the person is known to be deceased
+    :param max_width: maximum width of node
+    :param max_height: maximum height of node
+    :param ns: NodeSize object, needed to truncate node text
+    :return: formatted text
+    """
 
-    birth_year = person.get_birth_year()
-    death_year = person.get_death_year()
+    if first_name == '' and last_name=='':
+        print(f'WARNING: Name is empty for record {pointer} {GEDCOM_TAG_INDIVIDUAL}.')
 
     if birth_year==-1 and death_year==-1:
         time_string=''
     elif birth_year==-1:
         time_string=f'? - {death_year}'
     elif death_year==-1:
-        if person.is_deceased():
+        if deceased:
             time_string=f'{birth_year} - ?'
         else:
             time_string=f'{birth_year}'
@@ -225,6 +1453,39 @@ def format_name(person, max_width, max_height, ns):
     # (will overflow shapes)
     #return f'<{first_name}<BR/>{last_name}{time_string}>'.replace('&', '&amp;')
 
+    key = ('name', first_name, last_name, time_string, max_width, max_height,
+           ns.metrics_id)
+    ret = fit_cache.get(key)
+
+    if ret is None:
+        ret = fit_name(first_name, last_name, time_string, max_width,
+                       max_height, ns)
+        fit_cache.put(key, ret)
+
+    text, warnings = ret
+
+    if 1 in warnings:
+        print(f'WARNING1: Problem truncating text of {(first_name, last_name)} for shape. Try different shape, bigger shape size or smaller font size.')
+    if 2 in warnings:
+        print(f'WARNING2: Problem truncating text of {(first_name, last_name)} for shape. Try different shape, bigger shape size or smaller font size.')
+
+    return text
+
+def fit_name(first_name, last_name, time_string, max_width, max_height, ns):
+    """ Fit first and last name and time string into node with given size
+    :param first_name: first name of person
+    :param last_name: last name of person
+    :param time_string: formatted birth/death years, or empty string
+    :param max_width: maximum width of node
+    :param max_height: maximum height of node
+    :param ns: NodeSize object, needed to truncate node text
+    :return: formatted text and tuple of warnings (1: truncation did not
+             converge, 2: nothing of the name is left)
+    """
+
+    warnings = []
+    name = (first_name, last_name)
+
     height = max_height + 1
 
     while height > max_height:
@@ -274,21 +1535,114 @@ def format_name(person, max_width, max_height, ns):
         # if name and height does not change anymore, we entered infinite loop
         # (probably shape is not high enough for more than one line)
         if new_height == height and not name_changed:
-            print(f'WARNING1: Problem truncating text of {person.get_name()} for shape. Try different shape, bigger shape size or smaller font size.')
+            warnings.append(1)
             break
 
         height = new_height
 
-    if text == '<>' and (person.get_name()[0] != '' or
-                         person.get_name()[1] != ''):
-        print(f'WARNING2: Problem truncating text of {person.get_name()} for shape. Try different shape, bigger shape size or smaller font size.')
+    if text == '<>' and (name[0] != '' or name[1] != ''):
+        warnings.append(2)
 
-    return text
+    return text, tuple(warnings)
+
+class ElementIndex():
+    """ Index of all records of a gedcom file by pointer. It is built once
+        when the file is loaded and used to resolve all links.
+    """
+
+    def __init__(self, root_child_elements, loader=None):
+        """
+        :param root_child_elements: records of the gedcom file
+        :param loader: function which loads a record by pointer when it is
+                       not in root_child_elements, e.g.
+                       GedcomStreamReader.load_record, or None
+        """
+
+        self.elements = {}
+        for element in root_child_elements:
+            if element.get_pointer():
+                self.elements[element.get_pointer()] = element
+
+        self.loader = loader
 
-def follow_link(e, gedcom_parser):
+        self.n_lookups = 0
+        self.n_misses = 0
+        self.n_loads = 0
+
+    def get(self, pointer):
+        """ Get record for pointer
+        :param pointer: pointer like '@I1@'
+        :return: record or None if it does not exist
+        """
+
+        self.n_lookups += 1
+        element = self.elements.get(pointer)
+
+        if element is None and self.loader is not None:
+            element = self.loader(pointer)
+            if element is not None:
+                self.n_loads += 1
+                self.elements[pointer] = element
+
+        if element is None:
+            self.n_misses += 1
+
+        return element
+
+    def get_families(self, individual, family_type=GEDCOM_TAG_FAMILY_SPOUSE):
+        """ Families of an individual, like Parser.get_families
+        :param individual: gedcom individual
+        :param family_type: 'FAMS' (families where the individual is a spouse)
+                            or 'FAMC' (families where the individual is a child)
+        :return: list of families
+        """
+
+        families = []
+        for c in individual.get_child_elements():
+            if c.get_tag() == family_type:
+                family = self.get(c.get_value())
+                if family is not None:
+                    families.append(family)
+
+        return families
+
+    def get_family_members(self, family, members_type=FAMILY_MEMBERS_TYPE_ALL):
+        """ Members of a family, like Parser.get_family_members
+        :param family: gedcom family
+        :param members_type: 'ALL', 'PARENTS', 'HUSB', 'WIFE' or 'CHIL'
+        :return: list of individuals
+        """
+
+        if members_type == FAMILY_MEMBERS_TYPE_ALL:
+            tags = (GEDCOM_TAG_HUSBAND, GEDCOM_TAG_WIFE, GEDCOM_TAG_CHILD)
+        elif members_type == FAMILY_MEMBERS_TYPE_PARENTS:
+            tags = (GEDCOM_TAG_HUSBAND, GEDCOM_TAG_WIFE)
+        else:
+            tags = (members_type,)
+
+        members = []
+        for c in family.get_child_elements():
+            if c.get_tag() in tags:
+                member = self.get(c.get_value())
+                if member is not None:
+                    members.append(member)
+
+        return members
+
+    def get_stats(self):
+        """ statistics of index usage
+        :return: dictionary with number of records, lookups and misses
+        """
+
+        return {'records': len(self.elements),
+                'lookups': self.n_lookups,
+                'misses': self.n_misses,
+                'loads': self.n_loads}
+
+def follow_link(e, element_index):
     """ Follow a link in a gedcom entry
     :param e: gedcom element which links to another element
-    :param gedcom_parser: parser of current gedcom file
+    :param element_index: ElementIndex of current gedcom file
     :return: Target of link
     """
 
@@ -298,485 +1652,4010 @@ def follow_link(e, gedcom_parser):
         return e
 
     if link[0] == '@' and link[-1] == '@':
-        ele_dict = gedcom_parser.get_element_dictionary()
-        if link in ele_dict.keys():
-            return ele_dict[link]
+        target = element_index.get(link)
+        if target is not None:
+            return target
 
     return e
 
-def note_to_string(e, gedcom_parser):
-    """ Convert gedcom note entry to string
-    :param e: gedcom note element
-    :param gedcom_parser: parser of current gedcom file
-    :return: Converted string
+def note_to_string(e, element_index):
+    """ Convert gedcom note entry to string
+    :param e: gedcom note element
+    :param element_index: ElementIndex of current gedcom file
+    :return: Converted string
+    """
+
+    e = follow_link(e, element_index)
+
+    ret_string = e.get_value()
+
+    if len(ret_string) < 1:
+        return ''
+
+#    # follow reference
+#    if ret_string[0] == '@' and ret_string[-1] == '@':
+#        e = element_index.get(ret_string)
+#        ret_string = e.get_value()
+
+    for c in e.get_child_elements():
+        if c.get_tag() == 'CONT':
+            ret_string = ret_string + '\n' + c.get_value()
+        if c.get_tag() == 'CONC':
+            ret_string = ret_string + c.get_value()
+
+    return ret_string
+
+def source_to_string(e, element_index):
+    """ Convert gedcom source entry to string
+    :param e: gedcom note element
+    :param element_index: ElementIndex of current gedcom file
+    :return: Converted string
+    """
+
+    ret_string = 'Source:\n'
+
+    for c in e.get_child_elements():
+        c = follow_link(c, element_index)
+
+        if c.get_tag() == 'TITL':
+            ret_string = ret_string + c.get_value() + ':\n'
+
+    for c in e.get_child_elements():
+        c = follow_link(c, element_index)
+
+        if c.get_tag() == 'NOTE':
+            ret_string = ret_string + note_to_string(c, element_index)
+
+    return ret_string
+
+def get_tooltip(e, element_index):
+    """ Create a tooltip for given element
+    (not fully implemented/tested)
+    :param e: gedcom note element
+    :param element_index: ElementIndex of current gedcom file
+    :return: Tooltip as string
+    """
+
+    # Tooltip always starts with name:
+    (first_name, last_name) = e.get_name()
+    if first_name == '':
+        ret_string = '?'
+    else:
+        ret_string = first_name
+
+    if last_name != '':
+        ret_string = ret_string + ' ' + last_name
+
+    ret_string = ret_string + '\n'
+
+    # TODO: birth, death, dates and places, etc.
+
+    # check if there is a note at first level:
+    for c in e.get_child_elements():
+
+        c = follow_link(c, element_index)
+
+        if c.get_tag() == 'NOTE':
+            ret_string = ret_string + note_to_string(c, element_index)
+
+    # check if there is a note at second level:
+    for c in e.get_child_elements():
+
+        c = follow_link(c, element_index)
+
+        for c2 in c.get_child_elements():
+
+            c2 = follow_link(c2, element_index)
+
+            if c2.get_tag() == 'NOTE':
+                if c.get_tag() == 'SOUR':
+                    ret_string = ret_string + source_to_string(c, element_index)
+                else:
+                    ret_string = ret_string + c.get_tag() + ':\n'   # TODO: this looks ugly (BIRT, DEAT, etc.)
+                    ret_string = ret_string + note_to_string(c2, element_index)
+
+    return ret_string
+
+def get_year(date):
+    """ year of a gedcom date like '1 JAN 1950', like
+        IndividualElement.get_birth_year
+    :param date: value of gedcom DATE record
+    :return: year as int or -1 if the date has no valid year
+    """
+
+    date_split = date.split()
+
+    if len(date_split) < 1:
+        return -1
+
+    try:
+        return int(date_split[-1])
+    except ValueError:
+        return -1
+
+class Person():
+    """ individual of the family tree. Provides the same getters as the
+        IndividualElement of python-gedcom that are used for plotting.
+    """
+
+    __slots__ = ('pointer', 'node_name', 'gender', 'first_name', 'last_name',
+                 'birth_year', 'death_year', 'deceased', 'families',
+                 'parent_families')
+
+    def __init__(self, pointer, node_name):
+        """
+        :param pointer: pointer of the record, e.g. '@I1@'
+        :param node_name: name of graph node (first line of the record)
+        """
+
+        self.pointer = pointer
+        self.node_name = node_name
+        self.gender = ''
+        self.first_name = ''
+        self.last_name = ''
+        self.birth_year = -1
+        self.death_year = -1
+        self.deceased = False
+        # pointers of families with this person as spouse/as child
+        self.families = []
+        self.parent_families = []
+
+    def get_pointer(self):
+        return self.pointer
+
+    def get_tag(self):
+        return GEDCOM_TAG_INDIVIDUAL
+
+    def get_name(self):
+        return self.first_name, self.last_name
+
+    def get_gender(self):
+        return self.gender
+
+    def get_birth_year(self):
+        return self.birth_year
+
+    def get_death_year(self):
+        return self.death_year
+
+    def is_deceased(self):
+        return self.deceased
+
+class Family():
+    """ family of the family tree: parents, children and marriage status
+    """
+
+    __slots__ = ('pointer', 'node_name', 'parents', 'children', 'married',
+                 'divorced', 'marriage_year', 'divorce_year', 'label')
+
+    def __init__(self, pointer, node_name):
+        """
+        :param pointer: pointer of the record, e.g. '@F1@'
+        :param node_name: name of graph node (first line of the record)
+        """
+
+        self.pointer = pointer
+        self.node_name = node_name
+        # pointers of parents (HUSB/WIFE in order of the file) and children
+        self.parents = []
+        self.children = []
+        self.married = False
+        self.divorced = False
+        # years are strings of 4 digits or None
+        self.marriage_year = None
+        self.divorce_year = None
+        # label of marriage node: ⚭ for married, ⚮ for divorced couples
+        self.label = ''
+
+    def get_pointer(self):
+        return self.pointer
+
+# directions of FamilyTree.get_subtree
+SUBTREE_DIRECTIONS = ('ancestors', 'descendants', 'both', 'relatives')
+
+class FamilyTree():
+    """ Compact model of all individuals and families and their relations.
+        It is built once when a gedcom file is loaded and read by all graph
+        building steps, so the records do not have to be scanned again for
+        every render.
+    """
+
+    def __init__(self):
+
+        # pointer -> Person/Family, in order of the gedcom file
+        self.persons = {}
+        self.families = {}
+
+    @classmethod
+    def from_elements(cls, root_child_elements):
+        """ Build model in a single pass over the records of a gedcom file
+        :param root_child_elements: records parsed by python-gedcom
+        :return: FamilyTree
+        """
+
+        tree = cls()
+
+        for element in root_child_elements:
+            if isinstance(element, IndividualElement):
+                tree.add_person(element)
+            elif isinstance(element, FamilyElement):
+                tree.add_family(element)
+
+        tree.resolve_links()
+
+        return tree
+
+    def add_person(self, element):
+        """ add individual record
+        :param element: gedcom record with INDI tag (or any object with the
+                        methods get_pointer, get_tag, get_value and
+                        get_child_elements)
+        :return: Person
+        """
+
+        person = Person(element.get_pointer(), str(element))
+
+        # name as in IndividualElement.get_name: the first NAME with a value,
+        # or the first one with both GIVN and SURN
+        name_found = False
+        found_given_name = False
+        found_surname = False
+
+        for c in element.get_child_elements():
+
+            tag = c.get_tag()
+
+            if tag == GEDCOM_TAG_NAME and not name_found:
+
+                if c.get_value() != '':
+                    name = c.get_value().split('/')
+                    person.first_name = name[0].strip()
+                    if len(name) > 1:
+                        person.last_name = name[1].strip()
+                    name_found = True
+                    continue
+
+                for c2 in c.get_child_elements():
+                    if c2.get_tag() == GEDCOM_TAG_GIVEN_NAME:
+                        person.first_name = c2.get_value()
+                        found_given_name = True
+                    if c2.get_tag() == GEDCOM_TAG_SURNAME:
+                        person.last_name = c2.get_value()
+                        found_surname = True
+
+                name_found = found_given_name and found_surname
+
+            elif tag == GEDCOM_TAG_SEX:
+                person.gender = c.get_value()
+
+            elif tag in (GEDCOM_TAG_BIRTH, GEDCOM_TAG_DEATH):
+
+                if tag == GEDCOM_TAG_DEATH:
+                    person.deceased = True
+
+                for c2 in c.get_child_elements():
+                    if c2.get_tag() == GEDCOM_TAG_DATE:
+                        if tag == GEDCOM_TAG_BIRTH:
+                            person.birth_year = get_year(c2.get_value())
+                        else:
+                            person.death_year = get_year(c2.get_value())
+
+            elif tag == GEDCOM_TAG_FAMILY_SPOUSE:
+                person.families.append(c.get_value())
+
+            elif tag == GEDCOM_TAG_FAMILY_CHILD:
+                person.parent_families.append(c.get_value())
+
+        self.persons[person.pointer] = person
+
+        return person
+
+    def add_family(self, element):
+        """ add family record
+        :param element: gedcom record with FAM tag (or any object with the
+                        methods get_pointer, get_value and get_child_elements)
+        :return: Family
+        """
+
+        family = Family(element.get_pointer(), str(element))
+
+        divorce_found = False
+
+        for c in element.get_child_elements():
+
+            tag = c.get_tag()
+
+            if tag in (GEDCOM_TAG_HUSBAND, GEDCOM_TAG_WIFE):
+                family.parents.append(c.get_value())
+
+            elif tag == GEDCOM_TAG_CHILD:
+                family.children.append(c.get_value())
+
+            # check if couple is divorced (only first divorce record)
+            elif tag == 'DIV' and not divorce_found:
+                divorce_found = True
+
+                if c.get_value() == 'Y':
+                    family.divorced = True
+                    family.label = '⚮'
+
+                # not sure why, but sometimes the divorce value
+                # is stored in extra child person
+                for c2 in c.get_child_elements():
+
+                    if c2.get_tag() == 'TYPE':
+                        if c2.get_value() == 'Y':
+                            family.divorced = True
+                            family.label = '⚮'
+
+                    if c2.get_tag() == GEDCOM_TAG_DATE:
+                        year = (c2.get_value().split() or [''])[-1]
+                        if len(year) == 4 and year.isdigit():
+                            family.divorce_year = year
+                            family.label = f'<⚮<BR/><FONT POINT-SIZE="10.0">{year}</FONT>>'
+
+            # check if couple is married
+            elif tag == GEDCOM_TAG_MARRIAGE:
+                family.married = True
+                family.marriage_year = None
+
+                for c2 in c.get_child_elements():
+                    if c2.get_tag() == GEDCOM_TAG_DATE:
+                        year = (c2.get_value().split() or [''])[-1]
+                        if len(year) == 4 and year.isdigit():
+                            family.marriage_year = year
+
+        # the marriage label is only used if there was no divorce
+        if family.married and not family.divorced:
+            family.label = '⚭'
+            if family.marriage_year is not None:
+                family.label = f'<⚭<BR/><FONT POINT-SIZE="10.0">{family.marriage_year}</FONT>>'
+
+        self.families[family.pointer] = family
+
+        return family
+
+    def resolve_links(self):
+        """ remove links to records which do not exist
+        """
+
+        for person in self.persons.values():
+            person.families = [f for f in person.families if f in self.families]
+            person.parent_families = [f for f in person.parent_families
+                                      if f in self.families]
+
+        for family in self.families.values():
+            family.parents = [p for p in family.parents if p in self.persons]
+            family.children = [p for p in family.children if p in self.persons]
+
+    def get_names(self):
+        """ first and last names of all persons
+        :return: generator of names
+        """
+
+        for person in self.persons.values():
+            yield person.first_name
+            yield person.last_name
+
+    def get_record(self, pointer, loader=None):
+        """ person or family by pointer
+        :param pointer: pointer of record
+        :param loader: function to load records which are not part of this
+                       tree yet by pointer (e.g. ElementIndex.get), or None
+        :return: Person, Family or None if the record does not exist
+        """
+
+        record = self.persons.get(pointer)
+
+        if record is None:
+            record = self.families.get(pointer)
+
+        if record is None and loader is not None:
+            element = loader(pointer)
+
+            if element is None:
+                return None
+
+            if element.get_tag() == GEDCOM_TAG_INDIVIDUAL:
+                record = self.add_person(element)
+            elif element.get_tag() == GEDCOM_TAG_FAMILY:
+                record = self.add_family(element)
+
+        return record
+
+    def get_relatives(self, person, relations, loader=None):
+        """ persons directly related to a person
+        :param person: Person
+        :param relations: tuple of 'parents', 'children' and/or 'spouses'
+        :param loader: see get_record
+        :return: generator of Person
+        """
+
+        for relation in relations:
+
+            if relation == 'parents':
+                family_pointers = person.parent_families
+            else:
+                family_pointers = person.families
+
+            for family_pointer in family_pointers:
+
+                family = self.get_record(family_pointer, loader)
+                if not isinstance(family, Family):
+                    continue
+
+                if relation == 'children':
+                    pointers = family.children
+                else:
+                    pointers = family.parents
+
+                for pointer in pointers:
+                    relative = self.get_record(pointer, loader)
+                    if isinstance(relative, Person) and relative is not person:
+                        yield relative
+
+    def search(self, root, relations, generations=None, loader=None):
+        """ breadth-first search over family relations
+        :param root: pointer of start person
+        :param relations: relations to follow, see get_relatives
+        :param generations: maximum distance from root, or None for no limit
+        :param loader: see get_record
+        :return: dictionary pointer -> distance from root of found persons
+        """
+
+        distances = {root: 0}
+        queue = collections.deque([self.get_record(root, loader)])
+
+        while len(queue) > 0:
+
+            person = queue.popleft()
+            distance = distances[person.pointer]
+
+            if generations is not None and distance >= generations:
+                continue
+
+            for relative in self.get_relatives(person, relations, loader):
+                if relative.pointer not in distances:
+                    distances[relative.pointer] = distance + 1
+                    queue.append(relative)
+
+        return distances
+
+    def get_subtree(self, root, direction='both', generations=None, loader=None):
+        """ Select persons related to a root person
+        :param root: pointer of root person
+        :param direction: 'ancestors', 'descendants', 'both' (ancestors and
+                          descendants) or 'relatives' (everyone connected by
+                          parent, child or spouse relations). Spouses of
+                          descendants are selected as well.
+        :param generations: maximum number of generations (for relatives:
+                            relations) between root and selected persons, or
+                            None for no limit
+        :param loader: see get_record
+        :return: new FamilyTree with the selected persons and the families
+                 between them, or None on error
+        """
+
+        if direction not in SUBTREE_DIRECTIONS:
+            print(f'Invalid direction {direction}. Must be one of: {", ".join(SUBTREE_DIRECTIONS)}')
+            return None
+
+        if not isinstance(self.get_record(root, loader), Person):
+            print(f'Person {root} not found.')
+            return None
+
+        selected = {}
+        if direction in ('ancestors', 'both'):
+            selected.update(self.search(root, ('parents',), generations, loader))
+        if direction in ('descendants', 'both'):
+            descendants = self.search(root, ('children',), generations, loader)
+            selected.update(descendants)
+            for pointer in descendants:
+                for spouse in self.get_relatives(self.persons[pointer],
+                                                 ('spouses',), loader):
+                    selected[spouse.pointer] = descendants[pointer]
+        if direction == 'relatives':
+            selected.update(self.search(root, ('parents', 'children', 'spouses'),
+                                        generations, loader))
+
+        # families between selected persons which were not visited, e.g. of
+        # siblings at the generation limit, are needed as well
+        for pointer in selected:
+            person = self.persons[pointer]
+            for family_pointer in person.families + person.parent_families:
+                self.get_record(family_pointer, loader)
+
+        return self.get_subset(selected)
+
+    def get_subset(self, pointers):
+        """ Copy part of the tree
+        :param pointers: pointers of the persons to copy
+        :return: new FamilyTree with the given persons and the families which
+                 connect at least two of them
+        """
+
+        subset = FamilyTree()
+
+        for pointer, person in self.persons.items():
+            if pointer in pointers:
+                subset.persons[pointer] = copy.copy(person)
+
+        for pointer, family in self.families.items():
+            if sum(p in pointers for p in family.parents + family.children) > 1:
+                subset.families[pointer] = copy.copy(family)
+
+        # creates new lists of links, so the records of this tree are unchanged
+        subset.resolve_links()
+
+        return subset
+
+    def get_resolved(self):
+        """ Copy the tree without links to records which are not part of it,
+            e.g. records which are not loaded yet
+        :return: new FamilyTree
+        """
+
+        resolved = FamilyTree()
+        resolved.persons = {pointer: copy.copy(person)
+                            for pointer, person in self.persons.items()}
+        resolved.families = {pointer: copy.copy(family)
+                             for pointer, family in self.families.items()}
+
+        # creates new lists of links, so the records of this tree are unchanged
+        resolved.resolve_links()
+
+        return resolved
+
+    def get_generations(self):
+        """ Assign a generation to every person: spouses get the same
+            generation, children a higher generation than their parents.
+            Generations are determined by the longest line of ancestors, then
+            persons without ancestors are moved down next to their children.
+        :return: dictionary pointer -> generation (0 for the oldest)
+        """
+
+        # spouses are treated as one group
+        groups = DisjointSet()
+
+        for pointer in self.persons:
+            groups.add(pointer)
+
+        for family in self.families.values():
+            for parent in family.parents[1:]:
+                groups.union(family.parents[0], parent)
+
+        children = {}
+        n_parents = {}
+
+        for family in self.families.values():
+            if len(family.parents) < 1:
+                continue
+
+            parent_group = groups.find(family.parents[0])
+
+            for child in family.children:
+                child_group = groups.find(child)
+                if child_group != parent_group and \
+                   child_group not in children.setdefault(parent_group, set()):
+                    children[parent_group].add(child_group)
+                    n_parents[child_group] = n_parents.get(child_group, 0) + 1
+
+        # topological order of the groups, loops in the data are broken by
+        # starting from a group whose parents were not all visited yet
+        all_groups = list(dict.fromkeys(groups.find(p) for p in self.persons))
+        generations = {group: 0 for group in all_groups}
+        order = []
+        visited = set()
+
+        for start in itertools.chain((g for g in all_groups if g not in n_parents),
+                                     all_groups):
+
+            if start in visited:
+                continue
+
+            visited.add(start)
+            queue = collections.deque([start])
+
+            while len(queue) > 0:
+                group = queue.popleft()
+                order.append(group)
+
+                for child in children.get(group, ()):
+                    generations[child] = max(generations[child], generations[group] + 1)
+                    n_parents[child] -= 1
+                    if n_parents[child] == 0 and child not in visited:
+                        visited.add(child)
+                        queue.append(child)
+
+        # move groups down towards their children where possible
+        for group in reversed(order):
+            if len(children.get(group, ())) > 0:
+                generations[group] = max(generations[group],
+                                         min(generations[c] for c in children[group]) - 1)
+
+        return {pointer: generations[groups.find(pointer)] for pointer in self.persons}
+
+    def get_components(self, min_persons=1):
+        """ Split tree into unrelated parts, which have no family in common
+        :param min_persons: consecutive small parts are merged until a part
+                            contains at least this many persons
+        :return: list of FamilyTree, which share the Person and Family
+                 objects of this tree
+        """
+
+        components = DisjointSet()
+
+        for pointer in self.persons:
+            components.add(pointer)
+
+        for family in self.families.values():
+            members = family.parents + family.children
+            for member in members[1:]:
+                components.union(members[0], member)
+
+        parts = []
+        part_of_component = {}
+
+        for pointer, person in self.persons.items():
+            component = components.find(pointer)
+
+            if component not in part_of_component:
+                if len(parts) == 0 or len(parts[-1].persons) >= min_persons:
+                    parts.append(FamilyTree())
+                part_of_component[component] = parts[-1]
+
+            part_of_component[component].persons[pointer] = person
+
+        for pointer, family in self.families.items():
+            members = family.parents + family.children
+            if len(members) > 0:
+                part_of_component[components.find(members[0])].families[pointer] = family
+
+        return parts
+
+# persons whose labels are formatted by one worker process at a time, see
+# PersonTable.format_labels
+PERSON_TABLE_CHUNK_SIZE = 2000
+
+# NodeSize and maximum node size of the labels formatted in a forked worker
+# process, see init_label_worker
+label_worker_context = None
+
+def init_label_worker(ns, max_width, max_height):
+    """ Store the label parameters in a worker process of
+        PersonTable.format_labels. The process is forked, so ns is not
+        pickled.
+    """
+
+    global label_worker_context
+    label_worker_context = (ns, max_width, max_height)
+
+def format_labels_chunk(rows):
+    """ Format the labels of rows of a PersonTable in a worker process
+    :param rows: list of (pointer, first name, last name, birth year, death
+                 year, deceased)
+    :return: list of labels
+    """
+
+    ns, max_width, max_height = label_worker_context
+
+    return [format_label(*row, max_width, max_height, ns) for row in rows]
+
+class PersonTable():
+    """ columns of the data of all persons of a family tree needed for their
+        nodes: pointer, node name, gender, names, years, deceased flag and
+        the label fitted to the node size. Built once per render, so nodes
+        are created by iterating over the columns. Can be converted to a
+        dictionary of lists and back, see to_dict and PersonTableCache.
+    """
+
+    # names of the columns, all lists of the same length
+    columns = ('pointers', 'node_names', 'genders', 'first_names', 'last_names',
+               'birth_years', 'death_years', 'deceased', 'labels')
+
+    def __init__(self, persons=()):
+        """
+        :param persons: Person objects, labels are None until format_labels
+                        is run
+        """
+
+        persons = list(persons)
+
+        self.pointers = [person.pointer for person in persons]
+        self.node_names = [person.node_name for person in persons]
+        self.genders = [person.gender for person in persons]
+        self.first_names = [person.first_name for person in persons]
+        self.last_names = [person.last_name for person in persons]
+        self.birth_years = [person.birth_year for person in persons]
+        self.death_years = [person.death_year for person in persons]
+        self.deceased = [person.deceased for person in persons]
+        self.labels = [None] * len(persons)
+
+    def __len__(self):
+        return len(self.pointers)
+
+    def get_rows(self, indices):
+        """ fields of persons needed to format their labels
+        :param indices: indices of the persons in the table
+        :return: list of (pointer, first name, last name, birth year, death
+                 year, deceased), see format_label
+        """
+
+        return [(self.pointers[i], self.first_names[i], self.last_names[i],
+                 self.birth_years[i], self.death_years[i], self.deceased[i])
+                for i in indices]
+
+    def format_labels(self, max_width, max_height, ns, n_processes=None):
+        """ Format the labels of all persons without label. Tables with more
+            than PERSON_TABLE_CHUNK_SIZE missing labels are formatted in
+            chunks by forked worker processes.
+        :param max_width: maximum width of node
+        :param max_height: maximum height of node
+        :param ns: NodeSize object, needed to truncate node text
+        :param n_processes: number of worker processes, default is the
+                            number of CPUs
+        :return: number of formatted labels
+        """
+
+        missing = [i for i, label in enumerate(self.labels) if label is None]
+
+        if n_processes is None:
+            n_processes = os.cpu_count() or 1
+
+        chunks = [missing[i:i + PERSON_TABLE_CHUNK_SIZE]
+                  for i in range(0, len(missing), PERSON_TABLE_CHUNK_SIZE)]
+
+        if len(chunks) > 1 and n_processes > 1 and can_fork():
+            import multiprocessing
+            import concurrent.futures
+
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=min(n_processes, len(chunks)),
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=init_label_worker,
+                    initargs=(ns, max_width, max_height)) as executor:
+                results = executor.map(format_labels_chunk,
+                                       [self.get_rows(chunk) for chunk in chunks])
+                for chunk, labels in zip(chunks, results):
+                    for i, label in zip(chunk, labels):
+                        self.labels[i] = label
+        else:
+            for i, row in zip(missing, self.get_rows(missing)):
+                self.labels[i] = format_label(*row, max_width, max_height, ns)
+
+        return len(missing)
+
+    def to_dict(self):
+        """ columns of the table, e.g. to store them as json
+        :return: dictionary column name -> list
+        """
+
+        return {column: getattr(self, column) for column in self.columns}
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Create table from the columns returned by to_dict
+        :param data: dictionary column name -> list
+        :return: PersonTable, or None if columns are missing or differ in
+                 length
+        """
+
+        if any(not isinstance(data.get(column), list) for column in cls.columns) or \
+           len(set(len(data[column]) for column in cls.columns)) != 1:
+            return None
+
+        table = cls()
+        for column in cls.columns:
+            setattr(table, column, data[column])
+
+        return table
+
+    def reuse_labels(self, other):
+        """ Take the labels of persons whose names and years are the same in
+            another table, e.g. a cached table of the previous version of the
+            file
+        :param other: PersonTable with labels fitted to the same node size
+        :return: number of reused labels
+        """
+
+        labels = {row[0]: (row, label) for row, label in
+                  zip(other.get_rows(range(len(other))), other.labels)}
+
+        n_reused = 0
+        for i, row in enumerate(self.get_rows(range(len(self)))):
+            row_label = labels.get(row[0])
+            if self.labels[i] is None and row_label is not None and \
+               row_label[1] is not None and tuple(row_label[0]) == row:
+                self.labels[i] = row_label[1]
+                n_reused += 1
+
+        return n_reused
+
+def parse_record(data):
+    """ Parse a single gedcom record
+    :param data: bytes of the record, starting with its level 0 line
+    :return: python-gedcom element or None if data contains no record
+    """
+
+    parser = Parser()
+    parser.parse(data.splitlines(keepends=True), False)
+    elements = parser.get_root_child_elements()
+
+    if len(elements) < 1:
+        return None
+
+    return elements[0]
+
+class StreamElement():
+    """ Lightweight gedcom element created by GedcomStreamReader. Provides
+        the getters of python-gedcom elements used by FamilyTree.
+    """
+
+    __slots__ = ('level', 'pointer', 'tag', 'value', 'crlf', 'children')
+
+    def __init__(self, level, pointer, tag, value, crlf):
+
+        self.level = level
+        self.pointer = pointer
+        self.tag = tag
+        self.value = value
+        self.crlf = crlf
+        self.children = []
+
+    def get_level(self):
+        return self.level
+
+    def get_pointer(self):
+        return self.pointer
+
+    def get_tag(self):
+        return self.tag
+
+    def get_value(self):
+        return self.value
+
+    def get_child_elements(self):
+        return self.children
+
+    def __str__(self):
+        """ first line of the element, like str() of python-gedcom elements
+        """
+
+        ret = str(self.level)
+        if self.pointer != '':
+            ret += ' ' + self.pointer
+        ret += ' ' + self.tag
+        if self.value != '':
+            ret += ' ' + self.value
+
+        return ret + self.crlf
+
+class GedcomStreamReader():
+    """ Reads a gedcom file line by line and keeps only the records and tags
+        needed for plotting. Everything else is skipped and only its position
+        in the file is recorded, so it can be loaded later on demand (e.g. for
+        tooltips).
+    """
+
+    # tags kept for each record type, and their sub tags which are kept
+    KEPT_TAGS = {GEDCOM_TAG_INDIVIDUAL: {GEDCOM_TAG_NAME: (GEDCOM_TAG_GIVEN_NAME,
+                                                           GEDCOM_TAG_SURNAME),
+                                         GEDCOM_TAG_SEX: (),
+                                         GEDCOM_TAG_BIRTH: (GEDCOM_TAG_DATE,),
+                                         GEDCOM_TAG_DEATH: (GEDCOM_TAG_DATE,),
+                                         GEDCOM_TAG_FAMILY_SPOUSE: (),
+                                         GEDCOM_TAG_FAMILY_CHILD: ()},
+                 GEDCOM_TAG_FAMILY: {GEDCOM_TAG_HUSBAND: (),
+                                     GEDCOM_TAG_WIFE: (),
+                                     GEDCOM_TAG_CHILD: (),
+                                     GEDCOM_TAG_MARRIAGE: (GEDCOM_TAG_DATE,),
+                                     'DIV': (GEDCOM_TAG_DATE, 'TYPE')}}
+
+    LINE_REGEX = re.compile(r'^(0|[1-9]+[0-9]*) (@[^@]+@ |)([A-Za-z0-9_]+)( [^\n\r]*|)([\r\n]{0,2})$')
+
+    def __init__(self, gedcom_filename):
+        """
+        :param gedcom_filename: name of input gedcom file
+        """
+
+        self.gedcom_filename = gedcom_filename
+
+        # pointer -> (byte offset, length) of level 0 records
+        self.record_offsets = {}
+        # pointer -> list of (byte offset, length) of skipped sub trees of
+        # INDI and FAM records
+        self.skipped_offsets = {}
+
+    def read(self):
+        """ Read file and build FamilyTree
+        :return: FamilyTree
+        """
+
+        tree = FamilyTree()
+
+        record = None
+        record_pointer = None
+        record_offset = 0
+        stack = []
+        skip_level = None
+
+        offset = 0
+
+        with open(self.gedcom_filename, 'rb') as f:
+            for raw_line in itertools.chain(f, [b'0 TRLR\n']):
+
+                line = raw_line.decode('utf-8-sig')
+                match = self.LINE_REGEX.match(line)
+
+                if match is None:
+                    # e.g. continuation of a text without level and tag
+                    level = None
+                else:
+                    level = int(match.group(1))
+
+                if level == 0:
+                    # finish previous record
+                    if record_pointer:
+                        self.record_offsets[record_pointer] = (record_offset,
+                                                               offset - record_offset)
+                    if record is not None:
+                        if record.tag == GEDCOM_TAG_INDIVIDUAL:
+                            tree.add_person(record)
+                        else:
+                            tree.add_family(record)
+
+                    record_pointer = match.group(2).rstrip(' ')
+                    record_offset = offset
+                    record = None
+                    skip_level = None
+
+                    if match.group(3) in self.KEPT_TAGS:
+                        record = StreamElement(0, record_pointer, match.group(3),
+                                               match.group(4)[1:],
+                                               match.group(5) or '\n')
+                        stack = [record]
+
+                elif record is not None:
+
+                    if level is None:
+                        # lines which are not valid gedcom lines are skipped,
+                        # the following lines are read as usual
+                        pass
+
+                    elif skip_level is None or level <= skip_level:
+                        skip_level = None
+
+                        while len(stack) > level:
+                            stack.pop()
+
+                        tag = match.group(3)
+                        if len(stack) != level or level > 2:
+                            kept = False
+                        elif level == 1:
+                            kept = tag in self.KEPT_TAGS[record.tag]
+                        else:
+                            kept = tag in self.KEPT_TAGS[record.tag][stack[1].tag]
+
+                        if kept:
+                            element = StreamElement(level, match.group(2).rstrip(' '),
+                                                    tag, match.group(4)[1:],
+                                                    match.group(5) or '\n')
+                            stack[-1].children.append(element)
+                            stack.append(element)
+                        else:
+                            skip_level = level
+
+                    if skip_level is not None or level is None:
+                        self.add_skipped(record_pointer, offset, len(raw_line))
+
+                offset += len(raw_line)
+
+        tree.resolve_links()
+
+        return tree
+
+    def add_skipped(self, pointer, offset, length):
+        """ record skipped bytes, merged with directly preceding skipped bytes
+        """
+
+        ranges = self.skipped_offsets.setdefault(pointer, [])
+
+        if len(ranges) > 0 and sum(ranges[-1]) == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+
+    def load_record(self, pointer):
+        """ Load a complete record from the file, including all skipped parts
+        :param pointer: pointer of record
+        :return: python-gedcom element or None if there is no such record
+        """
+
+        if pointer not in self.record_offsets:
+            return None
+
+        offset, length = self.record_offsets[pointer]
+
+        with open(self.gedcom_filename, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+
+        return parse_record(data)
+
+# version of the on-disk format of RecordIndexCache entries
+RECORD_INDEX_VERSION = 2
+
+class RecordIndexCache(FileCache):
+    """ persistent on-disk cache of record indexes, see RecordIndex. There is
+        one entry per gedcom file, which is replaced when the file changes.
+    """
+
+    name = 'records'
+    version = RECORD_INDEX_VERSION
+
+    @staticmethod
+    def get_key(gedcom_filename):
+        """ Determine cache key of the record index of a gedcom file
+        :param gedcom_filename: name of gedcom file
+        :return: cache key as hex string
+        """
+
+        return hashlib.sha256(os.path.abspath(gedcom_filename).encode('utf-8')).hexdigest()
+
+    def describe(self, entry):
+        """ Summary of a record index, see FileCache.entries
+        """
+
+        return {'gedcom_filename': entry.get('gedcom_filename'),
+                'n_records': len(entry.get('records', {}))}
+
+class RecordIndex():
+    """ Byte offsets of all level 0 records of a gedcom file by pointer, so
+        single records can be loaded without parsing the whole file. The index
+        is stored in a RecordIndexCache and reused as long as size and
+        modification time of the gedcom file do not change.
+    """
+
+    RECORD_REGEX = re.compile(rb'^0 (?:(@[^@\r\n]+@) )?([A-Za-z0-9_]+)', re.MULTILINE)
+
+    def __init__(self, gedcom_filename, cache=None):
+        """
+        :param gedcom_filename: name of input gedcom file
+        :param cache: RecordIndexCache used to store the index between runs,
+                      default is a RecordIndexCache in the default cache
+                      directory
+        """
+
+        self.gedcom_filename = gedcom_filename
+
+        if cache is None:
+            cache = RecordIndexCache()
+
+        self.cache = cache
+
+        # pointer -> (byte offset, length, tag)
+        self.records = {}
+
+    def get_file_state(self):
+        """ size and modification time of the gedcom file
+        """
+
+        stat = os.stat(self.gedcom_filename)
+
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def open(self):
+        """ Load index from the cache, or build and store it if there is no
+            entry for the gedcom file or it is outdated
+        :return: True if the cached index was reused
+        """
+
+        key = self.cache.get_key(self.gedcom_filename)
+        entry = self.cache.load(key)
+
+        if entry is not None and entry.get('file') == self.get_file_state():
+            self.records = {pointer: tuple(record)
+                            for pointer, record in entry['records'].items()}
+            return True
+
+        self.build()
+        self.cache.save(key, {'gedcom_filename': os.path.abspath(self.gedcom_filename),
+                              'file': self.get_file_state(),
+                              'records': self.records})
+
+        return False
+
+    def build(self):
+        """ Scan gedcom file for level 0 records
+        """
+
+        self.records = {}
+
+        with open(self.gedcom_filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+                pointer = None
+                tag = None
+                offset = 0
+
+                for match in self.RECORD_REGEX.finditer(data):
+                    if pointer is not None:
+                        self.records[pointer] = (offset, match.start() - offset, tag)
+
+                    pointer = match.group(1)
+                    if pointer is not None:
+                        pointer = pointer.decode('utf-8')
+                    tag = match.group(2).decode('utf-8')
+                    offset = match.start()
+
+                if pointer is not None:
+                    self.records[pointer] = (offset, len(data) - offset, tag)
+
+    def get_hashes(self):
+        """ Hash the content of every record, e.g. to find records which
+            changed since a previous run
+        :return: dictionary pointer -> hex digest of the record
+        """
+
+        hashes = {}
+
+        with open(self.gedcom_filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return hashes
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for pointer, (offset, length, _) in self.records.items():
+                    hashes[pointer] = hashlib.sha256(data[offset:offset + length]).hexdigest()
+
+        return hashes
+
+    def get_pointers(self, tag=None):
+        """ pointers of all records in order of the gedcom file
+        :param tag: only return records with this tag, e.g. 'INDI'
+        :return: list of pointers
+        """
+
+        return [pointer for pointer, record in self.records.items()
+                if tag is None or record[2] == tag]
+
+    def load_record(self, pointer):
+        """ Load and parse a single record
+        :param pointer: pointer of record
+        :return: python-gedcom element or None if there is no such record
+        """
+
+        if pointer not in self.records:
+            return None
+
+        offset, length, _ = self.records[pointer]
+
+        with open(self.gedcom_filename, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+
+        return parse_record(data)
+
+class DisjointSet():
+    """ Disjoint-set (union-find) structure with path compression and union
+        by rank, used to merge clusters of spouses and to find unrelated
+        parts of the family tree
+    """
+
+    def __init__(self):
+
+        self.parents = {}
+        self.ranks = {}
+
+    def __iter__(self):
+        """ iterate over all items in order of insertion
+        """
+        return iter(self.parents)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, item):
+        """ add item as its own set, if it is not already present
+        """
+
+        if item not in self.parents:
+            self.parents[item] = item
+            self.ranks[item] = 0
+
+    def find(self, item):
+        """ representative of the set containing item
+        """
+
+        self.add(item)
+
+        root = item
+        while self.parents[root] != root:
+            root = self.parents[root]
+
+        # path compression
+        while self.parents[item] != root:
+            self.parents[item], item = root, self.parents[item]
+
+        return root
+
+    def union(self, item1, item2):
+        """ merge the sets containing item1 and item2
+        :return: representative of the merged set
+        """
+
+        root1 = self.find(item1)
+        root2 = self.find(item2)
+
+        if root1 == root2:
+            return root1
+
+        if self.ranks[root1] < self.ranks[root2]:
+            root1, root2 = root2, root1
+
+        self.parents[root2] = root1
+        if self.ranks[root1] == self.ranks[root2]:
+            self.ranks[root1] += 1
+
+        return root1
+
+def quote_dot(value, key=None):
+    """ Quote attribute value or name for the dot language, like pygraphviz
+        sets them: values of labels enclosed in <> are HTML-like labels
+    :param value: value, converted to string
+    :param key: attribute name
+    :return: quoted string
+    """
+
+    value = str(value)
+
+    if key == 'label' and value[:1] == '<' and value[-1:] == '>':
+        return value
+
+    return '"' + value.replace('"', '\\"') + '"'
+
+class DotGraph():
+    """ Graph written directly as dot source, with the part of the interface
+        of pygraphviz.AGraph used by GedcomPlotter.build_graph. Attributes
+        shared by most nodes and edges are written once as defaults, so only
+        differing attributes are written per node and edge. Much faster than
+        setting every attribute through pygraphviz for large graphs.
+    """
+
+    def __init__(self, node_attributes=None, edge_attributes=None,
+                 **graph_attributes):
+        """
+        :param node_attributes: default attributes of nodes
+        :param edge_attributes: default attributes of edges
+        :param graph_attributes: attributes of the graph
+        """
+
+        self.node_attributes = {key: str(value) for key, value in (node_attributes or {}).items()}
+        self.edge_attributes = {key: str(value) for key, value in (edge_attributes or {}).items()}
+
+        self.lines = ['strict graph "" {']
+        for defaults, attributes in (('graph', graph_attributes),
+                                     ('node', self.node_attributes),
+                                     ('edge', self.edge_attributes)):
+            if len(attributes) > 0:
+                self.lines.append(f'{defaults} {self.format_attributes(attributes)};')
+
+        # (tail, head) by unordered pair, the graph is strict
+        self.edge_keys = {}
+        # node -> edges of node, and cluster name -> nodes, see add_cluster
+        self.node_edges = collections.defaultdict(list)
+        self.clusters = {}
+
+    @staticmethod
+    def format_attributes(attributes, defaults=None):
+        """ dot attribute list of the attributes which differ from defaults.
+            Defaults not given in attributes are reset. Like pygraphviz,
+            None is written as 'None'.
+        """
+
+        if defaults is None:
+            defaults = {}
+
+        items = []
+        for key, value in attributes.items():
+            value = str(value)
+            if value != defaults.get(key):
+                items.append(f'{key}={quote_dot(value, key)}')
+
+        for key, value in defaults.items():
+            if value != '' and key not in attributes:
+                items.append(f'{key}=""')
+
+        return '[' + ', '.join(items) + ']'
+
+    def add_node(self, name, **attributes):
+        """ add node, like pygraphviz.AGraph.add_node
+        """
+
+        self.lines.append(f'{quote_dot(name)} {self.format_attributes(attributes, self.node_attributes)};')
+
+    def add_edge(self, tail, head, **attributes):
+        """ add edge, like pygraphviz.AGraph.add_edge
+        """
+
+        key = frozenset((tail, head))
+        if key in self.edge_keys:
+            # the graph is strict, attributes of the existing edge are
+            # updated, like with pygraphviz
+            defaults = None
+        else:
+            defaults = self.edge_attributes
+            self.edge_keys[key] = (tail, head)
+            self.node_edges[tail].append((tail, head))
+            if head != tail:
+                self.node_edges[head].append((tail, head))
+
+        self.lines.append(f'{quote_dot(tail)} -- {quote_dot(head)} '
+                          f'{self.format_attributes(attributes, defaults)};')
+
+    def add_cluster(self, nodes, name, **attributes):
+        """ add nodes to a subgraph and the edges between its nodes, see
+            add_cluster
+        """
+
+        members = self.clusters.setdefault(name, set())
+        members.update(nodes)
+
+        edges = {edge for node in members for edge in self.node_edges[node]
+                 if edge[0] in members and edge[1] in members}
+
+        self.lines.append(f'subgraph {quote_dot(name)} {{')
+        self.lines.append(f'graph {self.format_attributes(attributes)};')
+        self.lines.extend(f'{quote_dot(node)};' for node in nodes)
+        self.lines.extend(f'{quote_dot(tail)} -- {quote_dot(head)};'
+                          for tail, head in sorted(edges))
+        self.lines.append('}')
+
+    def edges(self):
+        """ list of (tail, head) of all edges
+        """
+
+        return list(self.edge_keys.values())
+
+    def string(self):
+        """ graph in dot format
+        """
+
+        return '\n'.join(self.lines) + '\n}\n'
+
+    def to_agraph(self):
+        """ pygraphviz graph parsed from the dot source
+        """
+
+        return pgv.AGraph(string=self.string())
+
+def add_cluster(graph, nodes, name, **attributes):
+    """ Add nodes to a subgraph, like graph.add_subgraph(nodes, name,
+        **attributes). pygraphviz checks all edges of the graph for the
+        induced subgraph, here only the edges of the subgraph's nodes are
+        checked, so adding a cluster for every couple takes linear time.
+    :param graph: pygraphviz graph or DotGraph
+    :param nodes: names of nodes to add to the subgraph
+    :param name: name of subgraph, it is created if it does not exist
+    :param attributes: attributes of subgraph
+    :return: subgraph, or None for a DotGraph
+    """
+
+    if isinstance(graph, DotGraph):
+        return graph.add_cluster(nodes, name, **attributes)
+
+    cluster = graph.add_subgraph(name=name, **attributes)
+
+    for node in nodes:
+        cluster.add_node(node)
+
+    members = set(cluster.nodes())
+
+    for u, v in graph.edges(list(members)):
+        if u in members and v in members:
+            cluster.add_edge(u, v)
+
+    return cluster
+
+# layout engines of GedcomPlotter.create_graph
+LAYOUT_ENGINES = ('dot', 'partitioned', 'banded')
+
+# how GedcomPlotter.build_graph creates graphs: node by node with
+# pygraphviz, or by writing dot source (see DotGraph)
+GRAPH_BACKENDS = ('pygraphviz', 'dot')
+
+# unrelated families are laid out together in parts of at least this many
+# persons by the partitioned layout
+MIN_PERSONS_PER_PART = 100
+
+# number of generations per band of the banded layout, and minimum number of
+# persons per part of a band
+BAND_GENERATIONS = 4
+MIN_PERSONS_PER_BAND_PART = 20
+
+def translate_points(value, dx, dy):
+    """ Translate coordinates of a graphviz position attribute, e.g. node
+        positions '10,20', edge splines 'e,10,20 10,30 12,40' or bounding
+        boxes '0,0,100,200'
+    :param value: attribute value
+    :param dx: translation in x direction (points)
+    :param dy: translation in y direction (points)
+    :return: translated attribute value
+    """
+
+    def translate(point):
+        prefix = ''
+        if point[:2] in ('e,', 's,'):
+            prefix, point = point[:2], point[2:]
+
+        coordinates = point.split(',')
+        for i in range(0, len(coordinates) - 1, 2):
+            coordinates[i] = f'{float(coordinates[i]) + dx:.2f}'
+            coordinates[i + 1] = f'{float(coordinates[i + 1].rstrip("!")) + dy:.2f}'
+
+        return prefix + ','.join(coordinates)
+
+    return ';'.join(' '.join(translate(point) for point in spline.split())
+                    for spline in value.split(';'))
+
+# attributes of nodes, edges and clusters set by the layout
+LAYOUT_ATTRIBUTES = ('pos', 'width', 'height', 'lp', 'xlp', 'head_lp', 'tail_lp')
+
+# layout attributes which contain coordinates
+POSITION_ATTRIBUTES = ('pos', 'lp', 'xlp', 'head_lp', 'tail_lp', 'bb')
+
+def layout_dot_string(dot_string, prog='dot'):
+    """ Lay out a graph given in dot format. Runs in worker processes of
+        layout_partitioned.
+    :param dot_string: graph in dot format
+    :param prog: graphviz layout program
+    :return: laid out graph in dot format
+    """
+
+    graph = pgv.AGraph(string=dot_string)
+    run_layout(graph, prog)
+
+    return graph.string()
+
+def pack_components(layouts, rankdir, gap):
+    """ Place laid out components next to each other, like dot does for
+        disconnected components: in a row across the rank direction, with
+        their first ranks aligned.
+    :param layouts: list of laid out pygraphviz graphs
+    :param rankdir: rank direction of the graph, e.g. 'TB'
+    :param gap: distance between components in points
+    :return: list of (dx, dy) translations of the components
+    """
+
+    boxes = [[float(v) for v in layout.graph_attr['bb'].split(',')]
+             for layout in layouts]
+
+    widths = [x1 - x0 for x0, y0, x1, y1 in boxes]
+    heights = [y1 - y0 for x0, y0, x1, y1 in boxes]
+
+    offsets = []
+
+    if rankdir in ('TB', 'BT'):
+        height = max(heights)
+        x = 0
+        for (x0, y0, x1, y1), width in zip(boxes, widths):
+            # first rank is at the top for TB and at the bottom for BT
+            dy = height - y1 if rankdir == 'TB' else -y0
+            offsets.append((x - x0, dy))
+            x += width + gap
+    else:
+        width = max(widths)
+        y = sum(heights) + gap * (len(boxes) - 1)
+        for (x0, y0, x1, y1), height in zip(boxes, heights):
+            # first rank is on the left for LR and on the right for RL
+            dx = -x0 if rankdir == 'LR' else width - x1
+            y -= height
+            offsets.append((dx, y - y0))
+            y -= gap
+
+    return offsets
+
+def to_rank_coordinates(x, y, rankdir):
+    """ Convert graph coordinates to coordinates along the ranks (order) and
+        across the ranks (rank, increasing from the first rank)
+    :return: tuple of order and rank coordinate
+    """
+
+    if rankdir == 'TB':
+        return x, -y
+    if rankdir == 'BT':
+        return x, y
+    if rankdir == 'LR':
+        return -y, x
+    return -y, -x
+
+def from_rank_coordinates(order, rank, rankdir):
+    """ Inverse of to_rank_coordinates
+    :return: tuple of x and y coordinate
+    """
+
+    if rankdir == 'TB':
+        return order, -rank
+    if rankdir == 'BT':
+        return order, rank
+    if rankdir == 'LR':
+        return rank, -order
+    return -rank, -order
+
+def stitch_bands(family_tree, parts, layouts, generations, rankdir, gap):
+    """ Place the laid out parts of generation bands. Every generation gets
+        a fixed rank coordinate within its band, and parts are placed next to
+        the parents of their members in the bands of older generations,
+        without overlapping other parts of the same band. A band is moved
+        away from the band above it if one of its parts would reach into the
+        ranks of the parts above.
+    :param family_tree: complete FamilyTree
+    :param parts: list of (band, FamilyTree) of the parts
+    :param layouts: laid out graphs of the parts
+    :param generations: generations of all persons, see
+                        FamilyTree.get_generations
+    :param rankdir: rank direction of the graph, e.g. 'TB'
+    :param gap: minimum distance between parts in points
+    :return: list of (dx, dy) translations of the parts
+    """
+
+    def get_position(layout, node_name):
+        x, y = layout.get_node(node_name).attr['pos'].split(',')[:2]
+        return to_rank_coordinates(float(x), float(y.rstrip('!')), rankdir)
+
+    # rank coordinates of the generations in each part, and the distance of
+    # consecutive generations
+    part_ranks = []
+    pitch = 0
+
+    # bounding boxes of the parts: order_min, order_max, rank_min, rank_max
+    extents = []
+
+    for (band, part), layout in zip(parts, layouts):
+        x0, y0, x1, y1 = [float(v) for v in layout.graph_attr['bb'].split(',')]
+        corners = (to_rank_coordinates(x0, y0, rankdir),
+                   to_rank_coordinates(x1, y1, rankdir))
+        extents.append((min(c[0] for c in corners), max(c[0] for c in corners),
+                        min(c[1] for c in corners), max(c[1] for c in corners)))
+
+        ranks = {}
+        for person in part.persons.values():
+            ranks.setdefault(generations[person.pointer], []).append(
+                get_position(layout, person.node_name)[1])
+
+        # edges point from children to parents, so older generations have
+        # higher ranks
+        ranks = {g: sum(r) / len(r) for g, r in ranks.items()}
+        for g in ranks:
+            if g + 1 in ranks:
+                pitch = max(pitch, ranks[g] - ranks[g + 1])
+
+        part_ranks.append(ranks)
+
+    ranksep = float(layouts[0].graph_attr.get('ranksep') or 0.5) * 72
+
+    if pitch == 0:
+        # no part contains two generations: persons and pair nodes in
+        # separate ranks
+        node_height = max(float(n.attr['height'] or 0) for n in layouts[0].nodes_iter())
+        pitch = 2 * (node_height * 72 + ranksep)
+
+    # order coordinates of placed nodes
+    positions = {}
+    offsets = [None] * len(parts)
+
+    # shift of the current band away from older bands, and the lowest rank
+    # coordinate of the parts of the band above
+    band_shift = 0
+    band_above_min = None
+
+    for band in sorted(set(band for band, part in parts)):
+
+        # the first generation of each part is placed at the rank of its
+        # generation. Younger generations have lower rank coordinates.
+        d_ranks = {}
+        for i, (part_band, part) in enumerate(parts):
+            if part_band == band:
+                first_generation = min(part_ranks[i])
+                d_ranks[i] = band_shift - first_generation * pitch - \
+                             part_ranks[i][first_generation]
+
+        if band_above_min is not None:
+            overlap = max(extents[i][3] + d_rank for i, d_rank in d_ranks.items()) - \
+                      (band_above_min - ranksep)
+            if overlap > 0:
+                band_shift -= overlap
+                d_ranks = {i: d_rank - overlap for i, d_rank in d_ranks.items()}
+
+        band_above_min = min(extents[i][2] + d_rank for i, d_rank in d_ranks.items())
+
+        placements = []
+
+        for i, ((part_band, part), layout) in enumerate(zip(parts, layouts)):
+
+            if part_band != band:
+                continue
+
+            # parents of the persons of this part which are already placed
+            samples = []
+            for person in part.persons.values():
+                for family_pointer in family_tree.persons[person.pointer].parent_families:
+
+                    family = family_tree.families[family_pointer]
+
+                    if len(family.parents) > 1:
+                        anchors = (family.node_name,)
+                    else:
+                        anchors = [family_tree.persons[p].node_name for p in family.parents]
+
+                    for anchor in anchors:
+                        if anchor in positions:
+                            samples.append(positions[anchor] -
+                                           get_position(layout, person.node_name)[0])
+
+            desired = sum(samples) / len(samples) if len(samples) > 0 else None
+            placements.append((desired is None, desired or 0, i))
+
+        # parts without parents in the bands above are appended at the end
+        placements.sort()
+
+        cursor = None
+        for no_parents, desired, i in placements:
+
+            layout = layouts[i]
+            order_min, order_max = extents[i][:2]
+
+            if no_parents:
+                d_order = -order_min if cursor is None else cursor - order_min
+            else:
+                d_order = desired
+            if cursor is not None and order_min + d_order < cursor:
+                d_order = cursor - order_min
+            cursor = order_max + d_order + gap
+
+            offsets[i] = from_rank_coordinates(d_order, d_ranks[i], rankdir)
+
+            for node in layout.nodes_iter():
+                positions[str(node)] = get_position(layout, node)[0] + d_order
+
+    return offsets
+
+def copy_layout(source, target, dx, dy):
+    """ Copy layout attributes of a laid out item to the same item of
+        another graph, translating all coordinates
+    :param source: attributes of laid out node or edge
+    :param target: attributes of node or edge in target graph
+    :param dx: translation in x direction (points)
+    :param dy: translation in y direction (points)
+    """
+
+    for key in LAYOUT_ATTRIBUTES:
+        value = source.get(key)
+        if value:
+            if key in POSITION_ATTRIBUTES:
+                value = translate_points(value, dx, dy)
+            target[key] = value
+
+def layout_parts(parts, n_processes=None):
+    """ Lay out graphs with dot in parallel processes
+    :param parts: pygraphviz graphs without layout
+    :param n_processes: number of worker processes, default is the number
+                        of CPUs
+    :return: list of laid out pygraphviz graphs
+    """
+
+    import concurrent.futures
+
+    dot_strings = [part.string() for part in parts]
+
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+
+    if len(parts) == 1 or n_processes == 1:
+        results = [layout_dot_string(s) for s in dot_strings]
+    else:
+        # layouts in worker processes are not counted there
+        profiler.count('dot_layouts', len(dot_strings))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_processes) as executor:
+            results = list(executor.map(layout_dot_string, dot_strings))
+
+    return [pgv.AGraph(string=result) for result in results]
+
+def get_graph_label_size(graph):
+    """ Size of the label of a graph, as placed by dot. An empty copy of the
+        graph, parsed from its dot source so HTML labels remain HTML, is
+        laid out.
+    :param graph: pygraphviz graph with label
+    :return: (width, height) of the label, including its margin (points),
+             and the lwidth and lheight attributes set by dot
+    """
+
+    H = pgv.AGraph(graph.string())
+    for subgraph in H.subgraphs():
+        H.remove_subgraph(subgraph.name)
+    H.delete_nodes_from(H.nodes())
+
+    run_layout(H)
+
+    x0, y0, x1, y1 = [float(v) for v in H.graph_attr['bb'].split(',')]
+
+    return x1 - x0, y1 - y0, H.graph_attr['lwidth'], H.graph_attr['lheight']
+
+def apply_layouts(graph, layouts, offsets):
+    """ Copy the layouts of parts of a graph to the graph. Edges between
+        parts have no layout, they are routed when the graph is drawn. The
+        graph label is placed below or above the parts (see labelloc).
+    :param graph: strict pygraphviz graph, positions are stored in its
+                  attributes
+    :param layouts: laid out parts of graph
+    :param offsets: list of (dx, dy) translations of the parts
+    :raise ValueError: if graph is not strict
+    """
+
+    # edges of the parts are found by their nodes, which only identify an
+    # edge in strict graphs
+    if not graph.is_strict():
+        raise ValueError('Layouts of parts can only be applied to strict graphs.')
+
+    # clusters of the parts are named independently of graph
+    clusters = {}
+    for cluster in graph.subgraphs_iter():
+        for node in cluster.nodes_iter():
+            clusters[str(node)] = cluster
+
+    boxes = []
+
+    for layout, (dx, dy) in zip(layouts, offsets):
+
+        for node in layout.nodes_iter():
+            copy_layout(node.attr, graph.get_node(node).attr, dx, dy)
+
+        for edge in layout.edges_iter():
+            copy_layout(edge.attr, graph.get_edge(edge[0], edge[1]).attr, dx, dy)
+
+        for cluster in layout.subgraphs_iter():
+            members = cluster.nodes()
+            if cluster.graph_attr.get('bb') and len(members) > 0:
+                clusters[str(members[0])].graph_attr['bb'] = \
+                    translate_points(cluster.graph_attr['bb'], dx, dy)
+
+        boxes.append([float(v) for v in
+                      translate_points(layout.graph_attr['bb'], dx, dy).split(',')])
+
+    bb = [min(b[0] for b in boxes), min(b[1] for b in boxes),
+          max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+    if graph.graph_attr.get('label'):
+        width, height, lwidth, lheight = get_graph_label_size(graph)
+
+        bb[2] = max(bb[2], bb[0] + width)
+
+        labeljust = (graph.graph_attr.get('labeljust') or 'c')[:1].lower()
+        if labeljust == 'l':
+            x = bb[0] + width / 2
+        elif labeljust == 'r':
+            x = bb[2] - width / 2
+        else:
+            x = (bb[0] + bb[2]) / 2
+
+        # the label of the root graph is at the bottom by default
+        if (graph.graph_attr.get('labelloc') or 'b')[:1].lower() == 't':
+            y = bb[3] + height / 2
+            bb[3] += height
+        else:
+            y = bb[1] - height / 2
+            bb[1] -= height
+
+        graph.graph_attr.update(lp=f'{x:.2f},{y:.2f}', lwidth=lwidth, lheight=lheight)
+
+    graph.graph_attr['bb'] = ','.join(f'{v:.2f}' for v in bb)
+    graph.has_layout = True
+
+def layout_partitioned(graph, parts, n_processes=None):
+    """ Lay out parts of a graph in parallel dot processes and pack them
+    :param graph: pygraphviz graph, positions are stored in its attributes
+    :param parts: unrelated parts of graph, as pygraphviz graphs without
+                  layout. Together, they contain all nodes and edges of graph.
+    :param n_processes: number of worker processes, default is the number
+                        of CPUs
+    """
+
+    layouts = layout_parts(parts, n_processes)
+
+    rankdir = graph.graph_attr.get('rankdir') or 'TB'
+    gap = float(graph.graph_attr.get('nodesep') or 0.25) * 72
+
+    offsets = pack_components(layouts, rankdir, gap)
+
+    apply_layouts(graph, layouts, offsets)
+
+# version of the on-disk format of LayoutCache entries. Increase whenever the
+# layout engines change, to invalidate old entries.
+LAYOUT_CACHE_VERSION = 2
+
+# edge attributes which do not influence the layout
+NON_GEOMETRIC_EDGE_ATTRIBUTES = NON_GEOMETRIC_NODE_ATTRIBUTES + ('style', 'penwidth')
+
+# attributes of graphs and clusters set by the layout
+GRAPH_LAYOUT_ATTRIBUTES = ('bb', 'lp', 'lwidth', 'lheight')
+
+# maximum number of cached layouts, see FileCache.prune
+LAYOUT_CACHE_MAX_ENTRIES = 20
+
+class LayoutCache(FileCache):
+    """ persistent on-disk cache of laid out graphs. Graphs which only differ
+        in attributes that do not influence the layout (e.g. fill colors)
+        share the same entry.
+    """
+
+    name = 'layout'
+    version = LAYOUT_CACHE_VERSION
+    max_entries = LAYOUT_CACHE_MAX_ENTRIES
+
+    @staticmethod
+    def get_key(graph, layout_engine='dot'):
+        """ Determine cache key of the layout of a graph
+        :param graph: pygraphviz graph without layout
+        :param layout_engine: layout engine, see GedcomPlotter.create_graph
+        :return: cache key as hex string
+        """
+
+        key_hash = hashlib.sha256()
+
+        def update(*items):
+            key_hash.update(json.dumps(items, ensure_ascii=False).encode('utf-8'))
+            key_hash.update(b'\n')
+
+        def geometric(attributes, ignored):
+            return sorted((key, value) for key, value in attributes.items()
+                          if value and key not in ignored)
+
+        update(LAYOUT_CACHE_VERSION, get_graphviz_version(), layout_engine,
+               MIN_PERSONS_PER_PART, BAND_GENERATIONS, MIN_PERSONS_PER_BAND_PART)
+
+        update(geometric(graph.graph_attr, NON_GEOMETRIC_NODE_ATTRIBUTES),
+               geometric(graph.node_attr, NON_GEOMETRIC_NODE_ATTRIBUTES),
+               geometric(graph.edge_attr, NON_GEOMETRIC_EDGE_ATTRIBUTES))
+
+        for node in graph.nodes_iter():
+            # the label does not change the size of fixed size nodes
+            if node.attr.get('fixedsize') == 'true':
+                ignored = NON_GEOMETRIC_NODE_ATTRIBUTES + ('label',)
+            else:
+                ignored = NON_GEOMETRIC_NODE_ATTRIBUTES
+            update(str(node), geometric(node.attr, ignored))
+
+        for edge in graph.edges_iter():
+            update(str(edge[0]), str(edge[1]),
+                   geometric(edge.attr, NON_GEOMETRIC_EDGE_ATTRIBUTES))
+
+        for cluster in graph.subgraphs_iter():
+            update(cluster.name, [str(node) for node in cluster.nodes_iter()],
+                   geometric(cluster.graph_attr, NON_GEOMETRIC_NODE_ATTRIBUTES))
+
+        return key_hash.hexdigest()
+
+    @staticmethod
+    def get_layout(graph, layout_engine='dot'):
+        """ Extract layout of a graph
+        :param graph: laid out pygraphviz graph
+        :param layout_engine: layout engine used, stored for information
+        :return: cache entry with positions of nodes, edges and clusters
+        """
+
+        def layout_attributes(attributes, keys):
+            return {key: attributes[key] for key in keys if attributes.get(key)}
+
+        return {'layout_engine': layout_engine,
+                'graph': layout_attributes(graph.graph_attr, GRAPH_LAYOUT_ATTRIBUTES),
+                'nodes': {str(node): layout_attributes(node.attr, LAYOUT_ATTRIBUTES)
+                          for node in graph.nodes_iter()},
+                'edges': [[str(edge[0]), str(edge[1]),
+                           layout_attributes(edge.attr, LAYOUT_ATTRIBUTES)]
+                          for edge in graph.edges_iter()],
+                'clusters': {cluster.name: layout_attributes(cluster.graph_attr,
+                                                             GRAPH_LAYOUT_ATTRIBUTES)
+                             for cluster in graph.subgraphs_iter()}}
+
+    @staticmethod
+    def set_layout(graph, entry):
+        """ Apply cached layout to a graph with the same cache key
+        :param graph: pygraphviz graph, positions are stored in its attributes
+        :param entry: cache entry, see get_layout
+        """
+
+        graph.graph_attr.update(entry['graph'])
+
+        for node_name, attributes in entry['nodes'].items():
+            graph.get_node(node_name).attr.update(attributes)
+
+        for tail, head, attributes in entry['edges']:
+            graph.get_edge(tail, head).attr.update(attributes)
+
+        for cluster in graph.subgraphs_iter():
+            cluster.graph_attr.update(entry['clusters'].get(cluster.name, {}))
+
+        graph.has_layout = True
+
+    def describe(self, entry):
+        """ Summary of a cached layout, see FileCache.entries
+        """
+
+        return {'layout_engine': entry.get('layout_engine'),
+                'n_nodes': len(entry.get('nodes', {})),
+                'n_edges': len(entry.get('edges', []))}
+
+# version of the on-disk format of SnapshotCache entries
+SNAPSHOT_VERSION = 2
+
+class SnapshotCache(FileCache):
+    """ persistent on-disk state of the previous run for each gedcom file:
+        content hashes of all records, the labels of the persons and the
+        layout. Used to re-render edited files incrementally.
+    """
+
+    name = 'snapshot'
+    version = SNAPSHOT_VERSION
+
+    @staticmethod
+    def get_key(gedcom_filename):
+        """ Determine cache key of the snapshot of a gedcom file
+        :param gedcom_filename: name of gedcom file
+        :return: cache key as hex string
+        """
+
+        return hashlib.sha256(os.path.abspath(gedcom_filename).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_changes(old_hashes, new_hashes):
+        """ Compare record hashes of two runs
+        :param old_hashes: dictionary pointer -> hash of previous run
+        :param new_hashes: dictionary pointer -> hash of current run
+        :return: set of pointers of added, removed and changed records
+        """
+
+        changes = {pointer for pointer, record_hash in new_hashes.items()
+                   if old_hashes.get(pointer) != record_hash}
+        changes.update(pointer for pointer in old_hashes
+                       if pointer not in new_hashes)
+
+        return changes
+
+    def describe(self, entry):
+        """ Summary of a snapshot, see FileCache.entries
+        """
+
+        return {'gedcom_filename': entry.get('gedcom_filename'),
+                'n_records': len(entry.get('records', {})),
+                'n_labels': len(entry.get('labels', {}))}
+
+# version of the on-disk format of PersonTableCache entries
+PERSON_TABLE_VERSION = 1
+
+class PersonTableCache(FileCache):
+    """ persistent on-disk cache of person tables with fitted labels, so
+        later renders of the same file with the same node size only format
+        the labels of changed persons. There is one entry per gedcom file
+        and node size, which is replaced when labels change.
+    """
+
+    name = 'persons'
+    version = PERSON_TABLE_VERSION
+
+    @staticmethod
+    def get_key(gedcom_filename, label_key):
+        """ Determine cache key of the person table of a gedcom file
+        :param gedcom_filename: name of gedcom file
+        :param label_key: identifies the node size and metrics the labels
+                          are fitted to, see GedcomPlotter.get_label_key
+        :return: cache key as hex string
+        """
+
+        return hashlib.sha256(json.dumps(
+            [os.path.abspath(gedcom_filename), label_key]).encode('utf-8')).hexdigest()
+
+    def describe(self, entry):
+        """ Summary of a cached person table, see FileCache.entries
+        """
+
+        return {'n_persons': len(entry.get('table', {}).get('pointers', []))}
+
+class GedcomPlotter():
+    """ Create plot from gedcom file
+    """
+
+    def __init__(self, gedcom_filename, metrics_cache=None,
+                 metrics_backend='dot', streaming=False, lazy=False,
+                 layout_cache=None, snapshot_cache=None,
+                 graph_backend='pygraphviz', person_table_cache=None,
+                 record_index_cache=None):
+        """
+        :param gedcom_filename: name of input gedcom file
+        :param metrics_cache: MetricsCache used to store glyph metrics between
+                              runs, or None to always measure them
+        :param metrics_backend: how glyph metrics are determined, see NodeSize
+        :param streaming: read the file with GedcomStreamReader instead of
+                          python-gedcom. Only the data needed for plotting is
+                          kept in memory, other records are loaded on demand.
+        :param lazy: only index the records of the file (see RecordIndex)
+                     without loading them. Records are loaded on demand and
+                     added to the family tree with load_records.
+        :param layout_cache: LayoutCache used to store layouts between runs,
+                             or None to always lay out the graph
+        :param snapshot_cache: SnapshotCache for incremental re-rendering, or
+                               None. Labels of persons whose records did not
+                               change since the previous run of the same file
+                               are reused, as is the layout if neither the
+                               structure of the graph nor the node sizes
+                               changed.
+        :param graph_backend: how build_graph creates the graph, see
+                              GRAPH_BACKENDS
+        :param person_table_cache: PersonTableCache used to store the labels
+                                   of all persons between runs, or None to
+                                   always format them
+        :param record_index_cache: RecordIndexCache used to store the record
+                                   index of lazily opened files between runs,
+                                   default is a RecordIndexCache in the
+                                   default cache directory
+        """
+
+        self.gedcom_filename = gedcom_filename
+        self.gedcom_parser = None
+        self.root_child_elements = None
+        self.family_tree = None
+        self.full_family_tree = None
+        self.record_index = None
+        self.ns = None
+        self.metrics_cache = metrics_cache
+        self.metrics_backend = metrics_backend
+        self.graph_backend = graph_backend
+        self.layout_cache = layout_cache
+        self.snapshot_cache = snapshot_cache
+        self.snapshot = None
+        self.snapshot_key = None
+        self.record_hashes = None
+        self.changed_records = None
+
+        # person pointer -> label, see get_label
+        self.labels = {}
+
+        # PersonTable of the plotted persons, see get_person_table
+        self.person_table = None
+        self.person_table_cache = person_table_cache
+
+        self.default_node_attributes = {'shape':'box',
+                                        'style':'rounded,filled',
+                                        'fixedsize':'true',
+                                        'width':2,
+                                        'height':1.15}
+
+        self.time_format = 'COLOR="gray15" POINT-SIZE="10.0"'
+
+        if not os.path.exists(gedcom_filename):
+            print(f'Input file {gedcom_filename} not found.')
+            return None
+
+        with profiler.phase('parse'):
+            if lazy:
+                self.record_index = RecordIndex(gedcom_filename,
+                                                cache=record_index_cache)
+                self.record_index.open()
+                self.element_index = ElementIndex([], loader=self.record_index.load_record)
+                self.family_tree = FamilyTree()
+            elif streaming:
+                reader = GedcomStreamReader(gedcom_filename)
+                self.family_tree = reader.read()
+                self.element_index = ElementIndex([], loader=reader.load_record)
+            else:
+                self.gedcom_parser = Parser()
+                self.gedcom_parser.parse_file(gedcom_filename, False) # Disable strict parsing
+                self.root_child_elements = self.gedcom_parser.get_root_child_elements()
+                self.element_index = ElementIndex(self.root_child_elements)
+                self.family_tree = FamilyTree.from_elements(self.root_child_elements)
+
+            if lazy:
+                n_people = len(self.record_index.get_pointers(GEDCOM_TAG_INDIVIDUAL))
+            else:
+                n_people = len(self.family_tree.persons)
+
+            profiler.annotate(file_size=os.path.getsize(gedcom_filename),
+                              people=n_people)
+
+        print(f'Family tree contains {n_people} people.')
+
+        if n_people < 1:
+            return None
+
+        if snapshot_cache is not None:
+            with profiler.phase('load_snapshot'):
+                self.load_snapshot()
+
+    def load_snapshot(self):
+        """ Load snapshot of the previous run and determine which records
+            changed since then
+        """
+
+        record_index = self.record_index
+        if record_index is None:
+            record_index = RecordIndex(self.gedcom_filename)
+            record_index.build()
+
+        self.record_hashes = record_index.get_hashes()
+        self.snapshot_key = self.snapshot_cache.get_key(self.gedcom_filename)
+        self.snapshot = self.snapshot_cache.load(self.snapshot_key)
+
+        if self.snapshot is None:
+            print('No snapshot of previous run found.')
+            self.changed_records = set(self.record_hashes)
+            return
+
+        self.changed_records = SnapshotCache.get_changes(self.snapshot['records'],
+                                                         self.record_hashes)
+
+        print(f'{len(self.changed_records)} records changed since previous run.')
+
+    def save_snapshot(self, layout_key):
+        """ Store record hashes, labels and the key of the layout of this
+            run. The layout itself is stored in the layout cache.
+        :param layout_key: LayoutCache key of the graph
+        """
+
+        # labels of persons not plotted in this run remain valid
+        labels = {}
+        if self.snapshot is not None and \
+           self.snapshot['label_key'] == self.get_label_key():
+            labels = {pointer: label for pointer, label in self.snapshot['labels'].items()
+                      if pointer not in self.changed_records}
+        labels.update(self.labels)
+
+        self.snapshot = {'gedcom_filename': os.path.abspath(self.gedcom_filename),
+                         'records': self.record_hashes,
+                         'label_key': self.get_label_key(),
+                         'labels': labels,
+                         'layout_key': layout_key}
+        self.changed_records = set()
+
+        self.snapshot_cache.save(self.snapshot_key, self.snapshot)
+
+    def load_records(self, pointers, resolve_links=True):
+        """ Load individual and family records on demand and add them to the
+            complete family tree, e.g. after opening a file with lazy=True.
+            The loaded records keep all their links, so records loaded later
+            are connected to them.
+        :param pointers: pointers of the records to load
+        :param resolve_links: plot a copy of the loaded records without links
+                              to records which are not loaded. Otherwise the
+                              complete family tree is plotted as it is.
+        :return: list of loaded Person and Family objects of the complete
+                 family tree
+        """
+
+        # further selections are made from the complete tree
+        if self.full_family_tree is None:
+            self.full_family_tree = self.family_tree
+
+        tree = self.full_family_tree
+        loaded = []
+
+        for pointer in pointers:
+
+            if pointer in tree.persons:
+                loaded.append(tree.persons[pointer])
+                continue
+            if pointer in tree.families:
+                loaded.append(tree.families[pointer])
+                continue
+
+            element = self.element_index.get(pointer)
+
+            if element is None:
+                print(f'WARNING: Record {pointer} not found.')
+            elif element.get_tag() == GEDCOM_TAG_INDIVIDUAL:
+                loaded.append(tree.add_person(element))
+            elif element.get_tag() == GEDCOM_TAG_FAMILY:
+                loaded.append(tree.add_family(element))
+
+        self.family_tree = tree.get_resolved() if resolve_links else tree
+        self.person_table = None
+
+        return loaded
+
+    def select_subtree(self, root, direction='both', generations=None):
+        """ Restrict the plot to the persons related to a root person, see
+            FamilyTree.get_subtree. Has to be run before set_node_attributes.
+            If the file was opened with lazy=True, only the records reached
+            by the search are loaded.
+        :param root: pointer of root person, e.g. '@I1@'
+        :param direction: 'ancestors', 'descendants', 'both' or 'relatives'
+        :param generations: maximum number of generations, or None
+        :return: FamilyTree of selected persons or None on error
+        """
+
+        if self.family_tree is None:
+            print('Gedcom parser not initialized.')
+            return None
+
+        # further selections are made from the complete tree
+        if self.full_family_tree is None:
+            self.full_family_tree = self.family_tree
+
+        loader = None
+        if self.record_index is not None:
+            loader = self.element_index.get
+
+        subtree = self.full_family_tree.get_subtree(root, direction,
+                                                    generations, loader)
+
+        if subtree is None:
+            return None
+
+        self.family_tree = subtree
+        self.person_table = None
+
+        print(f'Selected {len(subtree.persons)} people.')
+
+        return subtree
+
+    def set_node_attributes(self, node_attributes={}):
+        """ set node attributes. This method has to be run once before running
+            create_graph. Every time the node attributes or font sizes change,
+            the NodeSize has to be re-estimated.
+        :param node_attributes: node attributes like shape, style, etc.
+        """
+
+        if self.family_tree is None:
+            print('Gedcom parser not initialized.')
+            return None
+
+        for key, value in node_attributes.items():
+            self.default_node_attributes[key] = node_attributes[key]
+
+        # whenever node attributes change, the text size has to be re-estimated
+        print('Initializing text size estimation...')
+        self.ns = NodeSize(self.family_tree,
+                           self.default_node_attributes,
+                           self.time_format,
+                           cache=self.metrics_cache,
+                           backend=self.metrics_backend)
+        profiler.annotate(characters=len(self.ns.widths))
+
+        self.labels = {}
+        self.person_table = None
+
+        # labels of unchanged persons are reused, as long as they were fitted
+        # to the same node size and metrics
+        if self.snapshot is not None and \
+           self.snapshot['label_key'] == self.get_label_key():
+            self.labels = {pointer: label for pointer, label in self.snapshot['labels'].items()
+                           if pointer not in self.changed_records}
+            print(f'Reusing labels of {len(self.labels)} unchanged people.')
+
+        return self.ns
+
+    def get_label_key(self):
+        """ identifies the node size and metrics labels are fitted to
+        :return: hex string
+        """
+
+        return hashlib.sha256(json.dumps(
+            [self.ns.metrics_id, self.time_format,
+             str(self.default_node_attributes['width']),
+             str(self.default_node_attributes['height'])]
+            ).encode('utf-8')).hexdigest()
+
+    def get_label(self, person):
+        """ Label of a person, fitted to the node size. Labels are memoized
+            until the node attributes change.
+        :param person: Person
+        :return: label as graphviz HTML-like string
+        """
+
+        label = self.labels.get(person.pointer)
+
+        if label is None:
+            profiler.count('formatted_labels')
+            label = format_name(person,
+                                self.default_node_attributes['width'],
+                                self.default_node_attributes['height'],
+                                self.ns)
+            self.labels[person.pointer] = label
+
+        return label
+
+    def get_person_table(self, family_tree=None, n_processes=None):
+        """ Table of the persons of a family tree with their labels. Labels
+            memoized by get_label are reused. The table of the loaded tree is
+            kept until the node attributes change, and stored in the person
+            table cache. Missing labels are formatted in parallel, see
+            PersonTable.format_labels.
+        :param family_tree: FamilyTree, default is the loaded tree
+        :param n_processes: number of processes formatting labels, default
+                            is the number of CPUs
+        :return: PersonTable
+        """
+
+        if family_tree is None:
+            family_tree = self.family_tree
+
+        loaded_tree = family_tree is self.family_tree
+
+        if loaded_tree and self.person_table is not None:
+            return self.person_table
+
+        table = PersonTable(family_tree.persons.values())
+        table.labels = [self.labels.get(pointer) for pointer in table.pointers]
+
+        key = None
+        if loaded_tree and self.person_table_cache is not None and \
+           any(label is None for label in table.labels):
+            key = PersonTableCache.get_key(self.gedcom_filename, self.get_label_key())
+            entry = self.person_table_cache.load(key)
+            cached = None if entry is None else PersonTable.from_dict(entry['table'])
+            if cached is not None:
+                n_reused = table.reuse_labels(cached)
+                print(f'Using cached labels of {n_reused} people.')
+
+        n_formatted = table.format_labels(self.default_node_attributes['width'],
+                                          self.default_node_attributes['height'],
+                                          self.ns, n_processes)
+        profiler.count('formatted_labels', n_formatted)
+
+        self.labels.update(zip(table.pointers, table.labels))
+
+        if key is not None and n_formatted > 0:
+            self.person_table_cache.save(key, {'table': table.to_dict()})
+
+        if loaded_tree:
+            self.person_table = table
+
+        return table
+
+    def get_stats(self):
+        """ statistics for debugging, e.g. number of record lookups
+        :return: dictionary with statistics
+        """
+
+        return {'element_index': self.element_index.get_stats(),
+                'fit_cache': {'entries': len(fit_cache.data),
+                              'hits': fit_cache.hits,
+                              'misses': fit_cache.misses}}
+
+    def cluster_spouses(self, family_tree=None):
+        """ Identify all married persons and put them in the same cluster.
+        Not trivial if more than one of the persons maried multiple times, so
+        clusters are merged using a DisjointSet.
+        :param family_tree: FamilyTree to cluster, default is the loaded tree
+        :return: dictionary mapping pointers of persons to cluster names
+        """
+
+        if family_tree is None:
+            family_tree = self.family_tree
+
+        spouse_sets = DisjointSet()
+
+        for family in family_tree.families.values():
+
+            if len(family.parents) > 1:
+                spouse_sets.union(family.parents[0], family.parents[1])
+
+        # clusters are numbered in order of their first member
+        cluster_names = {}
+        sub_graphs = {}
+        for person_id in spouse_sets:
+            root = spouse_sets.find(person_id)
+            if root not in cluster_names:
+                cluster_names[root] = f'cluster_{len(cluster_names) + 1}'
+            sub_graphs[person_id] = cluster_names[root]
+
+        return sub_graphs
+
+    def build_graph(self, family_tree, fillcolor, graph_attributes, verbose=True):
+        """ Create nodes, spouse clusters and edges of the graph, without
+            layout. Used by create_graph.
+        :param family_tree: FamilyTree with the persons and families to add
+        :param fillcolor: dictionary with color values for Male, Female, Other
+        :param graph_attributes: dictionary with attributes passed to pgv.AGraph
+        :param verbose: print progress
+        :return: pygraphviz graph
+        """
+
+        direction = graph_attributes.get('rankdir', 'TB')
+
+        ports = {'BT': {'head': 's',
+                        'tail': 'n'},
+                 'TB': {'head': 'n',
+                        'tail': 's'},
+                 'LR': {'head': 'w',
+                        'tail': 'e'},
+                 'RL': {'head': 'e',
+                        'tail': 'w'}}
+
+        if self.graph_backend == 'dot':
+            # the attributes shared by person nodes and by edges to parents
+            # are written once as defaults. Not tailport: graphviz writes
+            # ports as part of the edge, an empty tailport of the edges
+            # between spouses would be lost when the graph is written.
+            node_defaults = {key: value for key, value in self.default_node_attributes.items()
+                             if key not in ('label', 'fillcolor')}
+            bgcolor = graph_attributes.get('bgcolor', '#ffffffff')
+            edge_defaults = {'headport': ports[direction]['head'],
+                             'splines': None,
+                             'color': f'{bgcolor}:black:{bgcolor}',
+                             'penwidth': 2}
+            graph = DotGraph(node_attributes=node_defaults, edge_attributes=edge_defaults,
+                             **graph_attributes)
+        else:
+            graph = pgv.AGraph(**graph_attributes)
+
+        if 'bgcolor' not in graph_attributes.keys():
+            graph_attributes['bgcolor'] = '#ffffffff'
+
+        # Add all indiviudals to graph
+
+        table = self.get_person_table(family_tree)
+
+        if verbose:
+            print('Creating nodes...')
+        for node_name, gender, label in zip(table.node_names, table.genders,
+                                            table.labels):
+
+            #if 'fillcolor' not in node_attributes.keys():
+            self.default_node_attributes['fillcolor'] = \
+                fillcolor.get(gender, fillcolor['O'])
+
+            graph.add_node(node_name,
+                           label=label,
+                           #tooltip=get_tooltip(self.element_index.get(person.pointer), self.element_index),
+                           **self.default_node_attributes)
+
+        #print('\r', end='')
+
+        if verbose:
+            print('Clustering spouses...')
+
+        # sub_graph maps persons to spouse clusters
+        sub_graphs = self.cluster_spouses(family_tree)
+
+        if verbose:
+            print('Creating edges between spouses...')
+
+        pairs = {}
+
+        marriage_node_attributes = self.default_node_attributes.copy()
+        # TODO: would be nice if marriage nodes were more customizable.
+        #       Currently, they use same attributes as person labels, minus the
+        #       attributes in the line below
+        for key in ('label', 'xlabel', 'shape', 'width', 'height', 'margin',
+                    'fixedsize', 'style', 'fillcolor'):
+            if key in marriage_node_attributes.keys():
+                del marriage_node_attributes[key]
+
+        persons = family_tree.persons
+
+        for family in family_tree.families.values():
+
+            if len(family.parents) < 2:
+                continue
+
+            person = persons[family.parents[0]]
+            spouse = persons[family.parents[1]]
+
+            pairs[family.pointer] = True
+
+            # display divorced marriages as dashed lines.
+            if family.divorced:
+                style = 'dashed'
+            else:
+                style = 'solid'
+
+            # Couples are always connected by a "pair" node. Married
+            # couples get a ⚭ symbol, divorced couples a ⚮ symbol
+            # and all others a 'point'
+            if family.label == '':
+                graph.add_node(family.node_name, xlabel=family.label, shape='point',
+                               fixedsize='true', width=0.1, height=0.1,
+                               **marriage_node_attributes)
+            else:
+                graph.add_node(family.node_name, label=family.label,
+                               shape='plaintext', width=0,
+                               height=0, margin=0.01,
+                               **marriage_node_attributes)
+
+
+            # peripheries='0' removes rectangles around subgraphs
+            add_cluster(graph, (spouse.node_name, person.node_name, family.node_name),
+                        peripheries='0', name=sub_graphs[person.pointer],
+                        cluster='true', label='')
+
+            graph.add_edge(family.node_name, person.node_name,
+                           headport=ports[direction]['head'],
+                           style=style, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
+                           penwidth=2)
+            graph.add_edge(family.node_name, spouse.node_name,
+                           headport=ports[direction]['head'],
+                           style=style, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
+                           penwidth=2)
+
+        if verbose:
+            print(f'Graph contains {len(graph.edges())} edges.')
+
+        del sub_graphs
+
+        if verbose:
+            print('Creating edges to parents...')
+        # Add edges to parents
+        for person in persons.values():
+
+            # child can belong to more than one family if it was adopted:
+            for family_id in person.parent_families:
+
+#                # check if child is adopted:
+#                # TODO: edge of child adopted by both parents could be
+#                #       displayed dotted/dashed or with special symbol.
+#                #       No idea how to display edge for child adopted by one
+#                #       of the parents only though.
+#                for c in person.get_child_elements():
+#                    if c.get_tag() == 'FAMC':
+#
+#                        if c.get_value() != family.get_pointer():
+#                            continue
+#
+#                        for c2 in c.get_child_elements():
+#                            if c2.get_tag() == 'PEDI':
+#                                if c2.get_value() == 'ADOPTED':
+#                                    print(f'Adopted by {family.get_pointer()}')
+#                                    # TODO: identify who adopted child, using
+#                                    #       ADOP tag: BOTH|HUSB|WIFE
+
+                family = family_tree.families[family_id]
+
+                if family_id in pairs:
+                    graph.add_edge(person.node_name, family.node_name,
+                                   headport=ports[direction]['head'],
+                                   tailport=ports[direction]['tail'],
+                                   splines=None, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
+                                   penwidth=2)
+
+                # if only one of the parents is known, the child is linked to
+                # that directly, instead of the (non-existent) pair node
+                else:
+                    for parent_id in family.parents:
+                        graph.add_edge(person.node_name, persons[parent_id].node_name,
+                                       headport=ports[direction]['head'],
+                                       tailport=ports[direction]['tail'],
+                                       splines=None, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
+                                       penwidth=2)
+
+
+        if verbose:
+            print(f'Graph contains {len(graph.edges())} edges.')
+
+        if isinstance(graph, DotGraph):
+            graph = graph.to_agraph()
+
+        return graph
+
+    def layout_banded(self, graph, fillcolor, graph_attributes, n_processes=None):
+        """ Lay out the family tree in bands of BAND_GENERATIONS generations.
+            The unrelated parts of each band are laid out independently with
+            dot, then placed with fixed coordinates (see stitch_bands). Edges
+            between bands are routed when the graph is drawn. The size of the
+            dot layouts does not grow with the size of the tree, so the
+            runtime grows roughly linearly.
+        :param graph: graph of the whole family tree, see build_graph
+        :param fillcolor: dictionary with color values for Male, Female, Other
+        :param graph_attributes: attributes of the graphs of the parts
+        :param n_processes: number of processes, default is the number of CPUs
+        """
+
+        generations = self.family_tree.get_generations()
+
+        bands = {}
+        for pointer, generation in generations.items():
+            bands.setdefault(generation // BAND_GENERATIONS, set()).add(pointer)
+
+        parts = []
+        for band in sorted(bands):
+            subset = self.family_tree.get_subset(bands[band])
+            for part in subset.get_components(MIN_PERSONS_PER_BAND_PART):
+                parts.append((band, part))
+
+        print(f'Laying out {len(parts)} parts of {len(bands)} generation bands...')
+
+        layouts = layout_parts([self.build_graph(part, fillcolor, graph_attributes,
+                                                 verbose=False)
+                                for band, part in parts], n_processes)
+
+        rankdir = graph_attributes.get('rankdir', 'TB')
+        gap = float(graph.graph_attr.get('nodesep') or 0.25) * 72
+
+        offsets = stitch_bands(self.family_tree, parts, layouts, generations,
+                               rankdir, gap)
+
+        apply_layouts(graph, layouts, offsets)
+
+    def create_graph(self,
+                     fillcolor={'M':'#bce0f0', 'F':'#f8e3eb', 'O':'#fbfbcc'},
+                     graph_attributes={},
+                     layout_engine='dot',
+                     n_processes=None,
+                     layout_timeout=None,
+                     layout_memory_limit=None,
+                     layout_fallback='banded',
+                     layout_progress=False):
+        """ Generate family tree graph for a given gedcom file.
+        Only works if set_node_attributes was run first.
+        :param fillcolor: dictionary with color values for Male, Female, Other
+        :param graph_attributes: dictionary with attributes passed to pgv.AGraph
+        :param layout_engine: 'dot' to lay out the whole graph at once,
+                              'partitioned' to lay out disconnected parts of
+                              the family tree in parallel processes, or
+                              'banded' to lay out bands of generations
+                              independently (see layout_banded)
+        :param n_processes: number of processes for partitioned and banded
+                            layout, default is the number of CPUs
+        :param layout_timeout: if given, the dot layout runs in a child
+                               process which is stopped after this many
+                               seconds (see run_layout_subprocess)
+        :param layout_memory_limit: if given, the dot layout runs in a child
+                                    process limited to this many MiB
+        :param layout_fallback: engine used if the dot layout in the child
+                                process fails, one of LAYOUT_FALLBACKS, or
+                                None to fail
+        :param layout_progress: print the progress messages of the child
+                                process
+        :return: pygraphviz graph containing family tree graph
+        """
+
+        if self.family_tree is None:
+            print('Gedcom parser not initialized.')
+            return None
+
+        if self.ns is None:
+            print('Node sizes not initialized.')
+            return None
+
+        direction = graph_attributes.get('rankdir', 'TB')
+
+        if direction not in ('TB', 'BT', 'LR', 'RL'):
+            print(f'Invalid rankdir of {direction} specified. Must be one of: BT, TB, LR, RL')
+            return None
+
+        if layout_engine not in LAYOUT_ENGINES:
+            print(f'Invalid layout engine {layout_engine} specified. Must be one of: {", ".join(LAYOUT_ENGINES)}')
+            return None
+
+        if layout_fallback is not None and layout_fallback not in LAYOUT_FALLBACKS:
+            print(f'Invalid layout fallback {layout_fallback} specified. Must be one of: {", ".join(LAYOUT_FALLBACKS)}')
+            return None
+
+        self.get_person_table(n_processes=n_processes)
+
+        with profiler.phase('build_graph'):
+            graph = self.build_graph(self.family_tree, fillcolor, graph_attributes)
+            profiler.annotate(nodes=graph.number_of_nodes(),
+                              edges=graph.number_of_edges(),
+                              clusters=len(graph.subgraphs()))
+
+        key = None
+        if self.layout_cache is not None or self.snapshot_cache is not None:
+            with profiler.phase('layout_key'):
+                key = LayoutCache.get_key(graph, layout_engine)
+
+            entry = None
+            if self.layout_cache is not None:
+                entry = self.layout_cache.load(key)
+
+            if entry is not None:
+                if self.snapshot is not None and self.snapshot['layout_key'] == key:
+                    print('Using layout of previous run.')
+                    profiler.annotate(layout='snapshot')
+                else:
+                    print('Using cached layout.')
+                    profiler.annotate(layout='cache')
+
+                LayoutCache.set_layout(graph, entry)
+                if self.snapshot_cache is not None:
+                    self.save_snapshot(key)
+                return graph
+
+        print('Creating layout...')
+        profiler.annotate(layout='computed')
+        #graph.layout('dot', args='-v4')
+        subprocess_layout = layout_engine == 'dot' and \
+            (layout_timeout is not None or layout_memory_limit is not None)
+
+        with profiler.phase('layout'):
+            profiler.annotate(engine=layout_engine)
+
+            if subprocess_layout and \
+               run_layout_subprocess(graph, timeout=layout_timeout,
+                                     memory_limit=layout_memory_limit,
+                                     progress=layout_progress) is None:
+                if layout_fallback is None:
+                    return None
+
+                print(f'Falling back to {layout_fallback} layout...')
+                profiler.annotate(fallback=layout_fallback)
+                layout_engine = layout_fallback
+                if key is not None:
+                    key = LayoutCache.get_key(graph, layout_engine)
+
+            if layout_engine in ('partitioned', 'banded'):
+                # the graph label is placed once for the packed parts
+                part_attributes = {key: value for key, value in graph_attributes.items()
+                                   if key != 'label'}
+
+            if layout_engine == 'partitioned':
+                parts = [self.build_graph(part, fillcolor, part_attributes, verbose=False)
+                         for part in self.family_tree.get_components(MIN_PERSONS_PER_PART)]
+                print(f'Laying out {len(parts)} parts...')
+                profiler.annotate(parts=len(parts))
+                layout_partitioned(graph, parts, n_processes)
+            elif layout_engine == 'banded':
+                self.layout_banded(graph, fillcolor, part_attributes, n_processes)
+            elif not subprocess_layout:
+                run_layout(graph)
+
+        if self.layout_cache is not None:
+            self.layout_cache.save(key, LayoutCache.get_layout(graph, layout_engine))
+
+        if self.snapshot_cache is not None:
+            self.save_snapshot(key)
+
+        return graph
+
+# edges crossing at smaller angles (degrees) get different colors, see
+# paint_edges. Same default as the edgepaint tool of graphviz.
+EDGEPAINT_ANGLE = 15
+
+def get_spline_points(value, n_samples=8):
+    """ Approximate the splines of an edge position attribute by polylines
+    :param value: pos attribute of an edge, e.g. 'e,10,20 10,30 12,40 ...'
+    :param n_samples: number of line segments per bezier segment
+    :return: list of polylines, each a list of (x, y)
     """
 
-    e = follow_link(e, gedcom_parser)
+    polylines = []
+    for spline in value.split(';'):
+        points = []
+        for point in spline.split():
+            # start and end points of arrows are not part of the spline
+            if point[:2] in ('e,', 's,'):
+                continue
+            x, y = point.split(',')[:2]
+            points.append((float(x), float(y.rstrip('!'))))
+
+        polyline = points[:1]
+        for i in range(0, len(points) - 3, 3):
+            p0, p1, p2, p3 = points[i:i + 4]
+            for j in range(1, n_samples + 1):
+                t = j / n_samples
+                s = 1 - t
+                polyline.append((s**3 * p0[0] + 3 * s**2 * t * p1[0] + 3 * s * t**2 * p2[0] + t**3 * p3[0],
+                                 s**3 * p0[1] + 3 * s**2 * t * p1[1] + 3 * s * t**2 * p2[1] + t**3 * p3[1]))
+
+        if len(polyline) > 1:
+            polylines.append(polyline)
+
+    return polylines
+
+def segments_intersect(p1, p2, q1, q2):
+    """ Check if two line segments intersect or overlap
+    :return: True if the segments have a common point
+    """
 
-    ret_string = e.get_value()
+    def orientation(a, b, c):
+        value = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+        return (value > 1e-9) - (value < -1e-9)
 
-    if len(ret_string) < 1:
-        return ''
+    def on_segment(a, b, c):
+        return min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and \
+               min(a[1], b[1]) <= c[1] <= max(a[1], b[1])
 
-#    # follow reference
-#    if ret_string[0] == '@' and ret_string[-1] == '@':
-#        e = gedcom_parser.get_element_dictionary()[ret_string]
-#        ret_string = e.get_value()
+    o1 = orientation(p1, p2, q1)
+    o2 = orientation(p1, p2, q2)
+    o3 = orientation(q1, q2, p1)
+    o4 = orientation(q1, q2, p2)
 
-    for c in e.get_child_elements():
-        if c.get_tag() == 'CONT':
-            ret_string = ret_string + '\n' + c.get_value()
-        if c.get_tag() == 'CONC':
-            ret_string = ret_string + c.get_value()
+    if o1 != o2 and o3 != o4:
+        return True
 
-    return ret_string
+    # collinear cases
+    return (o1 == 0 and on_segment(p1, p2, q1)) or \
+           (o2 == 0 and on_segment(p1, p2, q2)) or \
+           (o3 == 0 and on_segment(q1, q2, p1)) or \
+           (o4 == 0 and on_segment(q1, q2, p2))
 
-def source_to_string(e, gedcom_parser):
-    """ Convert gedcom source entry to string
-    :param e: gedcom note element
-    :param gedcom_parser: parser of current gedcom file
-    :return: Converted string
+class GridIndex():
+    """ uniform grid of bounding boxes, to find boxes near each other without
+        comparing all pairs
     """
 
-    ret_string = 'Source:\n'
-
-    for c in e.get_child_elements():
-        c = follow_link(c, gedcom_parser)
-
-        if c.get_tag() == 'TITL':
-            ret_string = ret_string + c.get_value() + ':\n'
+    def __init__(self, cell_size):
+        """
+        :param cell_size: edge length of grid cells
+        """
 
-    for c in e.get_child_elements():
-        c = follow_link(c, gedcom_parser)
+        self.cell_size = cell_size
+        self.cells = {}
 
-        if c.get_tag() == 'NOTE':
-            ret_string = ret_string + note_to_string(c, gedcom_parser)
+    def get_cells(self, box):
+        """ cells overlapping a bounding box
+        :param box: tuple (x0, y0, x1, y1)
+        :return: list of cell coordinates
+        """
 
-    return ret_string
+        return [(cx, cy)
+                for cx in range(int(box[0] // self.cell_size), int(box[2] // self.cell_size) + 1)
+                for cy in range(int(box[1] // self.cell_size), int(box[3] // self.cell_size) + 1)]
 
-def get_tooltip(e, gedcom_parser):
-    """ Create a tooltip for given element
-    (not fully implemented/tested)
-    :param e: gedcom note element
-    :param gedcom_parser: parser of current gedcom file
-    :return: Tooltip as string
-    """
+    def insert(self, box, item):
+        """ add item with given bounding box to all cells it overlaps
+        """
 
-    # Tooltip always starts with name:
-    (first_name, last_name) = e.get_name()
-    if first_name == '':
-        ret_string = '?'
-    else:
-        ret_string = first_name
+        for cell in self.get_cells(box):
+            self.cells.setdefault(cell, []).append(item)
 
-    if last_name != '':
-        ret_string = ret_string + ' ' + last_name
+    def query(self, box):
+        """ items which may overlap a bounding box
+        :return: set of items in the cells overlapped by box
+        """
 
-    ret_string = ret_string + '\n'
+        return {item for cell in self.get_cells(box) for item in self.cells.get(cell, ())}
+
+def find_edge_conflicts(edges, angle=EDGEPAINT_ANGLE, cell_size=72):
+    """ Find pairs of edges which cross at a small angle or overlap. Edges
+        with a common node are not in conflict. The line segments of the
+        edges are indexed in a GridIndex, so only segments in the same grid
+        cells are compared.
+    :param edges: list of (tail, head, polylines), see get_spline_points
+    :param angle: maximum crossing angle of conflicting edges (degrees)
+    :param cell_size: edge length of grid cells (points)
+    :return: list of sets, the indices of the edges in conflict with each edge
+    """
 
-    # TODO: birth, death, dates and places, etc.
+    max_cos = math.cos(math.radians(angle))
 
-    # check if there is a note at first level:
-    for c in e.get_child_elements():
+    grid = GridIndex(cell_size)
+    for i, (_, _, polylines) in enumerate(edges):
+        for polyline in polylines:
+            for p, q in zip(polyline, polyline[1:]):
+                grid.insert((min(p[0], q[0]), min(p[1], q[1]),
+                             max(p[0], q[0]), max(p[1], q[1])), (i, p, q))
 
-        c = follow_link(c, gedcom_parser)
+    conflicts = [set() for _ in edges]
 
-        if c.get_tag() == 'NOTE':
-            ret_string = ret_string + note_to_string(c, gedcom_parser)
+    for segments in grid.cells.values():
+        for k, (i, p1, p2) in enumerate(segments):
+            for j, q1, q2 in segments[k + 1:]:
 
-    # check if there is a note at second level:
-    for c in e.get_child_elements():
+                if i == j or j in conflicts[i]:
+                    continue
 
-        c = follow_link(c, gedcom_parser)
+                if edges[i][0] in edges[j][:2] or edges[i][1] in edges[j][:2]:
+                    continue
 
-        for c2 in c.get_child_elements():
+                if not segments_intersect(p1, p2, q1, q2):
+                    continue
 
-            c2 = follow_link(c2, gedcom_parser)
+                u = (p2[0] - p1[0], p2[1] - p1[1])
+                v = (q2[0] - q1[0], q2[1] - q1[1])
+                length = math.hypot(*u) * math.hypot(*v)
 
-            if c2.get_tag() == 'NOTE':
-                if c.get_tag() == 'SOUR':
-                    ret_string = ret_string + source_to_string(c, gedcom_parser)
-                else:
-                    ret_string = ret_string + c.get_tag() + ':\n'   # TODO: this looks ugly (BIRT, DEAT, etc.)
-                    ret_string = ret_string + note_to_string(c2, gedcom_parser)
+                if length == 0 or abs(u[0] * v[0] + u[1] * v[1]) / length >= max_cos:
+                    conflicts[i].add(j)
+                    conflicts[j].add(i)
 
-    return ret_string
+    return conflicts
 
-class GedcomPlotter():
-    """ Create plot from gedcom file
+def parse_hex_color(color):
+    """ Convert color like '#ff8000' or '#ff8000ff' to (r, g, b) in [0, 1]
+    :return: tuple or None if color is no hex color
     """
 
-    def __init__(self, gedcom_filename):
-        """
-        :param gedcom_filename: name of input gedcom file
-        """
+    if not re.fullmatch(r'#[0-9a-fA-F]{6}([0-9a-fA-F]{2})?', color):
+        return None
 
-        self.gedcom_parser = None
-        self.ns = None
+    return tuple(int(color[i:i + 2], 16) / 255 for i in (1, 3, 5))
 
-        self.default_node_attributes = {'shape':'box',
-                                        'style':'rounded,filled',
-                                        'fixedsize':'true',
-                                        'width':2,
-                                        'height':1.15}
+def lab_to_rgb(L, a, b):
+    """ Convert CIELAB color (D65) to sRGB
+    :return: (r, g, b), components outside [0, 1] are out of gamut
+    """
 
-        self.time_format = 'COLOR="gray15" POINT-SIZE="10.0"'
+    def f_inverse(t):
+        return t**3 if t**3 > 0.008856 else (t - 16 / 116) / 7.787
+
+    fy = (L + 16) / 116
+    x = 0.95047 * f_inverse(fy + a / 500)
+    y = f_inverse(fy)
+    z = 1.08883 * f_inverse(fy - b / 200)
+
+    def gamma(c):
+        return 12.92 * c if c <= 0.0031308 else 1.055 * math.copysign(abs(c)**(1 / 2.4), c) - 0.055
+
+    return (gamma(3.2406 * x - 1.5372 * y - 0.4986 * z),
+            gamma(-0.9689 * x + 1.8758 * y + 0.0415 * z),
+            gamma(0.0557 * x - 0.2040 * y + 1.0570 * z))
+
+# brewer color schemes of graphviz, with the smallest and largest number of
+# colors. Scheme names are the name followed by the number of colors.
+BREWER_SCHEMES = {'accent': (3, 8), 'blues': (3, 9), 'brbg': (3, 11), 'bugn': (3, 9),
+                  'bupu': (3, 9), 'dark2': (3, 8), 'gnbu': (3, 9), 'greens': (3, 9),
+                  'greys': (3, 9), 'oranges': (3, 9), 'orrd': (3, 9), 'paired': (3, 12),
+                  'pastel1': (3, 9), 'pastel2': (3, 8), 'piyg': (3, 11), 'prgn': (3, 11),
+                  'pubu': (3, 9), 'pubugn': (3, 9), 'puor': (3, 11), 'purd': (3, 9),
+                  'purples': (3, 9), 'rdbu': (3, 11), 'rdgy': (3, 11), 'rdpu': (3, 9),
+                  'rdylbu': (3, 11), 'rdylgn': (3, 11), 'reds': (3, 9), 'set1': (3, 9),
+                  'set2': (3, 8), 'set3': (3, 12), 'spectral': (3, 11), 'ylgn': (3, 9),
+                  'ylgnbu': (3, 9), 'ylorbr': (3, 9), 'ylorrd': (3, 9)}
+
+def get_palette(color_scheme, n_colors, bgcolor='#ffffff'):
+    """ Colors of a color scheme, in an order in which each color is as
+        different as possible from the previous ones
+    :param color_scheme: 'lab', 'rgb' or 'gray' for colors sampled from
+                         these color spaces, a comma separated list of hex
+                         colors, or a brewer color scheme like 'dark28'
+    :param n_colors: number of colors needed
+    :param bgcolor: background color, the colors are chosen to differ from it
+    :return: list of graphviz colors or None if the scheme is invalid
+    """
 
-        if not os.path.exists(gedcom_filename):
-            print(f'Input file {gedcom_filename} not found.')
+    def to_hex(rgb):
+        return '#' + ''.join(f'{round(c * 255):02x}' for c in rgb)
+
+    if color_scheme in ('lab', 'rgb', 'gray'):
+        # candidates as (coordinates in color space, rgb)
+        if color_scheme == 'lab':
+            candidates = []
+            for L in range(20, 75, 5):
+                for a in range(-80, 81, 10):
+                    for b in range(-80, 81, 10):
+                        rgb = lab_to_rgb(L, a, b)
+                        if all(0 <= c <= 1 for c in rgb):
+                            candidates.append(((L, a, b), rgb))
+        elif color_scheme == 'rgb':
+            levels = [i / 5 for i in range(6)]
+            candidates = [((r, g, b), (r, g, b)) for r in levels for g in levels for b in levels
+                          if 0.3 * r + 0.59 * g + 0.11 * b < 0.75]
+        else:
+            candidates = [((v, v, v), (v, v, v)) for v in (i / 20 for i in range(16))]
+
+        background = parse_hex_color(bgcolor) or (1, 1, 1)
+        if color_scheme == 'lab':
+            # distance to the background in lab space
+            background = (100 * (0.2126 * background[0] + 0.7152 * background[1] +
+                                 0.0722 * background[2]), 0, 0)
+
+        # farthest point sampling, starting far from the background
+        distances = [math.dist(coordinates, background) for coordinates, _ in candidates]
+        palette = []
+        while len(palette) < min(n_colors, len(candidates)):
+            i = max(range(len(candidates)), key=distances.__getitem__)
+            palette.append(to_hex(candidates[i][1]))
+            distances = [min(d, math.dist(coordinates, candidates[i][0]))
+                         for d, (coordinates, _) in zip(distances, candidates)]
+            distances[i] = -1
+
+        return palette
+
+    if color_scheme.startswith('#'):
+        palette = [color.strip() for color in color_scheme.split(',')]
+        if any(parse_hex_color(color) is None for color in palette):
+            print(f'Invalid color list {color_scheme}.')
             return None
+        return palette
+
+    for name, (min_colors, max_colors) in BREWER_SCHEMES.items():
+        n = color_scheme.lower()[len(name):]
+        if color_scheme.lower().startswith(name) and n.isdigit() and \
+           min_colors <= int(n) <= max_colors:
+            return [f'/{name}{n}/{i}' for i in range(1, int(n) + 1)]
+
+    print(f'Invalid color scheme {color_scheme}. Must be lab, rgb, gray, '
+          'a comma separated list of hex colors or a brewer color scheme.')
+    return None
+
+def route_edges(G):
+    """ Route edges without splines, e.g. the edges between independently
+        laid out parts (see apply_layouts), which are otherwise routed when
+        the graph is drawn
+    :param G: laid out graph
+    """
 
-        self.gedcom_parser = Parser()
-        self.gedcom_parser.parse_file(gedcom_filename, False) # Disable strict parsing
-        self.root_child_elements = self.gedcom_parser.get_root_child_elements()
+    if any(not edge.attr.get('pos') for edge in G.edges_iter()):
+        run_layout(G, 'nop2')
+
+def paint_edges(G, color_scheme, angle=EDGEPAINT_ANGLE):
+    """ Color edges which cross at a small angle or overlap differently, so
+        they can be told apart. Edges with a common node, e.g. the children
+        of a family, are not in conflict. Works like the edgepaint tool of
+        graphviz with -share_endpoint, but in-process: conflicting edges are
+        found with a spatial index, and the conflict graph is colored
+        greedily, edges with most conflicts first.
+    :param G: laid out graph
+    :param color_scheme: color scheme, see get_palette
+    :param angle: maximum crossing angle of conflicting edges (degrees)
+    :return: graph with painted edges or None if there was a problem
+    """
 
-        n_people = 0
-        for person in self.root_child_elements:
-            if isinstance(person, IndividualElement):
-                n_people += 1
+    print('Painting edges...')
 
-        print(f'Family tree contains {n_people} people.')
+    route_edges(G)
 
-        if n_people < 1:
-            return None
+    graph_edges = list(G.edges_iter())
+    edges = [(str(edge[0]), str(edge[1]), get_spline_points(edge.attr.get('pos') or ''))
+             for edge in graph_edges]
 
-    def set_node_attributes(self, node_attributes={}):
-        """ set node attributes. This method has to be run once before running
-            create_graph. Every time the node attributes or font sizes change,
-            the NodeSize has to be re-estimated.
-        :param node_attributes: node attributes like shape, style, etc.
-        """
+    conflicts = find_edge_conflicts(edges, angle)
 
-        if self.gedcom_parser is None:
-            print('Gedcom parser not initialized.')
-            return None
+    max_conflicts = max((len(c) for c in conflicts), default=0)
+    palette = get_palette(color_scheme, max_conflicts + 1,
+                          G.graph_attr.get('bgcolor') or '#ffffff')
 
-        for key, value in node_attributes.items():
-            self.default_node_attributes[key] = node_attributes[key]
+    if palette is None:
+        return None
 
-        # whenever node attributes change, the text size has to be re-estimated
-        print('Initializing text size estimation...')
-        self.ns = NodeSize(self.gedcom_parser,
-                           self.default_node_attributes,
-                           self.time_format)
+    colors = {}
+    for i in sorted(range(len(edges)), key=lambda i: -len(conflicts[i])):
+        used = collections.Counter(colors[j] for j in conflicts[i] if j in colors)
+        # first color not used by conflicting edges, or the least used one
+        colors[i] = min(range(len(palette)), key=lambda c: (used[c], c))
 
-        return self.ns
+    for i, edge in enumerate(graph_edges):
+        color = palette[colors[i]]
 
-    def create_graph(self,
-                     fillcolor={'M':'#bce0f0', 'F':'#f8e3eb', 'O':'#fbfbcc'},
-                     graph_attributes={}):
-        """ Generate family tree graph for a given gedcom file.
-        Only works if set_node_attributes was run first.
-        :param fillcolor: dictionary with color values for Male, Female, Other
-        :param graph_attributes: dictionary with attributes passed to pgv.AGraph
-        :return: pygraphviz graph containing family tree graph
-        """
+        # edges drawn with a border ('bg:black:bg') keep their border
+        parts = edge.attr.get('color', '').split(':')
+        if len(parts) == 3 and parts[0] == parts[2]:
+            color = f'{parts[0]}:{color}:{parts[2]}'
 
-        if self.gedcom_parser is None:
-            print('Gedcom parser not initialized.')
-            return None
+        edge.attr['color'] = color
 
-        if self.ns is None:
-            print('Node sizes not initialized.')
-            return None
+    n_conflicting = sum(len(c) > 0 for c in conflicts)
+    print(f'{n_conflicting} of {len(edges)} edges are in conflict, '
+          f'painted with {len(set(colors.values()))} colors.')
 
-        direction = graph_attributes.get('rankdir', 'TB')
+    return G
 
-        if direction not in ('TB', 'BT', 'LR', 'RL'):
-            print(f'Invalid rankdir of {direction} specified. Must be one of: BT, TB, LR, RL')
-            return None
+# version of the label report format, see check_labels
+LABEL_REPORT_VERSION = 1
 
-        graph = pgv.AGraph(**graph_attributes)
+# overlaps of less than this (points) in either direction are ignored
+LABEL_OVERLAP_TOLERANCE = 1
 
-        if 'bgcolor' not in graph_attributes.keys():
-            graph_attributes['bgcolor'] = '#ffffffff'
+def get_element_id(node_name):
+    """ Short name of a graph node for reports: the pointer of the gedcom
+        record, e.g. '@I1@', or the node name for other nodes
+    """
 
-        # Add all indiviudals to graph
+    match = re.match(r'0 (@[^@]+@) ', node_name)
+    if match is None:
+        return node_name
 
-        print('Creating nodes...')
-        #counter = 0
-        for person in self.root_child_elements:
+    return match.group(1)
 
-            #print('\r' + str(int(counter * 100 / n_people)) + '%', end='')
-            #counter += 1
+def measure_labels(G):
+    """ Measure the size the labels of a laid out graph need, independent of
+        the size of their nodes. A copy of the graph, parsed from its dot
+        source so HTML labels remain HTML, is laid out with nop (keeping
+        positions) after removing the fixed sizes and edges.
+    :param G: laid out graph
+    :return: dictionaries {node name: (width, height)} of the nodes with
+             fixed size and of the xlabels (points)
+    """
 
-            if isinstance(person, IndividualElement):
+    H = pgv.AGraph(G.string())
+    H.delete_edges_from(H.edges())
 
-                #if 'fillcolor' not in node_attributes.keys():
-                self.default_node_attributes['fillcolor'] = \
-                    fillcolor.get(person.get_gender(), fillcolor['O'])
+    fixed = []
+    xlabels = []
+    for node in H.nodes_iter():
+        if node.attr.get('fixedsize') == 'true' and node.attr.get('shape') != 'point':
+            fixed.append(str(node))
+            node.attr.update(fixedsize='false', width=0, height=0)
 
-                name = format_name(person,
-                                   self.default_node_attributes['width'],
-                                   self.default_node_attributes['height'],
-                                   self.ns)
+        if node.attr.get('xlabel'):
+            xlabels.append(str(node))
 
-                graph.add_node(person,
-                               label=name,
-                               #tooltip=get_tooltip(person, self.gedcom_parser),
-                               **self.default_node_attributes)
+    # xlabels are measured as plain text in a label of their own
+    for i, name in enumerate(xlabels):
+        node = G.get_node(name)
+        H.add_node(f'xlabel {i}', label=node.attr['xlabel'], shape='plaintext',
+                   margin=0, width=0, height=0, pos='0,0',
+                   **{key: node.attr[key] for key in ('fontname', 'fontsize')
+                      if node.attr.get(key)})
 
-        #print('\r', end='')
+    run_layout(H, 'nop')
 
-        # sub_graph maps persons to spouse clusters
-        sub_graphs = {}
+    def get_size(name):
+        node = H.get_node(name)
+        return float(node.attr['width']) * 72, float(node.attr['height']) * 72
 
-        ports = {'BT': {'head': 's',
-                        'tail': 'n'},
-                 'TB': {'head': 'n',
-                        'tail': 's'},
-                 'LR': {'head': 'w',
-                        'tail': 'e'},
-                 'RL': {'head': 'e',
-                        'tail': 'w'}}
+    return ({name: get_size(name) for name in fixed},
+            {name: get_size(f'xlabel {i}') for i, name in enumerate(xlabels)})
 
-        print('Clustering spouses...')
+def segment_intersects_box(p, q, box):
+    """ Check if line segment from p to q intersects the bounding box
+        (x0, y0, x1, y1)
+    """
 
-        # Identify all married persons and put them in the same cluster.
-        # Not trivial if more than one of the persons maried multiple times
-        counter = 1
-        for family in self.root_child_elements:
+    if max(p[0], q[0]) < box[0] or min(p[0], q[0]) > box[2] or \
+       max(p[1], q[1]) < box[1] or min(p[1], q[1]) > box[3]:
+        return False
+
+    if box[0] <= p[0] <= box[2] and box[1] <= p[1] <= box[3]:
+        return True
+
+    corners = ((box[0], box[1]), (box[2], box[1]), (box[2], box[3]), (box[0], box[3]))
+
+    return any(segments_intersect(p, q, a, b)
+               for a, b in zip(corners, corners[1:] + corners[:1]))
+
+def check_labels(G, cell_size=144):
+    """ Validate labels of a laid out graph: find labels which overflow their
+        fixed size nodes, and nodes or xlabels which overlap other nodes,
+        xlabels or edges not connected to them. Bounding boxes of nodes,
+        xlabels and edge segments are indexed in a GridIndex, so only
+        elements close to each other are compared.
+    :param G: laid out graph
+    :param cell_size: edge length of grid cells (points)
+    :return: report as dictionary with the number of checked nodes, xlabels
+             and edges, a list of 'overflows' (node, label, node size and
+             size needed by the label) and a list of 'overlaps' (type 'node',
+             'xlabel' or 'edge', the two elements and the overlapping box).
+             Sizes and coordinates are in points.
+    """
 
-            if isinstance(family, FamilyElement):
+    print('Checking labels...')
+
+    route_edges(G)
+
+    label_sizes, xlabel_sizes = measure_labels(G)
+    tolerance = LABEL_OVERLAP_TOLERANCE
+
+    overflows = []
+    boxes = []
+    for node in G.nodes_iter():
+        name = str(node)
+        if 'invis' in (node.attr.get('style') or '') or not node.attr.get('pos'):
+            continue
+
+        x, y = (float(v) for v in node.attr['pos'].split(',')[:2])
+        width = float(node.attr['width']) * 72
+        height = float(node.attr['height']) * 72
+        boxes.append(('node', name, (x - width / 2, y - height / 2,
+                                     x + width / 2, y + height / 2)))
+
+        if name in label_sizes:
+            label_width, label_height = label_sizes[name]
+            if label_width > width + tolerance or label_height > height + tolerance:
+                overflows.append({'node': get_element_id(name),
+                                  'label': node.attr['label'],
+                                  'width': round(width, 2),
+                                  'height': round(height, 2),
+                                  'label_width': round(label_width, 2),
+                                  'label_height': round(label_height, 2)})
+
+        if name in xlabel_sizes and node.attr.get('xlp'):
+            x, y = (float(v) for v in node.attr['xlp'].split(',')[:2])
+            width, height = xlabel_sizes[name]
+            boxes.append(('xlabel', name, (x - width / 2, y - height / 2,
+                                           x + width / 2, y + height / 2)))
+
+    grid = GridIndex(cell_size)
+    for i, (_, _, box) in enumerate(boxes):
+        grid.insert(box, i)
+
+    overlaps = []
+
+    def add_overlap(kind, elements, box):
+        overlaps.append({'type': kind,
+                         'elements': elements,
+                         'box': [round(v, 2) for v in box]})
+
+    # nodes and xlabels overlapping each other
+    for i, (kind, name, box) in enumerate(boxes):
+        for j in sorted(grid.query(box)):
+            other_kind, other_name, other_box = boxes[j]
+
+            if j <= i or (name == other_name and kind != other_kind):
+                continue
+
+            if kind == 'node' and other_kind == 'node':
+                overlap_kind = 'node'
+            else:
+                overlap_kind = 'xlabel'
+
+            common = (max(box[0], other_box[0]), max(box[1], other_box[1]),
+                      min(box[2], other_box[2]), min(box[3], other_box[3]))
+
+            if common[2] - common[0] > tolerance and common[3] - common[1] > tolerance:
+                add_overlap(overlap_kind,
+                            [get_element_id(name) + (' xlabel' if kind == 'xlabel' else ''),
+                             get_element_id(other_name) + (' xlabel' if other_kind == 'xlabel' else '')],
+                            common)
+
+    # edges crossing nodes or xlabels they are not connected to
+    n_edges = 0
+    for edge in G.edges_iter():
+        n_edges += 1
+        tail, head = str(edge[0]), str(edge[1])
+        found = set()
+
+        for polyline in get_spline_points(edge.attr.get('pos') or ''):
+            for p, q in zip(polyline, polyline[1:]):
+                segment_box = (min(p[0], q[0]), min(p[1], q[1]),
+                               max(p[0], q[0]), max(p[1], q[1]))
+
+                for j in grid.query(segment_box):
+                    kind, name, box = boxes[j]
+                    if j in found or name in (tail, head):
+                        continue
+
+                    inner = (box[0] + tolerance, box[1] + tolerance,
+                             box[2] - tolerance, box[3] - tolerance)
+
+                    if inner[0] < inner[2] and inner[1] < inner[3] and \
+                       segment_intersects_box(p, q, inner):
+                        found.add(j)
+                        add_overlap('edge',
+                                    [f'{get_element_id(tail)} -- {get_element_id(head)}',
+                                     get_element_id(name) + (' xlabel' if kind == 'xlabel' else '')],
+                                    box)
+
+    report = {'version': LABEL_REPORT_VERSION,
+              'n_nodes': sum(kind == 'node' for kind, _, _ in boxes),
+              'n_xlabels': sum(kind == 'xlabel' for kind, _, _ in boxes),
+              'n_edges': n_edges,
+              'overflows': overflows,
+              'overlaps': overlaps}
+
+    print(f'{len(overflows)} labels overflow their nodes, '
+          f'{len(overlaps)} overlaps found.')
+
+    return report
+
+def get_output_filenames(args):
+    """ Names of the output files according to command line arguments
+    :param args: parsed command line arguments, see main
+    :return: list of filenames
+    """
 
-                parents = self.gedcom_parser.get_family_members(family,
-                                                           members_type='PARENTS')
+    if args.output_filename:
+        output_filenames = list(args.output_filename)
+    else:
+        output_filename = os.path.basename(args.gedcom_filename)
+        output_filename = output_filename.rsplit('.', 1)[0]
+        output_filenames = [output_filename + '.png']
 
-                if len(parents) < 1:
-                    continue
+    # each output is created in every format
+    if args.formats:
+        output_filenames = [output_filename.rsplit('.', 1)[0] + '.' + output_format
+                            for output_filename in output_filenames
+                            for output_format in args.formats]
 
-                person = parents[0]
-                person_id = person.get_pointer()
+    return list(dict.fromkeys(output_filenames))
 
-                if len(parents) > 1:
+def draw_output(G, output_filename):
+    """ Draw laid out graph, the format is determined by the file extension
+    :param G: laid out graph
+    :param output_filename: name of output file
+    """
 
-                    spouse = parents[1]
-                    spouse_id = spouse.get_pointer()
+    # for svg, use svg:cairo to get centered labels, see
+    # https://gitlab.com/graphviz/graphviz/-/issues/1426
+    if output_filename[-4:].upper() == '.SVG':
+        G.draw(output_filename, format='svg:cairo')
+        #G.draw(output_filename)
+    else:
+        G.draw(output_filename)
 
-                    # add edge for spouse
+def can_fork():
+    """ Check if processes can be forked, see run_forked
+    """
 
-                    sg_name = None
-                    if person_id in sub_graphs:
-                        sg_name = sub_graphs[person_id]
+    import multiprocessing
 
-                        # if spouse is already in another subgraph, we have to
-                        # merge subgraphs.
-                        if spouse_id in sub_graphs:
-                            spouse_sg_name = sub_graphs[spouse_id]
-                            for key, value in sub_graphs.items():
-                                if value == spouse_sg_name:
-                                    sub_graphs[key] = sg_name
+    return 'fork' in multiprocessing.get_all_start_methods()
 
+def run_forked(target, args_list, n_processes):
+    """ Call a function in forked processes. The processes share the memory
+        of this process at the time of the call, e.g. a laid out graph, so
+        nothing has to be pickled.
+    :param target: function to call
+    :param args_list: list of argument tuples, one process per tuple
+    :param n_processes: maximum number of concurrent processes
+    :return: list of booleans in order of args_list, True if the call
+             succeeded
+    """
 
-                    if spouse_id in sub_graphs:
-                        sg_name = sub_graphs[spouse_id]
+    import multiprocessing
+
+    context = multiprocessing.get_context('fork')
+    pending = list(enumerate(args_list))
+    running = []
+    succeeded = [False] * len(args_list)
+
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < n_processes:
+            i, args = pending.pop(0)
+            process = context.Process(target=target, args=args)
+            process.start()
+            running.append((i, process))
+
+        i, process = running.pop(0)
+        process.join()
+        succeeded[i] = process.exitcode == 0
+
+    return succeeded
+
+def draw_outputs(G, output_filenames, n_processes=None):
+    """ Draw laid out graph to several files. The layout is fixed, so the
+        files are drawn concurrently in forked processes, which share the
+        graph with this process. Where fork is not available, they are
+        drawn one after the other. Files with extension .dzi are drawn as
+        tiles, see write_tiles.
+    :param G: laid out graph
+    :param output_filenames: names of output files
+    :param n_processes: maximum number of processes, default is the number
+                        of CPUs
+    :return: list of created files
+    """
 
-                    if sg_name is None:
-                        sg_name = f'cluster_{counter}'
-                        counter += 1
-                    sub_graphs[spouse_id] = sg_name
-                    sub_graphs[person_id] = sg_name
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+
+    created = []
+
+    # tiles are drawn in parallel processes themselves
+    tiled = [f for f in output_filenames if f[-4:].upper() == '.DZI']
+    output_filenames = [f for f in output_filenames if f not in tiled]
+    profiler.count('draws', len(output_filenames))
+
+    if len(output_filenames) == 1 or n_processes == 1 or not can_fork():
+        for output_filename in output_filenames:
+            try:
+                draw_output(G, output_filename)
+            except (ValueError, OSError) as e:
+                print(f'Failed to create {output_filename}: {e}')
+                continue
+            print(f'Created {output_filename}')
+            created.append(output_filename)
+    else:
+        succeeded = run_forked(draw_output, [(G, f) for f in output_filenames],
+                               n_processes)
 
-        print('Creating edges between spouses...')
+        for output_filename, success in zip(output_filenames, succeeded):
+            if not success:
+                print(f'Failed to create {output_filename}.')
+                continue
 
-        pairs = {}
+            print(f'Created {output_filename}')
+            created.append(output_filename)
 
-        marriage_node_attributes = self.default_node_attributes.copy()
-        # TODO: would be nice if marriage nodes were more customizable.
-        #       Currently, they use same attributes as person labels, minus the
-        #       attributes in the line below
-        for key in ('label', 'xlabel', 'shape', 'width', 'height', 'margin',
-                    'fixedsize', 'style', 'fillcolor'):
-            if key in marriage_node_attributes.keys():
-                del marriage_node_attributes[key]
+    for output_filename in tiled:
+        if write_tiles(G, output_filename, n_processes):
+            print(f'Created {output_filename}')
+            created.append(output_filename)
 
-        for family in self.root_child_elements:
+    return created
 
-            if isinstance(family, FamilyElement):
+# edge length of tiles in pixels
+DZI_TILE_SIZE = 256
 
-                parents = self.gedcom_parser.get_family_members(family,
-                                                           members_type='PARENTS')
+def get_bounding_box(value, margin=0):
+    """ Bounding box of the points of a graphviz position attribute, see
+        translate_points
+    :param value: attribute value
+    :param margin: distance added on all sides (points)
+    :return: tuple (x0, y0, x1, y1)
+    """
 
-                if len(parents) < 2:
-                    continue
+    xs = []
+    ys = []
+    for point in value.replace(';', ' ').split():
+        if point[:2] in ('e,', 's,'):
+            point = point[2:]
+
+        coordinates = point.split(',')
+        for i in range(0, len(coordinates) - 1, 2):
+            xs.append(float(coordinates[i]))
+            ys.append(float(coordinates[i + 1].rstrip('!')))
+
+    return (min(xs) - margin, min(ys) - margin,
+            max(xs) + margin, max(ys) + margin)
+
+def render_tiles(G, tiles):
+    """ Draw tiles of a laid out graph. Runs in the forked processes of
+        write_tiles. Each tile is drawn from a subgraph containing only the
+        nodes and edges inside its bounds.
+    :param G: laid out graph
+    :param tiles: list of tuples (filename, viewport, node names, edges)
+    """
 
-                person = parents[0]
-                person_id = person.get_pointer()
+    for filename, viewport, nodes, edges in tiles:
+        tile = G.add_subgraph(name='dzi_tile')
+
+        for node in nodes:
+            tile.add_node(node)
+        for tail, head in edges:
+            tile.add_edge(tail, head)
+
+        # keep the coordinates of the graph and draw one point per pixel
+        tile.graph_attr.update(viewport=viewport, notranslate='true', dpi=72,
+                               label='')
+        tile.draw(filename, format='png', prog='nop2')
+
+        G.delete_subgraph('dzi_tile')
+
+def write_tiles(G, dzi_filename, n_processes=None, tile_size=DZI_TILE_SIZE):
+    """ Draw laid out graph as deep zoom image: a pyramid of tiles at all
+        zoom levels, which can be viewed with web viewers like OpenSeadragon
+        without loading the whole image. The tiles of level n are stored in
+        <name>_files/<n>/<column>_<row>.png, next to the .dzi descriptor.
+        Tiles are drawn in parallel processes.
+    :param G: laid out graph
+    :param dzi_filename: name of the .dzi descriptor
+    :param n_processes: number of processes, default is the number of CPUs
+    :param tile_size: edge length of tiles in pixels
+    :return: True if all tiles were created
+    """
 
-                spouse = parents[1]
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+
+    # route edges once, so they continue across tiles
+    route_edges(G)
+
+    nodes = [(str(node), get_bounding_box(node.attr['pos'],
+                                          max(float(node.attr.get('width') or 0),
+                                              float(node.attr.get('height') or 0)) * 36 + 2))
+             for node in G.nodes_iter()]
+    edges = [((str(edge[0]), str(edge[1])), get_bounding_box(edge.attr['pos'], 2))
+             for edge in G.edges_iter()]
+
+    # drawing the graph rewrites its bounding box separated by spaces
+    boxes = [box for _, box in nodes + edges]
+    if G.graph_attr.get('bb'):
+        boxes.append([float(v) for v in re.split('[, ]+', G.graph_attr['bb'].strip())])
+
+    x0 = min(box[0] for box in boxes)
+    y0 = min(box[1] for box in boxes)
+    x1 = max(box[2] for box in boxes)
+    y1 = max(box[3] for box in boxes)
+
+    scale = float(G.graph_attr.get('dpi') or 96) / 72
+
+    width = max(1, math.ceil((x1 - x0) * scale))
+    height = max(1, math.ceil((y1 - y0) * scale))
+    max_level = math.ceil(math.log2(max(width, height)))
+
+    tiles_dir = dzi_filename[:-4] + '_files'
+    tiles = []
+
+    for level in range(max_level + 1):
+        factor = 2 ** (max_level - level)
+        level_scale = scale / factor
+        level_width = math.ceil(width / factor)
+        level_height = math.ceil(height / factor)
+        n_columns = math.ceil(level_width / tile_size)
+        n_rows = math.ceil(level_height / tile_size)
+
+        # rows are counted from the top, graphviz coordinates from the bottom
+        contents = {}
+        for items, i in ((nodes, 0), (edges, 1)):
+            for item, (bx0, by0, bx1, by1) in items:
+                columns = range(max(0, int((bx0 - x0) * level_scale // tile_size)),
+                                min(n_columns, int((bx1 - x0) * level_scale // tile_size) + 1))
+                rows = range(max(0, int((y1 - by1) * level_scale // tile_size)),
+                             min(n_rows, int((y1 - by0) * level_scale // tile_size) + 1))
+                for column in columns:
+                    for row in rows:
+                        contents.setdefault((column, row), ([], []))[i].append(item)
+
+        level_dir = os.path.join(tiles_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+
+        for column in range(n_columns):
+            for row in range(n_rows):
+                w = min(tile_size, level_width - column * tile_size)
+                h = min(tile_size, level_height - row * tile_size)
+                cx = x0 + (column * tile_size + w / 2) / level_scale
+                cy = y1 - (row * tile_size + h / 2) / level_scale
+                tile_nodes, tile_edges = contents.get((column, row), ([], []))
+
+                tiles.append((os.path.join(level_dir, f'{column}_{row}.png'),
+                              f'{w},{h},{level_scale},{cx:.2f},{cy:.2f}',
+                              tile_nodes, tile_edges))
+
+    print(f'Drawing {len(tiles)} tiles in {max_level + 1} zoom levels...')
+    profiler.count('draws', len(tiles))
+
+    if n_processes == 1 or not can_fork():
+        render_tiles(G, tiles)
+    else:
+        # every process draws tiles of all levels, for similar workloads
+        succeeded = run_forked(render_tiles, [(G, tiles[i::n_processes])
+                                              for i in range(n_processes)],
+                               n_processes)
+        if not all(succeeded):
+            print(f'Failed to create tiles of {dzi_filename}.')
+            return False
+
+    with open(dzi_filename, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+                f'TileSize="{tile_size}" Overlap="0" Format="png">\n'
+                f'  <Size Width="{width}" Height="{height}"/>\n'
+                '</Image>\n')
+
+    return True
+
+def plot(args, node_attributes, graph_attributes, fillcolor,
+         metrics_cache=None, layout_cache=None, snapshot_cache=None,
+         person_table_cache=None, record_index_cache=None):
+    """ Plot gedcom file according to command line arguments
+    :param args: parsed command line arguments, see main
+    :param node_attributes: node attributes like shape, style, etc.
+    :param graph_attributes: dictionary with attributes passed to pgv.AGraph
+    :param fillcolor: dictionary with color values for Male, Female, Other
+    :param metrics_cache: MetricsCache or None
+    :param layout_cache: LayoutCache or None
+    :param snapshot_cache: SnapshotCache or None
+    :param person_table_cache: PersonTableCache or None
+    :param record_index_cache: RecordIndexCache or None
+    :return: names of created files or None if there was a problem
+    """
 
-                if family not in pairs:
-                    pairs[family] = True
-                    style = 'solid'
-                    marriage_label = ''
-                    divorced = False
-                    for c in family.get_child_elements():
+    profiler.reset()
+
+    stats = None
+    if args.profile_stats is not None:
+        import cProfile
+        stats = cProfile.Profile()
+        stats.enable()
+
+    with profiler.phase('init'):
+        g2g = GedcomPlotter(args.gedcom_filename, metrics_cache=metrics_cache,
+                            metrics_backend=args.metrics_backend,
+                            streaming=args.streaming,
+                            lazy=args.root is not None and not args.streaming,
+                            layout_cache=layout_cache,
+                            snapshot_cache=snapshot_cache,
+                            graph_backend=args.graph_backend,
+                            person_table_cache=person_table_cache,
+                            record_index_cache=record_index_cache)
+
+    created = render(g2g, args, node_attributes, graph_attributes, fillcolor)
+
+    if stats is not None:
+        stats.disable()
+        try:
+            stats.dump_stats(args.profile_stats)
+            print(f'Created {args.profile_stats}')
+        except OSError as e:
+            print(f'WARNING: Could not write profile statistics: {e}')
+
+    if args.profile is not None:
+        report = profiler.get_report()
+        if g2g.family_tree is not None:
+            report['stats'] = g2g.get_stats()
+
+        print_profile(report)
+
+        try:
+            with open(args.profile, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=1)
+            print(f'Created {args.profile}')
+        except OSError as e:
+            print(f'WARNING: Could not write profile: {e}')
+
+    return created
+
+def print_profile(report):
+    """ Print phases and counters of a profile, see Profiler.get_report
+    """
 
-                        # check if couple is divorced
-                        if c.get_tag() == 'DIV':
+    def format_rss(value):
+        return f'{value:9.1f}' if value is not None else f'{"-":>9s}'
+
+    print('Profile:')
+    print(f'    {"phase":36s} {"wall [s]":>9s} {"CPU [s]":>9s} {"RSS [MiB]":>9s}')
+    for phase in report['phases']:
+        print(f"    {phase['name']:36s} {phase['wall_time']:9.3f} "
+              f"{phase['cpu_time'] + phase['children_cpu_time']:9.3f} "
+              f"{format_rss(phase['peak_rss'])}")
+    print(f"    {'total':36s} {report['wall_time']:9.3f} "
+          f"{report['cpu_time'] + report['children_cpu_time']:9.3f} "
+          f"{format_rss(report['peak_rss'])}")
+
+    if len(report['counters']) > 0:
+        print('    ' + ', '.join(f'{key}={value}' for key, value in sorted(report['counters'].items())))
+
+def render(g2g, args, node_attributes, graph_attributes, fillcolor):
+    """ Create output file from an opened gedcom file according to command
+        line arguments
+    :param g2g: GedcomPlotter
+    :param args: parsed command line arguments, see main
+    :param node_attributes: node attributes like shape, style, etc.
+    :param graph_attributes: dictionary with attributes passed to pgv.AGraph
+    :param fillcolor: dictionary with color values for Male, Female, Other
+    :return: names of created files or None if there was a problem
+    """
 
-                            if c.get_value() == 'Y':
-                                marriage_label = '⚮'
-                                divorced = True
+    if args.root is not None:
+        with profiler.phase('select_subtree'):
+            if g2g.select_subtree(args.root, args.direction, args.generations) is None:
+                print('Failed to select persons.')
+                return None
 
-                            # not sure why, but sometimes the divorce value
-                            # is stored in extra child person
-                            for c2 in c.get_child_elements():
+    with profiler.phase('set_node_attributes'):
+        if g2g.set_node_attributes(node_attributes) is None:
+            print('Failed to set node attributes.')
+            return None
 
-                                if c2.get_tag() == 'TYPE':
-                                    if c2.get_value() == 'Y':
-                                        marriage_label = '⚮'
-                                        divorced = True
+    with profiler.phase('person_table'):
+        table = g2g.get_person_table(n_processes=args.processes)
+        profiler.annotate(persons=len(table))
 
-                                if c2.get_tag() == 'DATE':
-                                    year = c2.get_value().split()[-1]
-                                    if len(year) == 4 and year.isdigit():
-                                        marriage_label = f'<⚮<BR/><FONT POINT-SIZE="10.0">{year}</FONT>>'
+    with profiler.phase('create_graph'):
+        G = g2g.create_graph(fillcolor=fillcolor,
+                             graph_attributes=graph_attributes,
+                             layout_engine=args.layout,
+                             n_processes=args.processes,
+                             layout_timeout=args.layout_timeout,
+                             layout_memory_limit=args.layout_memory_limit,
+                             layout_fallback=None if args.layout_fallback == 'none' else args.layout_fallback,
+                             layout_progress=args.layout_progress)
 
-                            break
+    if G is None:
+        print('Failed to generate graph.')
+        return None
 
-                    # display divorced marriages as dashed lines.
-                    if divorced:
-                        style = 'dashed'
+    output_filenames = get_output_filenames(args)
 
-                    # only check for marriage record if there was no divorce
-                    else:
-                        for c in family.get_child_elements():
-                            # check if couple is married
-                            if c.get_tag() == 'MARR':
-                                marriage_label = '⚭'
-
-                                for c2 in c.get_child_elements():
-                                    if c2.get_tag() == 'DATE':
-                                        year = c2.get_value().split()[-1]
-                                        if len(year) == 4 and year.isdigit():
-                                            marriage_label = f'<⚭<BR/><FONT POINT-SIZE="10.0">{year}</FONT>>'
-
-                    # Couples are always connected by a "pair" node. Married
-                    # couples get a ⚭ symbol, divorced couples a ⚮ symbol
-                    # and all others a 'point'
-                    if marriage_label == '':
-                        graph.add_node(family, xlabel=marriage_label, shape='point',
-                                       fixedsize='true', width=0.1, height=0.1,
-                                       **marriage_node_attributes)
-                    else:
-                        graph.add_node(family, label=marriage_label,
-                                       shape='plaintext', width=0,
-                                       height=0, margin=0.01,
-                                       **marriage_node_attributes)
+    if args.edgepaint:
+        with profiler.phase('edgepaint'):
+            G = paint_edges(G, args.edgepaint)
 
+        if G is None:
+            print('Failed to paint edges.')
+            return None
 
-                    # peripheries='0' removes rectangles around subgraphs
-                    graph.add_subgraph((spouse, person, family),
-                                       peripheries='0', name=sub_graphs[person_id],
-                                       cluster='true', label='')
+    if args.label_report is not None or args.fail_on_label_problems:
+        with profiler.phase('check_labels'):
+            report = check_labels(G)
+
+        if args.label_report is not None:
+            try:
+                with open(args.label_report, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=1, ensure_ascii=False)
+                print(f'Created {args.label_report}')
+            except OSError as e:
+                print(f'WARNING: Could not write label report: {e}')
+
+        if args.fail_on_label_problems and \
+           (len(report['overflows']) > 0 or len(report['overlaps']) > 0):
+            print('Labels overflow or overlap, no outputs created.')
+            return None
 
-                    graph.add_edge(family, person,
-                                   headport=ports[direction]['head'],
-                                   style=style, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
-                                   penwidth=2)
-                    graph.add_edge(family, spouse,
-                                   headport=ports[direction]['head'],
-                                   style=style, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
-                                   penwidth=2)
+    print('Plotting output...')
 
-        print(f'Graph contains {len(graph.edges())} edges.')
+    with profiler.phase('draw'):
+        created = draw_outputs(G, output_filenames, args.processes)
+        profiler.annotate(outputs=len(created))
 
-        del sub_graphs
+    if len(created) < len(output_filenames):
+        print('Failed to create all outputs.')
+        return None
 
-        print('Creating edges to parents...')
-        # Add edges to parents
-        for person in self.root_child_elements:
-
-            if isinstance(person, IndividualElement):
-
-                families = self.gedcom_parser.get_families(person, family_type='FAMC')
-
-                # child can belong to more than one family if it was adopted:
-                for family in families:
-
-    #                # check if child is adopted:
-    #                # TODO: edge of child adopted by both parents could be
-    #                #       displayed dotted/dashed or with special symbol.
-    #                #       No idea how to display edge for child adopted by one
-    #                #       of the parents only though.
-    #                for c in person.get_child_elements():
-    #                    if c.get_tag() == 'FAMC':
-    #
-    #                        if c.get_value() != family.get_pointer():
-    #                            continue
-    #
-    #                        for c2 in c.get_child_elements():
-    #                            if c2.get_tag() == 'PEDI':
-    #                                if c2.get_value() == 'ADOPTED':
-    #                                    print(f'Adopted by {family.get_pointer()}')
-    #                                    # TODO: identify who adopted child, using
-    #                                    #       ADOP tag: BOTH|HUSB|WIFE
-
-                    if family in pairs:
-                        graph.add_edge(person, family,
-                                       headport=ports[direction]['head'],
-                                       tailport=ports[direction]['tail'],
-                                       splines=None, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
-                                       penwidth=2)
+    if args.debug:
+        print('Debug statistics:')
+        for name, stats in g2g.get_stats().items():
+            print(f'    {name}: ' + ', '.join(f'{key}={value}' for key, value in stats.items()))
+
+    return output_filenames
+
+# options which can be set per variant in batch manifests, see load_manifest
+BATCH_VARIANT_KEYS = ('name', 'output_filenames', 'node_attributes',
+                      'graph_attributes', 'fillcolor', 'edgepaint', 'root',
+                      'direction', 'generations', 'layout')
+
+def load_manifest(manifest_filename):
+    """ Read a batch manifest. The manifest is a JSON file like
+            {"files": ["trees/*.ged"],
+             "variants": [{"name": "tb", "output_filenames": ["out/{name}.svg",
+                                                              "out/{name}.pdf"]},
+                          {"name": "lr", "graph_attributes": {"rankdir": "LR"},
+                           "output_filenames": ["out/{name}_{variant}.png"]}],
+             "report": "out/report.json"}
+        Every file is plotted in every variant. Variants accept the keys in
+        BATCH_VARIANT_KEYS, which correspond to the command line options.
+        In output filenames, {name} is replaced with the name of the gedcom
+        file without extension, {variant} with the name of the variant.
+        Relative paths are relative to the directory of the manifest.
+    :param manifest_filename: name of JSON manifest
+    :return: tuple (gedcom filenames, variants, report filename or None),
+             or None if the manifest is invalid
+    """
 
-                    # if only one of the parents is known, the child is linked to
-                    # that directly, instead of the (non-existent) pair node
-                    else:
-                        parents = self.gedcom_parser.get_family_members(family,
-                                    members_type='PARENTS')
+    import glob
 
-                        for parent in parents:
-                            graph.add_edge(person, parent,
-                                           headport=ports[direction]['head'],
-                                           tailport=ports[direction]['tail'],
-                                           splines=None, color="%s:black:%s" % (graph_attributes['bgcolor'], graph_attributes['bgcolor']),
-                                           penwidth=2)
+    try:
+        with open(manifest_filename, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f'Cannot read manifest {manifest_filename}: {e}')
+        return None
 
+    base_dir = os.path.dirname(os.path.abspath(manifest_filename))
+
+    gedcom_filenames = []
+    for pattern in manifest.get('files', []):
+        matches = sorted(glob.glob(os.path.join(base_dir, pattern)))
+        if len(matches) < 1:
+            print(f'WARNING: No gedcom files match {pattern}.')
+        gedcom_filenames.extend(m for m in matches if m not in gedcom_filenames)
+
+    variants = manifest.get('variants') or [{}]
+    for i, variant in enumerate(variants):
+        invalid_keys = set(variant) - set(BATCH_VARIANT_KEYS)
+        if len(invalid_keys) > 0:
+            print(f'Invalid keys in variant {i + 1}: {", ".join(sorted(invalid_keys))}. '
+                  f'Must be one of: {", ".join(BATCH_VARIANT_KEYS)}')
+            return None
 
-        print(f'Graph contains {len(graph.edges())} edges.')
+    variants = [dict(variant) for variant in variants]
+    for i, variant in enumerate(variants):
+        variant.setdefault('name', str(i + 1))
+        if 'output_filenames' not in variant:
+            variant['output_filenames'] = ['{name}.png' if len(variants) == 1
+                                           else '{name}_{variant}.png']
+        variant['output_filenames'] = [os.path.join(base_dir, output_filename)
+                                       for output_filename in variant['output_filenames']]
+
+    report_filename = manifest.get('report')
+    if report_filename is not None:
+        report_filename = os.path.join(base_dir, report_filename)
+
+    return gedcom_filenames, variants, report_filename
+
+def plot_batch_file(gedcom_filename, variants, args, defaults):
+    """ Plot all variants of one gedcom file. Runs in the worker processes of
+        run_batch. The file is parsed once, glyph metrics are shared between
+        the variants in memory. The output of every job is captured, a
+        failing variant does not affect the others.
+    :param gedcom_filename: name of gedcom file
+    :param variants: list of variants, see load_manifest
+    :param args: parsed command line arguments, see main
+    :param defaults: tuple of node attributes, graph attributes and fill
+                     colors given on the command line
+    :return: list of dictionaries with the results of the variants
+    """
 
-        print('Creating layout...')
-        #graph.layout('dot', args='-v4')
-        graph.layout('dot')
+    import io
+    import argparse
+    import contextlib
+
+    name = os.path.basename(gedcom_filename).rsplit('.', 1)[0]
+
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            metrics_cache = MemoryCache(MetricsCache(args.metrics_cache_dir),
+                                        persistent=not args.no_metrics_cache)
+            layout_cache = None
+            if not args.no_layout_cache:
+                layout_cache = LayoutCache(args.layout_cache_dir)
+            person_table_cache = None
+            if not args.no_layout_cache and not args.no_person_table_cache:
+                person_table_cache = PersonTableCache(args.layout_cache_dir)
+
+            g2g = GedcomPlotter(gedcom_filename, metrics_cache=metrics_cache,
+                                metrics_backend=args.metrics_backend,
+                                streaming=args.streaming,
+                                layout_cache=layout_cache,
+                                graph_backend=args.graph_backend,
+                                person_table_cache=person_table_cache)
+            default_node_attributes = dict(g2g.default_node_attributes)
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    parse_time = time.perf_counter() - start
+
+    node_attributes, graph_attributes, fillcolor = defaults
+
+    results = []
+    for variant in variants:
+
+        result = {'gedcom_filename': gedcom_filename,
+                  'variant': variant['name'],
+                  'output_filenames': [output_filename.format(name=name, variant=variant['name'])
+                                       for output_filename in variant['output_filenames']],
+                  'parse_time': parse_time}
+
+        start = time.perf_counter()
+        if error is None:
+            log = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(log):
+                    # every variant starts from the complete tree and the
+                    # default node attributes
+                    if g2g.full_family_tree is not None:
+                        g2g.family_tree = g2g.full_family_tree
+                    g2g.default_node_attributes = dict(default_node_attributes)
+
+                    variant_args = argparse.Namespace(**vars(args))
+                    variant_args.gedcom_filename = gedcom_filename
+                    variant_args.output_filename = result['output_filenames']
+                    # the batch is already spread across all processes
+                    variant_args.processes = 1
+                    for key in ('edgepaint', 'root', 'direction', 'generations', 'layout'):
+                        if key in variant:
+                            setattr(variant_args, key, variant[key])
+
+                    variant_node_attributes = dict(node_attributes)
+                    variant_node_attributes.update(variant.get('node_attributes', {}))
+                    variant_graph_attributes = dict(graph_attributes)
+                    variant_graph_attributes.update(variant.get('graph_attributes', {}))
+                    variant_fillcolor = dict(fillcolor)
+                    variant_fillcolor.update(variant.get('fillcolor', {}))
+
+                    output_filenames = render(g2g, variant_args, variant_node_attributes,
+                                              variant_graph_attributes, variant_fillcolor)
+
+                if output_filenames is None:
+                    # the cause is printed before the final failure message
+                    lines = log.getvalue().strip().splitlines()
+                    result['error'] = ' '.join(lines[-2:]) if len(lines) > 0 else 'Failed.'
+            except Exception as e:
+                result['error'] = f'{type(e).__name__}: {e}'
+        else:
+            result['error'] = error
+
+        result['time'] = time.perf_counter() - start
+        result['status'] = 'failed' if 'error' in result else 'ok'
+        if 'error' in result:
+            result['log'] = log.getvalue()
+
+        results.append(result)
+
+    return results
+
+def run_batch(manifest_filename, args, node_attributes, graph_attributes, fillcolor):
+    """ Plot all files and variants of a batch manifest (see load_manifest)
+        in a pool of processes, one gedcom file per task, and print a summary
+    :param manifest_filename: name of JSON manifest
+    :param args: parsed command line arguments, see main
+    :param node_attributes: default node attributes of all variants
+    :param graph_attributes: default graph attributes of all variants
+    :param fillcolor: default fill colors of all variants
+    :return: list of dictionaries with the results of all jobs, or None if
+             the manifest is invalid
+    """
 
-        return graph
+    import concurrent.futures
 
-def run_edgepaint(G, color_scheme):
-    """ Run edgepaint on graph
-    :param G: input graph
-    :param color_scheme: graphviz color scheme to apply to edges
-    :return: graph with painted edges or None if there was a problem
-    """
+    manifest = load_manifest(manifest_filename)
 
-    import shutil
-    if shutil.which('edgepaint') is None:
-        print('WARNING: Cannot find edgepaint executable.')
+    if manifest is None:
         return None
 
-    print('Running edgepaint...')
-    import subprocess
-    import tempfile
+    gedcom_filenames, variants, report_filename = manifest
+    defaults = (node_attributes, graph_attributes, fillcolor)
+
+    n_processes = args.processes or os.cpu_count() or 1
+    n_processes = max(1, min(n_processes, len(gedcom_filenames)))
+
+    print(f'Plotting {len(gedcom_filenames)} files in {len(variants)} variants '
+          f'with {n_processes} processes...')
+
+    start = time.perf_counter()
+    results = {}
+
+    def failed(gedcom_filename, error):
+        return [{'gedcom_filename': gedcom_filename, 'variant': variant['name'],
+                 'output_filenames': [], 'parse_time': 0, 'time': 0,
+                 'status': 'failed', 'error': error} for variant in variants]
+
+    def report_progress(gedcom_filename):
+        n_ok = sum(result['status'] == 'ok' for result in results[gedcom_filename])
+        print(f'[{len(results)}/{len(gedcom_filenames)}] {gedcom_filename}: '
+              f'{n_ok} of {len(variants)} variants plotted')
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_processes) as executor:
+        futures = {executor.submit(plot_batch_file, gedcom_filename, variants,
+                                   args, defaults): gedcom_filename
+                   for gedcom_filename in gedcom_filenames}
+
+        for future in concurrent.futures.as_completed(futures):
+            gedcom_filename = futures[future]
+            try:
+                results[gedcom_filename] = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                continue
+            except Exception as e:
+                results[gedcom_filename] = failed(gedcom_filename, f'{type(e).__name__}: {e}')
+            report_progress(gedcom_filename)
+
+    # a crashed worker breaks the pool for all pending files. Plot them again
+    # one at a time, to find out which file caused the crash.
+    for gedcom_filename in gedcom_filenames:
+        if gedcom_filename in results:
+            continue
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                results[gedcom_filename] = executor.submit(plot_batch_file, gedcom_filename,
+                                                           variants, args, defaults).result()
+            except Exception as e:
+                results[gedcom_filename] = failed(gedcom_filename,
+                                                  f'Worker process crashed: {type(e).__name__}')
+        report_progress(gedcom_filename)
+
+    total_time = time.perf_counter() - start
+    jobs = [result for gedcom_filename in gedcom_filenames
+            for result in results[gedcom_filename]]
+
+    print()
+    print(f'{"file":30s} {"variant":12s} {"status":7s} {"parse [s]":>9s} {"plot [s]":>9s} output')
+    for job in jobs:
+        print(f'{os.path.basename(job["gedcom_filename"]):30s} {job["variant"]:12s} '
+              f'{job["status"]:7s} {job["parse_time"]:9.2f} {job["time"]:9.2f} '
+              f'{", ".join(job["output_filenames"]) if job["status"] == "ok" else job["error"]}')
+
+    n_ok = sum(job['status'] == 'ok' for job in jobs)
+    print(f'{n_ok} of {len(jobs)} jobs succeeded in {total_time:.1f} s.')
+
+    if report_filename is not None:
+        try:
+            with open(report_filename, 'w', encoding='utf-8') as f:
+                json.dump({'manifest': os.path.abspath(manifest_filename),
+                           'total_time': total_time,
+                           'jobs': jobs}, f, indent=1, ensure_ascii=False)
+            print(f'Created {report_filename}')
+        except OSError as e:
+            print(f'WARNING: Could not write batch report: {e}')
+
+    return jobs
+
+# interval in seconds in which watched files are checked for changes
+WATCH_INTERVAL = 0.5
+
+def wait_for_change(filename, interval=WATCH_INTERVAL):
+    """ Wait until size or modification time of a file changed and the file
+        was not modified for one more interval, so it is completely written
+    :param filename: name of watched file
+    :param interval: polling interval in seconds
+    """
 
-    tmpdir = tempfile.TemporaryDirectory()
-    dot_filename = os.path.join(tmpdir.name, 'tmp.dot')
+    def get_state():
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            # editors may replace the file while saving
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
 
-    G.draw(dot_filename)
-    edgepaint_ret = subprocess.run(['edgepaint',
-                                    '-share_endpoint',
-                                    '-color_scheme='+color_scheme,
-                                    dot_filename], capture_output=True)
+    state = get_state()
+    changed = None
 
-    if edgepaint_ret.returncode != 0:
-        print('edgepaint failed with error:')
-        print(edgepaint_ret.stderr.decode("utf-8"))
-        return None
+    while True:
+        time.sleep(interval)
+        new_state = get_state()
 
-    del dot_filename
-    del tmpdir
-    G.from_string(edgepaint_ret.stdout.decode("utf-8"))
+        if changed is not None and new_state == changed:
+            return
 
-    return G
+        if new_state is not None and new_state != state:
+            changed = new_state
+        else:
+            changed = None
 
 def main():
     """ gedcom_plotter command line program
@@ -790,21 +5669,123 @@ def main():
                                      graph_attributes), see the graphviz documentation for more \
                                      details.')
 
-    parser.add_argument('gedcom_filename',
+    parser.add_argument('gedcom_filename', nargs='?',
                         help='Input gedcom file.')
-    parser.add_argument('-o', '--output_filename',
-                        help='Output plot. See graphviz documentation for supported formats. If not specified, a PNG image is created.')
+    parser.add_argument('-o', '--output_filename', action='append', default=None,
+                        help='Output plot, can be given multiple times. See graphviz documentation for supported formats. Files with extension .dzi are drawn as deep zoom tiles for web viewers, for trees too large for a single image. All files are drawn from the same layout, in parallel processes (see -j). If not specified, a PNG image is created.')
+    parser.add_argument('--formats', nargs='+', default=None,
+                        help='Create each output in these formats, e.g. svg png pdf. The extensions of the output filenames are replaced.')
     parser.add_argument('-e', '--edgepaint', default=None,
-                        help='If set, overlapping edges are painted according to given color scheme, e.g. rgb, gray, lab, dark28, etc.')
+                        help='If set, edges crossing at small angles or overlapping are painted differently according to given color scheme: rgb, gray, lab, a brewer color scheme like dark28, or a comma separated list of hex colors.')
+    parser.add_argument('--label_report', default=None, metavar='FILENAME',
+                        help='Check the labels after layout and write a JSON report of labels overflowing their nodes and of nodes, xlabels and edges overlapping each other.')
+    parser.add_argument('--fail_on_label_problems', action='store_true',
+                        help='Check the labels after layout (see --label_report) and do not create outputs if labels overflow or overlap.')
     parser.add_argument('-n', '--node_attributes', nargs='*', default=[],
                         help='Node attributes, e.g. shape=ellipse style=rounded,filled fontname="Comic Sans MS"')
     parser.add_argument('-g', '--graph_attributes', nargs='*', default=[],
                         help='Graph attributes, e.g. rankdir=LR label="Family Tree" labelloc=t fontsize=100 fontname="Comic Sans MS"')
     parser.add_argument('-f', '--fillcolor', nargs='*', default=[],
                         help='Fill color for Male, Female, Other. Default: M=#bce0f0 F=#f8e3eb O=#fbfbcc')
+    parser.add_argument('--debug', action='store_true',
+                        help='Print debug statistics, e.g. number of record lookups.')
+    parser.add_argument('--profile', default=None, metavar='FILENAME',
+                        help='Write wall and CPU time, peak memory, graph sizes and the number of graphviz layouts of each phase of the run to a JSON file.')
+    parser.add_argument('--profile_stats', default=None, metavar='FILENAME',
+                        help='Profile the run with cProfile and write the statistics to a file, which can be read with python -m pstats.')
+    parser.add_argument('--metrics_cache_dir', default=None,
+                        help=f'Directory in which measured glyph metrics are cached between runs. Default: {get_default_cache_dir()}')
+    parser.add_argument('--no_metrics_cache', action='store_true',
+                        help='Do not use the glyph metrics cache, always measure all characters.')
+    parser.add_argument('--metrics_backend', choices=('dot', 'font'), default='dot',
+                        help='Determine text sizes by laying out probe nodes with dot (default), or by reading glyph metrics directly from the font file (faster, falls back to dot if the font or shape is not supported).')
+    parser.add_argument('--graph_backend', choices=GRAPH_BACKENDS, default='pygraphviz',
+                        help='Create the graph node by node with pygraphviz (default), or write it as dot source in one pass and let graphviz parse it (faster for large files, same plot).')
+    parser.add_argument('--show_metrics_cache', action='store_true',
+                        help='List the entries of the glyph metrics cache and exit.')
+    parser.add_argument('--clear_metrics_cache', action='store_true',
+                        help='Remove all entries from the glyph metrics cache and exit.')
+    parser.add_argument('--layout_cache_dir', default=None,
+                        help=f'Directory in which layouts are cached between runs. Plots which only differ in colors or output format reuse the cached layout. Default: {get_default_cache_dir()}')
+    parser.add_argument('--no_layout_cache', action='store_true',
+                        help='Do not use the layout cache, always lay out the graph. Also disables the person table cache.')
+    parser.add_argument('--clear_layout_cache', action='store_true',
+                        help='Remove all entries, snapshots and person tables from the layout cache and exit.')
+    parser.add_argument('--no_person_table_cache', action='store_true',
+                        help='Do not store the formatted labels of all people in the layout cache directory, always format them.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Store a snapshot of this run in the layout cache directory. When the same file is plotted again, only the labels of changed persons are recomputed, and the previous layout is reused from the layout cache if no relations or node sizes changed.')
+    parser.add_argument('-r', '--root', default=None,
+                        help='Only plot persons related to the person with this pointer, e.g. @I1@. Only the needed records are loaded from the file. The positions of the records in the file are stored in the layout cache directory and reused until the file changes. Use --clear_layout_cache to remove them.')
+    parser.add_argument('-d', '--direction', choices=SUBTREE_DIRECTIONS, default='both',
+                        help='Relatives of root person to plot: ancestors, descendants, both (ancestors and descendants, default) or relatives (everyone connected by parent, child or spouse relations).')
+    parser.add_argument('--generations', type=int, default=None,
+                        help='Maximum number of generations (for direction relatives: relations) between root person and plotted persons. Default: no limit.')
+    parser.add_argument('-l', '--layout', choices=LAYOUT_ENGINES, default='dot',
+                        help='Layout engine: dot lays out the whole family tree at once (default), partitioned lays out unrelated families in parallel processes and packs them into one plot (faster for large files with many unrelated families), banded lays out bands of generations independently and stitches them together (fastest for very large files, but with less compact plots).')
+    parser.add_argument('--layout_timeout', type=float, default=None, metavar='SECONDS',
+                        help='Run the dot layout in a child process and stop it after this many seconds. If it fails, the layout falls back to --layout_fallback.')
+    parser.add_argument('--layout_memory_limit', type=float, default=None, metavar='MIB',
+                        help='Run the dot layout in a child process whose memory is limited to this many MiB. If it fails, the layout falls back to --layout_fallback.')
+    parser.add_argument('--layout_fallback', choices=LAYOUT_FALLBACKS + ('none',), default='banded',
+                        help='Layout engine used if the dot layout in a child process fails or takes too long: banded (default), partitioned, or none to create no outputs.')
+    parser.add_argument('--layout_progress', action='store_true',
+                        help='Print the progress messages of the dot layout in a child process.')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='Number of processes used by the partitioned and banded layouts. Default: number of CPUs.')
+    parser.add_argument('--batch', default=None, metavar='MANIFEST',
+                        help='Plot all gedcom files and variants listed in a JSON manifest, see load_manifest. Each file is parsed once for all its variants, the files are spread across the processes given with -j. Node, graph and fill color options are used as defaults of all variants.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running, and plot again whenever the gedcom file changes. Glyph metrics, labels and the last layout are kept in memory, so only changed persons are updated.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Read the gedcom file line by line and keep only the data needed for the plot in memory. Reduces memory usage for large files.')
 
     args = parser.parse_args()
 
+    metrics_cache = MetricsCache(args.metrics_cache_dir)
+    layout_cache = LayoutCache(args.layout_cache_dir)
+    snapshot_cache = SnapshotCache(args.layout_cache_dir)
+    person_table_cache = PersonTableCache(args.layout_cache_dir)
+    record_index_cache = RecordIndexCache(args.layout_cache_dir)
+
+    if args.show_metrics_cache or args.clear_metrics_cache or args.clear_layout_cache:
+
+        if args.show_metrics_cache:
+            entries = metrics_cache.entries()
+            print(f'Metrics cache {metrics_cache.cache_dir} contains {len(entries)} entries.')
+            for entry in entries:
+                valid = '' if entry['valid'] else ' (outdated)'
+                print(f"{entry['key'][:16]}: {entry['n_chars']} characters, "
+                      f"{entry['size']} bytes, graphviz {entry['graphviz_version']}{valid}")
+                print(f"    {entry['node_attributes']}, time format: {entry['time_format']}")
+
+        if args.clear_metrics_cache:
+            n_removed = metrics_cache.clear()
+            print(f'Removed {n_removed} entries from metrics cache {metrics_cache.cache_dir}.')
+
+        if args.clear_layout_cache:
+            n_removed = layout_cache.clear() + snapshot_cache.clear() + \
+                        person_table_cache.clear() + record_index_cache.clear()
+            print(f'Removed {n_removed} entries from layout cache {layout_cache.cache_dir}.')
+
+        sys.exit(0)
+
+    if args.gedcom_filename is None and args.batch is None:
+        parser.error('the following arguments are required: gedcom_filename')
+
+    if args.no_metrics_cache:
+        metrics_cache = None
+
+    if args.no_layout_cache:
+        layout_cache = None
+
+    if not args.incremental:
+        snapshot_cache = None
+
+    # person tables are stored next to the layouts
+    if args.no_layout_cache or args.no_person_table_cache:
+        person_table_cache = None
+
     graph_attributes = {'bgcolor': '#ffffffff'}
     for arg in args.graph_attributes:
 
@@ -836,45 +5817,41 @@ def main():
 
         fillcolor[key[0]] = value
 
-    g2g = GedcomPlotter(args.gedcom_filename)
-
-    if g2g.set_node_attributes(node_attributes) is None:
-        print('Failed to set node attributes.')
-        sys.exit(1)
-
-    G = g2g.create_graph(fillcolor=fillcolor,
-                         graph_attributes=graph_attributes)
-
-    if G is None:
-        print('Failed to generate graph.')
-        sys.exit(1)
-
-    if args.output_filename:
-        output_filename = args.output_filename
-    else:
-        output_filename = os.path.basename(args.gedcom_filename)
-        output_filename = output_filename.rsplit('.', 1)[0]
-        output_filename = output_filename + '.png'
-
-    if args.edgepaint:
-        G = run_edgepaint(G, args.edgepaint)
-
-        if G is None:
-            print('Failed to paint edges.')
+    if args.batch is not None:
+        jobs = run_batch(args.batch, args, node_attributes, graph_attributes, fillcolor)
+        if jobs is None or any(job['status'] != 'ok' for job in jobs):
             sys.exit(1)
+        return
 
-
-    print('Plotting output...')
-
-    # for svg, use svg:cairo to get centered labels, see
-    # https://gitlab.com/graphviz/graphviz/-/issues/1426
-    if output_filename[-4:].upper() == '.SVG':
-        G.draw(output_filename, format='svg:cairo')
-        #G.draw(output_filename)
-    else:
-        G.draw(output_filename)
-
-    print(f'Created {output_filename}')
+    if not args.watch:
+        if plot(args, node_attributes, graph_attributes, fillcolor,
+                metrics_cache, layout_cache, snapshot_cache,
+                person_table_cache, record_index_cache) is None:
+            sys.exit(1)
+        return
+
+    # glyph metrics, the snapshot and the layout of the last plot stay in
+    # memory. The snapshot is only stored on disk in incremental mode, the
+    # layout unless the layout cache is disabled.
+    if metrics_cache is not None:
+        metrics_cache = MemoryCache(metrics_cache)
+    layout_cache = MemoryCache(LayoutCache(args.layout_cache_dir),
+                               persistent=layout_cache is not None)
+    snapshot_cache = MemoryCache(SnapshotCache(args.layout_cache_dir),
+                                 persistent=args.incremental)
+
+    try:
+        while True:
+            start = time.perf_counter()
+            if plot(args, node_attributes, graph_attributes, fillcolor,
+                    metrics_cache, layout_cache, snapshot_cache,
+                    person_table_cache, record_index_cache) is not None:
+                print(f'Plotted in {time.perf_counter() - start:.2f} s.')
+
+            print(f'Watching {args.gedcom_filename} for changes, press Ctrl+C to stop.')
+            wait_for_change(args.gedcom_filename)
+    except KeyboardInterrupt:
+        print()
 
 if __name__ == '__main__':
     main()
@@ -1,7 +1,10 @@
 import sys
 import os
 import unittest
+import unittest.mock
 import tempfile
+import json
+import pygraphviz as pgv
 import gedcom_plotter
 
 gedcom_sample = \
@@ -69,6 +72,80 @@ gedcom_sample = \
 2 PLAC Brownacre
 '''
 
+# three generations with a remarried person in the middle one
+gedcom_remarriage = \
+'''0 HEAD
+0 @I1@ INDI
+1 NAME Adam /Miller/
+1 SEX M
+1 FAMS @F1@
+0 @I2@ INDI
+1 NAME Beth /Stone/
+1 SEX F
+1 FAMS @F1@
+0 @I3@ INDI
+1 NAME Carl /Miller/
+1 SEX M
+1 FAMC @F1@
+1 FAMS @F2@
+1 FAMS @F3@
+0 @I4@ INDI
+1 NAME Dora /Field/
+1 SEX F
+1 FAMS @F2@
+0 @I5@ INDI
+1 NAME Emma /Hill/
+1 SEX F
+1 FAMS @F3@
+0 @I6@ INDI
+1 NAME Fred /Miller/
+1 SEX M
+1 FAMC @F1@
+0 @I7@ INDI
+1 NAME Gary /Miller/
+1 SEX M
+1 FAMC @F2@
+0 @I8@ INDI
+1 NAME Hank /Miller/
+1 SEX M
+1 FAMC @F3@
+0 @I9@ INDI
+1 NAME Iris /Miller/
+1 SEX F
+1 FAMC @F3@
+1 FAMS @F4@
+0 @I10@ INDI
+1 NAME Jack /Brook/
+1 SEX M
+1 FAMS @F4@
+0 @F1@ FAM
+1 HUSB @I1@
+1 WIFE @I2@
+1 CHIL @I3@
+1 CHIL @I6@
+1 MARR
+2 DATE 1520
+0 @F2@ FAM
+1 HUSB @I3@
+1 WIFE @I4@
+1 CHIL @I7@
+1 MARR
+2 DATE 1545
+0 @F3@ FAM
+1 HUSB @I3@
+1 WIFE @I5@
+1 CHIL @I8@
+1 CHIL @I9@
+1 MARR
+2 DATE 1555
+0 @F4@ FAM
+1 HUSB @I10@
+1 WIFE @I9@
+1 MARR
+2 DATE 1570
+0 TRLR
+'''
+
 class GedcomPlotterTests(unittest.TestCase):
 
     @classmethod
@@ -123,4 +200,856 @@ class GedcomPlotterTests(unittest.TestCase):
         joe_schmo = G.get_node('0 @I5@ INDI\n')
         self.assertEqual(G.edges((joe_schmo,))[0].attr.get('style'), 'solid')
 
+    def test_metrics_cache(self):
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = gedcom_plotter.MetricsCache(cache_dir)
+
+            g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name,
+                                               metrics_cache=cache)
+            ns = g2g.set_node_attributes()
+
+            entries = cache.entries()
+            self.assertEqual(len(entries), 1)
+            self.assertTrue(entries[0]['valid'])
+            self.assertEqual(entries[0]['n_chars'], len(ns.widths))
+
+            # second run has to load the same metrics from cache
+            ns_cached = g2g.set_node_attributes()
+            self.assertEqual(ns_cached.widths, ns.widths)
+            self.assertEqual(ns_cached.heights, ns.heights)
+            self.assertEqual(ns_cached.margins_y_with_time, ns.margins_y_with_time)
+
+            # fill colors do not change the node size, so the entry is reused
+            g2g.set_node_attributes({'fillcolor': 'red'})
+            self.assertEqual(len(cache.entries()), 1)
+
+            g2g.set_node_attributes({'fontsize': 20})
+            self.assertEqual(len(cache.entries()), 2)
+
+            self.assertEqual(cache.clear(), 2)
+            self.assertEqual(len(cache.entries()), 0)
+
+    def test_batched_metrics(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+
+        ns_single = gedcom_plotter.NodeSize(g2g.family_tree,
+                                            g2g.default_node_attributes,
+                                            g2g.time_format,
+                                            batch_size=None)
+        ns_batched = gedcom_plotter.NodeSize(g2g.family_tree,
+                                             g2g.default_node_attributes,
+                                             g2g.time_format,
+                                             batch_size=5)
+
+        self.assertEqual(ns_single.widths, ns_batched.widths)
+        self.assertEqual(ns_single.heights, ns_batched.heights)
+
+    def test_font_metrics(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+
+        for node_attributes in ({}, {'fontsize': 20}, {'shape': 'oval'}):
+            g2g.set_node_attributes(node_attributes)
+            ns_dot = g2g.ns
+
+            ns_font = gedcom_plotter.NodeSize(g2g.family_tree,
+                                              g2g.default_node_attributes,
+                                              g2g.time_format,
+                                              backend='font')
+            if ns_font.backend == 'dot':
+                self.skipTest('No font file found for font metrics.')
+
+            errors = gedcom_plotter.compare_metrics(ns_dot, ns_font)
+
+            # glyph advances are rounded to pixels, so allow an error of one
+            # pixel (at 96 dpi, scaled by sqrt(2) for ellipses)
+            self.assertEqual(errors['n_chars'], len(ns_dot.widths))
+            self.assertLess(errors['max_width_error'], 1.5 / 96)
+            self.assertLess(errors['max_height_error'], 1.5 / 96)
+            self.assertLess(abs(errors['time_height_error']), 1.5 / 96)
+
+    def test_limit_text_to_width(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        ns = g2g.set_node_attributes()
+
+        text = 'Jane Jayden Janie Johnny Doe'
+        limited = gedcom_plotter.limit_text_to_width(text, 1.2, ns)
+        self.assertLessEqual(ns.get_size(limited, False)[0], 1.2)
+        self.assertIn('\n', limited)
+        self.assertEqual(limited.replace('\n', ' '), text)
+
+        text = 'JaneJaydenJanieJohnnyDoe'
+        limited = gedcom_plotter.limit_text_to_width(text, 1.2, ns)
+        self.assertLessEqual(ns.get_size(limited, False)[0], 1.2)
+        self.assertTrue(limited.endswith('...'))
+        self.assertTrue(text.startswith(limited[:-3]))
+
+        self.assertEqual(gedcom_plotter.limit_text_to_width(text, 0.1, ns), '')
+
+        # repeated texts are taken from memo
+        hits = gedcom_plotter.fit_cache.hits
+        gedcom_plotter.limit_text_to_width(text, 1.2, ns)
+        self.assertEqual(gedcom_plotter.fit_cache.hits, hits + 1)
+
+    def test_element_index(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        index = g2g.element_index
+
+        jane = index.get('@I1@')
+        self.assertEqual(jane.get_name(), ('Jane', 'Smith'))
+        self.assertIsNone(index.get('@X1@'))
+
+        families = index.get_families(jane)
+        self.assertEqual([f.get_pointer() for f in families], ['@F1@', '@F2@'])
+
+        parents = index.get_family_members(families[0], members_type='PARENTS')
+        self.assertEqual([p.get_pointer() for p in parents], ['@I2@', '@I1@'])
+        children = index.get_family_members(families[0], members_type='CHIL')
+        self.assertEqual([p.get_pointer() for p in children], ['@I3@', '@I4@'])
+
+        self.assertTrue(gedcom_plotter.get_tooltip(jane, index).startswith('Jane Smith'))
+
+        stats = g2g.get_stats()['element_index']
+        self.assertEqual(stats['misses'], 1)
+        self.assertGreater(stats['lookups'], 6)
+
+    def test_cluster_spouses(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        sub_graphs = g2g.cluster_spouses()
+
+        # Jane married twice, so all three spouses are in one cluster
+        self.assertEqual(sorted(sub_graphs.keys()), ['@I1@', '@I2@', '@I5@'])
+        self.assertEqual(len(set(sub_graphs.values())), 1)
+
+        spouse_sets = gedcom_plotter.DisjointSet()
+        spouse_sets.union(1, 2)
+        spouse_sets.union(3, 4)
+        self.assertNotEqual(spouse_sets.find(1), spouse_sets.find(4))
+        spouse_sets.union(2, 3)
+        self.assertEqual(spouse_sets.find(1), spouse_sets.find(4))
+        self.assertEqual(len(spouse_sets), 4)
+
+    def test_family_tree(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        tree = g2g.family_tree
+
+        self.assertEqual(list(tree.persons.keys()),
+                         ['@I1@', '@I2@', '@I3@', '@I4@', '@I5@'])
+        self.assertEqual(list(tree.families.keys()), ['@F1@', '@F2@'])
+
+        jane = tree.persons['@I1@']
+        self.assertEqual(jane.get_name(), ('Jane', 'Smith'))
+        self.assertEqual(jane.gender, 'F')
+        self.assertEqual(jane.birth_year, 1950)
+        self.assertFalse(jane.deceased)
+        self.assertEqual(jane.families, ['@F1@', '@F2@'])
+        self.assertEqual(jane.node_name, '0 @I1@ INDI\n')
+
+        self.assertEqual(tree.persons['@I2@'].gender, '')
+        self.assertEqual(tree.persons['@I3@'].parent_families, ['@F1@'])
+
+        divorced = tree.families['@F1@']
+        self.assertEqual(divorced.parents, ['@I2@', '@I1@'])
+        self.assertEqual(divorced.children, ['@I3@', '@I4@'])
+        self.assertTrue(divorced.married)
+        self.assertTrue(divorced.divorced)
+        self.assertEqual(divorced.marriage_year, '1970')
+        self.assertEqual(divorced.divorce_year, '1980')
+
+        married = tree.families['@F2@']
+        self.assertFalse(married.divorced)
+        self.assertEqual(married.marriage_year, '1985')
+        self.assertIn('⚭', married.label)
+
+    def test_streaming(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        g2g_stream = gedcom_plotter.GedcomPlotter(self.gedcom_file.name,
+                                                  streaming=True)
+
+        self.assertIsNone(g2g_stream.root_child_elements)
+
+        def assert_equal_trees(tree, stream_tree):
+            self.assertEqual(list(tree.persons.keys()), list(stream_tree.persons.keys()))
+            for pointer, person in tree.persons.items():
+                stream_person = stream_tree.persons[pointer]
+                for attribute in gedcom_plotter.Person.__slots__:
+                    self.assertEqual(getattr(person, attribute),
+                                     getattr(stream_person, attribute))
+
+            for pointer, family in tree.families.items():
+                stream_family = stream_tree.families[pointer]
+                for attribute in gedcom_plotter.Family.__slots__:
+                    self.assertEqual(getattr(family, attribute),
+                                     getattr(stream_family, attribute))
+
+        assert_equal_trees(g2g.family_tree, g2g_stream.family_tree)
+
+        # a blank line within a record does not hide the following lines
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gedcom_filename = os.path.join(tmpdir, 'blank_line.ged')
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_sample.replace('1 NAME Jane /Smith/\n',
+                                              '1 NAME Jane /Smith/\n\n'))
+
+            tree = gedcom_plotter.GedcomPlotter(gedcom_filename).family_tree
+            stream_tree = gedcom_plotter.GedcomPlotter(gedcom_filename,
+                                                       streaming=True).family_tree
+
+        assert_equal_trees(tree, stream_tree)
+        self.assertEqual(stream_tree.persons['@I1@'].gender, 'F')
+        self.assertEqual(stream_tree.persons['@I1@'].families, ['@F1@', '@F2@'])
+
+        # skipped data like places is loaded on demand
+        jane = g2g_stream.element_index.get('@I1@')
+        self.assertEqual(gedcom_plotter.get_tooltip(jane, g2g_stream.element_index),
+                         gedcom_plotter.get_tooltip(g2g.element_index.get('@I1@'),
+                                                    g2g.element_index))
+        self.assertGreater(g2g_stream.element_index.get_stats()['loads'], 0)
+        self.assertIsNone(g2g_stream.element_index.get('@X1@'))
+
+    def test_record_index(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+
+            gedcom_filename = os.path.join(tmpdir, 'sample.ged')
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_sample)
+
+            cache = gedcom_plotter.RecordIndexCache(os.path.join(tmpdir, 'cache'))
+            g2g = gedcom_plotter.GedcomPlotter(gedcom_filename, lazy=True,
+                                               record_index_cache=cache)
+
+            # the index is stored in the cache, not next to the gedcom file
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['cache', 'sample.ged'])
+            self.assertEqual(len(cache.entries()), 1)
+            self.assertEqual(len(g2g.family_tree.persons), 0)
+            self.assertEqual(g2g.record_index.get_pointers('FAM'), ['@F1@', '@F2@'])
+
+            g2g.load_records(['@I3@', '@F1@'])
+            self.assertEqual(list(g2g.family_tree.persons.keys()), ['@I3@'])
+            self.assertEqual(g2g.family_tree.families['@F1@'].children, ['@I3@'])
+            self.assertEqual(g2g.family_tree.persons['@I3@'].get_name(), ('Janie', 'Doe'))
+
+            # links to records loaded later are kept
+            g2g.load_records(['@I4@'])
+            self.assertEqual(g2g.family_tree.families['@F1@'].children, ['@I3@', '@I4@'])
+            self.assertEqual(g2g.family_tree.persons['@I4@'].parent_families, ['@F1@'])
+
+            # cached index is reused until the gedcom file changes
+            index = gedcom_plotter.RecordIndex(gedcom_filename, cache=cache)
+            self.assertTrue(index.open())
+
+            with open(gedcom_filename, 'a') as f:
+                f.write('0 @I6@ INDI\n1 NAME New /Person/\n')
+
+            index = gedcom_plotter.RecordIndex(gedcom_filename, cache=cache)
+            self.assertFalse(index.open())
+            self.assertEqual(index.load_record('@I6@').get_name(), ('New', 'Person'))
+
+            # the entry of the file is replaced
+            self.assertEqual(len(cache.entries()), 1)
+            self.assertTrue(gedcom_plotter.RecordIndex(gedcom_filename, cache=cache).open())
+
+    def test_select_subtree(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        tree = g2g.family_tree
+
+        def select(root, direction, generations=None):
+            subtree = tree.get_subtree(root, direction, generations)
+            return sorted(subtree.persons.keys()), sorted(subtree.families.keys())
+
+        self.assertEqual(select('@I3@', 'ancestors'),
+                         (['@I1@', '@I2@', '@I3@'], ['@F1@']))
+        self.assertEqual(select('@I5@', 'descendants'),
+                         (['@I1@', '@I5@'], ['@F2@']))
+        self.assertEqual(select('@I1@', 'descendants', 1),
+                         (['@I1@', '@I2@', '@I3@', '@I4@', '@I5@'], ['@F1@', '@F2@']))
+        self.assertEqual(select('@I3@', 'relatives', 1),
+                         (['@I1@', '@I2@', '@I3@'], ['@F1@']))
+        self.assertEqual(select('@I3@', 'relatives', 2)[0],
+                         ['@I1@', '@I2@', '@I3@', '@I4@', '@I5@'])
+        self.assertIsNone(tree.get_subtree('@X1@'))
+
+        # links to unselected persons are removed in the copies only
+        subtree = tree.get_subtree('@I3@', 'ancestors')
+        self.assertEqual(subtree.families['@F1@'].children, ['@I3@'])
+        self.assertEqual(tree.families['@F1@'].children, ['@I3@', '@I4@'])
+
+        # lazy mode only loads the records which are needed
+        with tempfile.TemporaryDirectory() as cache_dir:
+            g2g = gedcom_plotter.GedcomPlotter(
+                self.gedcom_file.name, lazy=True,
+                record_index_cache=gedcom_plotter.RecordIndexCache(cache_dir))
+        subtree = g2g.select_subtree('@I2@', 'descendants', 1)
+        self.assertEqual(sorted(subtree.persons.keys()),
+                         ['@I1@', '@I2@', '@I3@', '@I4@'])
+        self.assertNotIn('@I5@', g2g.element_index.elements)
+
+        g2g.set_node_attributes()
+        graph = g2g.create_graph()
+        self.assertEqual(len(graph.nodes()), 5)
+
+    def test_partitioned_layout(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+
+            gedcom_filename = os.path.join(tmpdir, 'sample.ged')
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_sample + '0 @I6@ INDI\n1 NAME Solo /Person/\n')
+
+            g2g = gedcom_plotter.GedcomPlotter(gedcom_filename)
+
+            parts = g2g.family_tree.get_components()
+            self.assertEqual([sorted(part.persons.keys()) for part in parts],
+                             [['@I1@', '@I2@', '@I3@', '@I4@', '@I5@'], ['@I6@']])
+            self.assertEqual(sorted(parts[0].families.keys()), ['@F1@', '@F2@'])
+            self.assertEqual(len(g2g.family_tree.get_components(10)), 1)
+
+            g2g.set_node_attributes()
+            with unittest.mock.patch.object(gedcom_plotter, 'MIN_PERSONS_PER_PART', 1):
+                graph = g2g.create_graph(graph_attributes={'rankdir': 'BT'},
+                                         layout_engine='partitioned', n_processes=2)
+
+            self.assertTrue(graph.has_layout)
+            self.assertEqual(len(graph.nodes()), 8)
+            for node in graph.nodes():
+                self.assertNotEqual(node.attr['pos'], '')
+
+            # unrelated person is placed next to the family, on the first rank
+            bb = [float(v) for v in graph.graph_attr['bb'].split(',')]
+            x, y = [float(v) for v in graph.get_node('0 @I6@ INDI\n').attr['pos'].split(',')]
+            self.assertGreater(x, max(float(graph.get_node(n).attr['pos'].split(',')[0])
+                                      for n in graph.nodes() if n != '0 @I6@ INDI\n'))
+            self.assertLess(y, bb[3] / 2)
+
+            # the graph label is placed above the packed parts
+            with unittest.mock.patch.object(gedcom_plotter, 'MIN_PERSONS_PER_PART', 1):
+                graph = g2g.create_graph(graph_attributes={'label': 'Family Tree',
+                                                           'labelloc': 't'},
+                                         layout_engine='partitioned', n_processes=1)
+
+            bb = [float(v) for v in graph.graph_attr['bb'].split(',')]
+            x, y = [float(v) for v in graph.graph_attr['lp'].split(',')]
+            self.assertAlmostEqual(x, (bb[0] + bb[2]) / 2, places=1)
+            self.assertLess(y, bb[3])
+            self.assertGreater(y, max(float(node.attr['pos'].split(',')[1]) +
+                                      float(node.attr['height']) * 36
+                                      for node in graph.nodes_iter()))
+
+            svg = graph.draw(format='svg').decode('utf-8')
+            self.assertIn('Solo', svg)
+
+    def test_banded_layout(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+
+        self.assertEqual(g2g.family_tree.get_generations(),
+                         {'@I1@': 0, '@I2@': 0, '@I3@': 1, '@I4@': 1, '@I5@': 0})
+
+        g2g.set_node_attributes()
+        with unittest.mock.patch.object(gedcom_plotter, 'BAND_GENERATIONS', 1):
+            graph = g2g.create_graph(graph_attributes={'rankdir': 'BT'},
+                                     layout_engine='banded', n_processes=1)
+
+        self.assertTrue(graph.has_layout)
+
+        def get_position(pointer):
+            node = g2g.family_tree.persons[pointer].node_name
+            return [float(v) for v in graph.get_node(node).attr['pos'].split(',')]
+
+        # generations are on separate ranks, the children are placed below
+        # their parents
+        self.assertEqual(get_position('@I1@')[1], get_position('@I2@')[1])
+        self.assertEqual(get_position('@I3@')[1], get_position('@I4@')[1])
+        self.assertLess(get_position('@I3@')[1], get_position('@I1@')[1])
+        family_x = float(graph.get_node(g2g.family_tree.families['@F1@'].node_name)
+                         .attr['pos'].split(',')[0])
+        self.assertLess(abs((get_position('@I3@')[0] + get_position('@I4@')[0]) / 2
+                            - family_x), 1)
+
+        svg = graph.draw(format='svg').decode('utf-8')
+        self.assertIn('Janie', svg)
+
+    def test_banded_layout_overlaps(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gedcom_filename = os.path.join(tmpdir, 'remarriage.ged')
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_remarriage)
+
+            g2g = gedcom_plotter.GedcomPlotter(gedcom_filename)
+
+        self.assertEqual(max(g2g.family_tree.get_generations().values()), 2)
+        g2g.set_node_attributes()
+
+        # persons at the border of two bands do not overlap
+        with unittest.mock.patch.object(gedcom_plotter, 'BAND_GENERATIONS', 2):
+            for rankdir in ('TB', 'BT', 'LR'):
+                graph = g2g.create_graph(graph_attributes={'rankdir': rankdir},
+                                         layout_engine='banded', n_processes=1)
+                overlaps = gedcom_plotter.check_labels(graph)['overlaps']
+                self.assertEqual([o for o in overlaps if o['type'] == 'node'], [])
+
+    def test_layout_cache(self):
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = gedcom_plotter.LayoutCache(cache_dir)
+
+            g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name,
+                                               layout_cache=cache)
+            g2g.set_node_attributes()
+
+            graph_attributes = {'bgcolor': '#ffffffff'}
+            G = g2g.create_graph(graph_attributes=graph_attributes)
+
+            entries = cache.entries()
+            self.assertEqual(len(entries), 1)
+            self.assertTrue(entries[0]['valid'])
+            self.assertEqual(entries[0]['n_nodes'], len(G.nodes()))
+
+            # fill colors do not change the layout, so the entry is reused
+            with unittest.mock.patch.object(pgv.AGraph, 'layout') as layout:
+                G_cached = g2g.create_graph(fillcolor={'M': 'red', 'F': 'red', 'O': 'red'},
+                                            graph_attributes=graph_attributes)
+                layout.assert_not_called()
+
+            self.assertTrue(G_cached.has_layout)
+            self.assertEqual(len(cache.entries()), 1)
+            for node in G.nodes_iter():
+                self.assertEqual(G_cached.get_node(node).attr['pos'], node.attr['pos'])
+
+            g2g.create_graph(graph_attributes={'bgcolor': '#ffffffff', 'rankdir': 'LR'})
+            self.assertEqual(len(cache.entries()), 2)
+
+            # the least recently used layout is removed beyond max_entries
+            with unittest.mock.patch.object(gedcom_plotter.LayoutCache, 'max_entries', 2):
+                g2g.create_graph(graph_attributes={'bgcolor': '#ffffffff', 'rankdir': 'BT'})
+            self.assertEqual(len(cache.entries()), 2)
+            self.assertIsNone(cache.load(gedcom_plotter.LayoutCache.get_key(G)))
+
+            self.assertEqual(cache.clear(), 2)
+
+    def test_incremental(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gedcom_filename = os.path.join(tmpdir, 'sample.ged')
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_sample)
+
+            snapshot_cache = gedcom_plotter.SnapshotCache(tmpdir)
+            layout_cache = gedcom_plotter.LayoutCache(tmpdir)
+            graph_attributes = {'bgcolor': '#ffffffff'}
+
+            g2g = gedcom_plotter.GedcomPlotter(gedcom_filename,
+                                               layout_cache=layout_cache,
+                                               snapshot_cache=snapshot_cache)
+            g2g.set_node_attributes()
+            G = g2g.create_graph(graph_attributes=graph_attributes)
+            self.assertEqual(len(snapshot_cache.entries()), 1)
+
+            # the snapshot refers to the layout in the layout cache
+            self.assertNotIn('layout', snapshot_cache.load(snapshot_cache.get_key(gedcom_filename)))
+            self.assertEqual(len(layout_cache.entries()), 1)
+
+            # change a birth year, which only changes the label of one person
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_sample.replace('15 OCT 1977', '15 OCT 1978'))
+
+            g2g = gedcom_plotter.GedcomPlotter(gedcom_filename,
+                                               layout_cache=layout_cache,
+                                               snapshot_cache=snapshot_cache)
+            self.assertEqual(g2g.changed_records, {'@I4@'})
+
+            g2g.set_node_attributes()
+            self.assertEqual(len(g2g.labels), 4)
+            self.assertNotIn('@I4@', g2g.labels)
+
+            with unittest.mock.patch.object(pgv.AGraph, 'layout') as layout:
+                G_incremental = g2g.create_graph(graph_attributes=graph_attributes)
+                layout.assert_not_called()
+
+            self.assertIn('1978', G_incremental.get_node('0 @I4@ INDI\n').attr['label'])
+            for node in G.nodes_iter():
+                self.assertEqual(G_incremental.get_node(node).attr['pos'], node.attr['pos'])
+
+    def test_watch(self):
+
+        import threading
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = gedcom_plotter.MemoryCache(gedcom_plotter.SnapshotCache(tmpdir),
+                                               persistent=False)
+            cache.save('key', {'records': {}})
+            self.assertEqual(cache.load('key'), {'records': {}})
+            self.assertEqual(len(cache.entries()), 0)
+
+            gedcom_filename = os.path.join(tmpdir, 'sample.ged')
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_sample)
+
+            def edit():
+                with open(gedcom_filename, 'a') as f:
+                    f.write('0 TRLR\n')
+
+            timer = threading.Timer(0.05, edit)
+            timer.start()
+            gedcom_plotter.wait_for_change(gedcom_filename, interval=0.02)
+            timer.join()
+
+            with open(gedcom_filename) as f:
+                self.assertTrue(f.read().endswith('0 TRLR\n'))
+
+            # the watch loop plots again after an edit, reusing the metrics,
+            # labels and layout of the previous plot kept in memory
+            counters = []
+
+            def edit_and_wait(filename):
+                counters.append(dict(gedcom_plotter.profiler.counters))
+                if len(counters) > 1:
+                    raise KeyboardInterrupt
+                with open(gedcom_filename, 'w') as f:
+                    f.write(gedcom_sample.replace('15 OCT 1977', '15 OCT 1978'))
+
+            with open(gedcom_filename, 'w') as f:
+                f.write(gedcom_sample)
+
+            cache_dir = os.path.join(tmpdir, 'cache')
+            output_filename = os.path.join(tmpdir, 'plot.dot')
+            argv = ['gedcom_plotter', gedcom_filename, '-o', output_filename, '--watch',
+                    '-j', '1', '--metrics_cache_dir', cache_dir,
+                    '--layout_cache_dir', cache_dir]
+            with unittest.mock.patch.object(sys, 'argv', argv), \
+                 unittest.mock.patch.object(gedcom_plotter, 'wait_for_change',
+                                            side_effect=edit_and_wait):
+                gedcom_plotter.main()
+
+            self.assertEqual(counters[0]['formatted_labels'], 5)
+            self.assertGreater(counters[0]['dot_layouts'], 0)
+            self.assertEqual(counters[1]['formatted_labels'], 1)
+            self.assertEqual(counters[1].get('dot_layouts', 0), 0)
+            with open(output_filename) as f:
+                self.assertIn('1978', f.read())
+
+    def test_batch(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, 'sample.ged'), 'w') as f:
+                f.write(gedcom_sample)
+
+            manifest_filename = os.path.join(tmpdir, 'manifest.json')
+            with open(manifest_filename, 'w') as f:
+                f.write('''{"files": ["*.ged"],
+                            "variants": [{"name": "tb", "output_filenames": ["{name}_{variant}.svg"]},
+                                         {"name": "lr", "graph_attributes": {"rankdir": "LR"},
+                                          "output_filenames": ["{name}_{variant}.svg"]},
+                                         {"name": "invalid", "graph_attributes": {"rankdir": "XX"}}],
+                            "report": "report.json"}''')
+
+            argv = ['gedcom_plotter', '--batch', manifest_filename, '-j', '1',
+                    '--no_metrics_cache', '--no_layout_cache']
+            with unittest.mock.patch.object(sys, 'argv', argv):
+                with self.assertRaises(SystemExit) as cm:
+                    gedcom_plotter.main()
+            self.assertEqual(cm.exception.code, 1)
+
+            with open(os.path.join(tmpdir, 'report.json')) as f:
+                jobs = json.load(f)['jobs']
+
+            self.assertEqual([job['status'] for job in jobs], ['ok', 'ok', 'failed'])
+            self.assertIn('rankdir', jobs[2]['error'])
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, 'sample_tb.svg')))
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, 'sample_lr.svg')))
+
+    def test_output_formats(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_filename = os.path.join(tmpdir, 'plot.png')
+            argv = ['gedcom_plotter', self.gedcom_file.name, '-o', output_filename,
+                    '--formats', 'svg', 'pdf', 'dot', '-j', '2',
+                    '--no_metrics_cache', '--no_layout_cache']
+            with unittest.mock.patch.object(sys, 'argv', argv):
+                gedcom_plotter.main()
+
+            for extension in ('svg', 'pdf', 'dot'):
+                self.assertTrue(os.path.exists(os.path.join(tmpdir, 'plot.' + extension)))
+            self.assertFalse(os.path.exists(output_filename))
+
+            # all formats are drawn from the same layout
+            with open(os.path.join(tmpdir, 'plot.dot')) as f:
+                G = pgv.AGraph(f.read())
+            self.assertTrue(G.graph_attr['bb'])
+
+        # outputs given before the gedcom file
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_filenames = [os.path.join(tmpdir, 'plot.svg'),
+                                os.path.join(tmpdir, 'plot.dot')]
+            argv = ['gedcom_plotter', '-o', output_filenames[0], '-o', output_filenames[1],
+                    self.gedcom_file.name, '--no_metrics_cache', '--no_layout_cache']
+            with unittest.mock.patch.object(sys, 'argv', argv):
+                gedcom_plotter.main()
+
+            for output_filename in output_filenames:
+                self.assertTrue(os.path.exists(output_filename))
+
+    def test_tiles(self):
+
+        import math
+        import struct
+        import xml.etree.ElementTree
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        g2g.set_node_attributes()
+        G = g2g.create_graph(graph_attributes={'bgcolor': '#ffffffff'})
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dzi_filename = os.path.join(tmpdir, 'plot.dzi')
+            self.assertTrue(gedcom_plotter.write_tiles(G, dzi_filename, n_processes=2,
+                                                       tile_size=64))
+
+            size = xml.etree.ElementTree.parse(dzi_filename).getroot()[0]
+            width = int(size.get('Width'))
+            height = int(size.get('Height'))
+
+            max_level = math.ceil(math.log2(max(width, height)))
+            tiles_dir = os.path.join(tmpdir, 'plot_files')
+            self.assertEqual(len(os.listdir(tiles_dir)), max_level + 1)
+
+            tiles = os.listdir(os.path.join(tiles_dir, str(max_level)))
+            self.assertEqual(len(tiles), math.ceil(width / 64) * math.ceil(height / 64))
+
+            # tiles at the right and bottom border are cropped
+            with open(os.path.join(tiles_dir, str(max_level), '0_0.png'), 'rb') as f:
+                self.assertEqual(struct.unpack('>II', f.read(24)[16:24]), (64, 64))
+            with open(os.path.join(tiles_dir, '0', '0_0.png'), 'rb') as f:
+                self.assertEqual(struct.unpack('>II', f.read(24)[16:24]), (1, 1))
+
+    def test_paint_edges(self):
+
+        G = pgv.AGraph(strict=True, directed=False)
+        G.graph_attr['bgcolor'] = '#ffffffff'
+        G.edge_attr['color'] = '#ffffffff:black:#ffffffff'
+        # a and b cross at a small angle, c crosses both steeply, d shares
+        # a node with a
+        G.add_edge('a1', 'a2', pos='0,0 30,3 60,7 90,10')
+        G.add_edge('b1', 'b2', pos='0,10 30,7 60,3 90,0')
+        G.add_edge('c1', 'c2', pos='45,-50 45,0 45,50 45,100')
+        G.add_edge('a1', 'd2', pos='0,0 30,3 60,6 90,9')
+        for node in G.nodes_iter():
+            node.attr['pos'] = '0,0'
+        G.has_layout = True
+
+        edges = [(str(e[0]), str(e[1]), gedcom_plotter.get_spline_points(e.attr['pos']))
+                 for e in G.edges_iter()]
+        conflicts = gedcom_plotter.find_edge_conflicts(edges)
+        names = [e[0] + e[1] for e in edges]
+        self.assertEqual({names[j] for j in conflicts[names.index('a1a2')]}, {'b1b2'})
+        self.assertEqual({names[j] for j in conflicts[names.index('c1c2')]}, set())
+
+        self.assertIsNotNone(gedcom_plotter.paint_edges(G, 'lab'))
+        self.assertNotEqual(G.get_edge('a1', 'a2').attr['color'],
+                            G.get_edge('b1', 'b2').attr['color'])
+        # the border of the edges is kept
+        self.assertTrue(G.get_edge('a1', 'a2').attr['color'].startswith('#ffffffff:#'))
+
+        self.assertEqual(gedcom_plotter.get_palette('dark28', 2), [f'/dark28/{i}' for i in range(1, 9)])
+        self.assertEqual(gedcom_plotter.get_palette('set312', 2)[-1], '/set312/12')
+        self.assertEqual(gedcom_plotter.get_palette('paired12', 2)[-1], '/paired12/12')
+        self.assertEqual(gedcom_plotter.get_palette('spectral11', 2)[-1], '/spectral11/11')
+        self.assertIsNone(gedcom_plotter.get_palette('foo5', 2))
+        self.assertIsNone(gedcom_plotter.get_palette('dark29', 2))
+        self.assertEqual(len(set(gedcom_plotter.get_palette('rgb', 10))), 10)
+        self.assertEqual(gedcom_plotter.get_palette('gray', 2), ['#000000', '#808080'])
+        self.assertIsNone(gedcom_plotter.get_palette('#12345,#ffffff', 2))
+        self.assertIsNone(gedcom_plotter.paint_edges(G, 'nonsense'))
+
+    def test_check_labels(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        g2g.set_node_attributes()
+        G = g2g.create_graph(graph_attributes={'bgcolor': '#ffffffff'})
+
+        report = gedcom_plotter.check_labels(G)
+        self.assertEqual(report['n_nodes'], len(G.nodes()))
+        self.assertEqual(report['overflows'], [])
+        self.assertEqual(report['overlaps'], [])
+
+        G = pgv.AGraph(strict=True, directed=False)
+        G.node_attr.update(shape='box', fixedsize='true', width=1, height=0.5)
+        # a overlaps b, the edge from c to d crosses b, e overflows
+        G.add_node('0 @I1@ INDI\n', label='a', pos='0,0')
+        G.add_node('0 @I2@ INDI\n', label='b', pos='50,10')
+        G.add_node('0 @I3@ INDI\n', label='c', pos='50,-100')
+        G.add_node('0 @I4@ INDI\n', label='d', pos='50,100')
+        G.add_node('0 @I5@ INDI\n', label='<A very long label<BR/>with two lines>',
+                   pos='300,300')
+        G.add_edge('0 @I3@ INDI\n', '0 @I4@ INDI\n', pos='50,-82 50,-30 50,30 50,82')
+        G.has_layout = True
+
+        report = gedcom_plotter.check_labels(G)
+        self.assertEqual([o['node'] for o in report['overflows']], ['@I5@'])
+        self.assertEqual(report['overflows'][0]['width'], 72)
+        self.assertGreater(report['overflows'][0]['label_width'], 72)
+        self.assertEqual(sorted((o['type'], o['elements'][1]) for o in report['overlaps']),
+                         [('edge', '@I2@'), ('node', '@I2@')])
+        self.assertEqual(report['overlaps'][0]['box'], [14.0, -8.0, 36.0, 18.0])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_filename = os.path.join(tmpdir, 'plot.svg')
+            report_filename = os.path.join(tmpdir, 'labels.json')
+            argv = ['gedcom_plotter', self.gedcom_file.name, '-o', output_filename,
+                    '--label_report', report_filename, '--fail_on_label_problems',
+                    '-n', 'width=0.3', 'height=0.2',
+                    '--no_metrics_cache', '--no_layout_cache']
+            with unittest.mock.patch.object(sys, 'argv', argv):
+                with self.assertRaises(SystemExit):
+                    gedcom_plotter.main()
+
+            with open(report_filename) as f:
+                self.assertGreater(len(json.load(f)['overflows']), 0)
+            self.assertFalse(os.path.exists(output_filename))
+
+    def test_profile(self):
+
+        import pstats
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profile_filename = os.path.join(tmpdir, 'profile.json')
+            stats_filename = os.path.join(tmpdir, 'profile.pstats')
+            argv = ['gedcom_plotter', self.gedcom_file.name,
+                    '-o', os.path.join(tmpdir, 'plot.svg'), '-e', 'lab',
+                    '--profile', profile_filename, '--profile_stats', stats_filename,
+                    '--no_metrics_cache', '--no_layout_cache']
+            with unittest.mock.patch.object(sys, 'argv', argv):
+                gedcom_plotter.main()
+
+            with open(profile_filename) as f:
+                report = json.load(f)
+
+            phases = {phase['name']: phase for phase in report['phases']}
+            self.assertEqual(list(phases), ['init', 'init/parse', 'set_node_attributes',
+                                            'person_table', 'create_graph', 'create_graph/build_graph',
+                                            'create_graph/layout', 'edgepaint', 'draw'])
+            self.assertEqual(phases['create_graph/layout']['counters'], {'dot_layouts': 1})
+            self.assertEqual(phases['create_graph']['layout'], 'computed')
+            self.assertGreater(phases['create_graph/build_graph']['nodes'], 0)
+            self.assertEqual(report['counters']['draws'], 1)
+            self.assertGreaterEqual(report['wall_time'],
+                                    sum(phase['wall_time'] for phase in report['phases']
+                                        if '/' not in phase['name']))
+
+            self.assertIn('render', str(pstats.Stats(stats_filename).stats))
+
+    def test_graph_backend(self):
+
+        graphs = {}
+        for backend in gedcom_plotter.GRAPH_BACKENDS:
+            g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name, graph_backend=backend)
+            g2g.set_node_attributes()
+            graphs[backend] = g2g.create_graph(graph_attributes={'rankdir': 'LR'})
+
+        G, H = graphs['pygraphviz'], graphs['dot']
+        self.assertEqual(G.nodes(), H.nodes())
+        self.assertEqual(G.edges(), H.edges())
+        for node in G.nodes():
+            for key in ('label', 'xlabel', 'shape', 'fillcolor', 'width', 'pos'):
+                self.assertEqual(node.attr.get(key) or '',
+                                 H.get_node(node).attr.get(key) or '')
+        for edge in G.edges():
+            for key in ('style', 'color', 'headport', 'tailport', 'splines', 'pos'):
+                self.assertEqual(edge.attr.get(key) or '',
+                                 H.get_edge(*edge).attr.get(key) or '')
+        self.assertEqual([sorted(s.nodes()) for s in G.subgraphs()],
+                         [sorted(s.nodes()) for s in H.subgraphs()])
+
+        # only attributes differing from the defaults are written, HTML labels
+        # unquoted
+        graph = gedcom_plotter.DotGraph(node_attributes={'shape': 'box'})
+        graph.add_node('a "b"\n', label='<x<BR/>y>', shape='box')
+        graph.add_node('c', label='d')
+        self.assertIn('"a \\"b\\"\n" [label=<x<BR/>y>];', graph.string())
+        self.assertIn('"c" [label="d", shape=""];', graph.string())
+        G = graph.to_agraph()
+        self.assertEqual(G.get_node('a "b"\n').attr.get('shape'), 'box')
+
+    def test_layout_subprocess(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        g2g.set_node_attributes()
+
+        graph = g2g.create_graph()
+        isolated = g2g.create_graph(layout_timeout=60, layout_memory_limit=4096)
+
+        # the child process gets the same layout as dot in this process
+        self.assertTrue(isolated.has_layout)
+        self.assertEqual(graph.graph_attr['bb'], isolated.graph_attr['bb'])
+        for node in graph.nodes():
+            self.assertEqual(node.attr['pos'], isolated.get_node(node).attr['pos'])
+        for edge in graph.edges():
+            self.assertEqual(edge.attr['pos'], isolated.get_edge(*edge).attr['pos'])
+
+        # layouts which do not finish in time fall back to the banded layout
+        gedcom_plotter.profiler.reset()
+        with gedcom_plotter.profiler.phase('create_graph'):
+            fallback = g2g.create_graph(layout_timeout=0, n_processes=1)
+        self.assertTrue(fallback.has_layout)
+        phases = {phase['name']: phase for phase in gedcom_plotter.profiler.phases}
+        self.assertEqual(phases['create_graph/layout']['fallback'], 'banded')
+
+        self.assertIsNone(g2g.create_graph(layout_timeout=0, layout_fallback=None))
+
+    def test_person_table(self):
+
+        g2g = gedcom_plotter.GedcomPlotter(self.gedcom_file.name)
+        g2g.set_node_attributes()
+        table = g2g.get_person_table(n_processes=1)
+
+        self.assertEqual(table.pointers, ['@I1@', '@I2@', '@I3@', '@I4@', '@I5@'])
+        self.assertEqual(table.genders[:2], ['F', ''])
+        self.assertEqual(table.birth_years[0], 1950)
+        self.assertEqual(table.labels,
+                         [gedcom_plotter.format_name(g2g.family_tree.persons[pointer], 2, 1.15, g2g.ns)
+                          for pointer in table.pointers])
+        self.assertIs(g2g.get_person_table(), table)
+
+        # labels formatted in chunks by worker processes are the same
+        parallel = gedcom_plotter.PersonTable(g2g.family_tree.persons.values())
+        with unittest.mock.patch.object(gedcom_plotter, 'PERSON_TABLE_CHUNK_SIZE', 2):
+            self.assertEqual(parallel.format_labels(2, 1.15, g2g.ns, n_processes=2), 5)
+        self.assertEqual(parallel.labels, table.labels)
+
+        copy = gedcom_plotter.PersonTable.from_dict(json.loads(json.dumps(table.to_dict())))
+        self.assertEqual(copy.to_dict(), table.to_dict())
+        self.assertIsNone(gedcom_plotter.PersonTable.from_dict({'pointers': []}))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gedcom_filename = os.path.join(tmpdir, 'sample.ged')
+            cache = gedcom_plotter.PersonTableCache(os.path.join(tmpdir, 'cache'))
+
+            # after changing a birth year, only the label of that person is
+            # formatted, and the entry of the file is replaced
+            for sample, n_formatted in ((gedcom_sample, 5), (gedcom_sample, 0),
+                                        (gedcom_sample.replace('15 OCT 1977', '15 OCT 1978'), 1)):
+                with open(gedcom_filename, 'w') as f:
+                    f.write(sample)
+
+                g2g = gedcom_plotter.GedcomPlotter(gedcom_filename,
+                                                   person_table_cache=cache)
+                g2g.set_node_attributes()
+                gedcom_plotter.profiler.reset()
+                labels = g2g.get_person_table().labels
+                self.assertEqual(gedcom_plotter.profiler.counters['formatted_labels'],
+                                 n_formatted)
+                self.assertEqual(len(cache.entries()), 1)
+
+            self.assertEqual(labels[:3], table.labels[:3])
+            self.assertIn('1978', labels[3])
+
 # python -m unittest tests.test_gedcom_plotter